@@ -0,0 +1,101 @@
+"""Micro-benchmark of the encoding and decoding of list IDs.
+
+Compares building a TripleDES cipher for each ID (as done before IDs used
+AES), the cached cipher contexts of `encode_id()`/`decode_id()`, and the batch
+functions `encode_ids()`/`decode_ids()`.
+
+Usage: python benchmarks/bench_crypto.py [--count 10000] [--repeat 5]
+"""
+
+import argparse
+import base64
+from cryptography.hazmat.primitives.ciphers import Cipher, modes
+import struct
+import time
+
+from depreview import crypto
+
+
+SECRET = 'benchmark'
+
+
+def uncached_encode_id(num):
+    key, legacy_key = crypto.derive_keys(SECRET)
+    cipher = Cipher(crypto.TripleDES(legacy_key), modes.ECB())
+    block = cipher.encryptor().update(struct.pack('>Q', num))
+    return base64.urlsafe_b64encode(block).decode('ascii')[0:11]
+
+
+def uncached_decode_id(encoded):
+    key, legacy_key = crypto.derive_keys(SECRET)
+    cipher = Cipher(crypto.TripleDES(legacy_key), modes.ECB())
+    block = base64.urlsafe_b64decode(encoded + '=')
+    return struct.unpack('>Q', cipher.decryptor().update(block))[0]
+
+
+def measure(name, func, count, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    print("%-32s %8.2f ms  %6.2f us/id" % (
+        name, best * 1000, best * 1000000 / count,
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    nums = list(range(1, args.count + 1))
+    legacy_ids = [uncached_encode_id(num) for num in nums]
+    ids = crypto.encode_ids(nums, SECRET)
+    assert crypto.decode_ids(ids, SECRET) == nums
+    assert crypto.decode_ids(legacy_ids, SECRET) == nums
+
+    print("Encoding %d IDs:" % args.count)
+    measure(
+        "new cipher per ID (TripleDES)",
+        lambda: [uncached_encode_id(num) for num in nums],
+        args.count, args.repeat,
+    )
+    measure(
+        "encode_id()",
+        lambda: [crypto.encode_id(num, SECRET) for num in nums],
+        args.count, args.repeat,
+    )
+    measure(
+        "encode_ids()",
+        lambda: crypto.encode_ids(nums, SECRET),
+        args.count, args.repeat,
+    )
+
+    print("\nDecoding %d IDs:" % args.count)
+    measure(
+        "new cipher per ID (TripleDES)",
+        lambda: [uncached_decode_id(encoded) for encoded in legacy_ids],
+        args.count, args.repeat,
+    )
+    measure(
+        "decode_id()",
+        lambda: [crypto.decode_id(encoded, SECRET) for encoded in ids],
+        args.count, args.repeat,
+    )
+    measure(
+        "decode_ids()",
+        lambda: crypto.decode_ids(ids, SECRET),
+        args.count, args.repeat,
+    )
+    measure(
+        "decode_ids() legacy IDs",
+        lambda: crypto.decode_ids(legacy_ids, SECRET),
+        args.count, args.repeat,
+    )
+
+
+if __name__ == '__main__':
+    main()
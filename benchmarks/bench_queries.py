@@ -0,0 +1,300 @@
+"""Benchmark of the hot queries, showing their plans and timings.
+
+Fills a database with generated data (by default, over a million rows in
+each large table), then runs the queries the web app runs most often. They run first
+without the secondary indexes, then after creating them with
+`database.create_indexes()`.
+
+Usage: python benchmarks/bench_queries.py [--url sqlite:////tmp/bench.db]
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import sqlalchemy
+from sqlalchemy import and_, desc
+import tempfile
+import time
+
+from depreview import database
+
+
+REGISTRY = 'pypi'
+CHUNK_SIZE = 10000
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def populate(engine, args):
+    rand = random.Random(1)
+    now = datetime.utcnow()
+
+    def insert(table, rows):
+        count = 0
+        start = time.perf_counter()
+        for chunk in chunked(rows):
+            with engine.begin() as conn:
+                conn.execute(table.insert(), chunk)
+            count += len(chunk)
+        print(
+            "Inserted %d rows into %s in %.1fs" % (
+                count, table.name, time.perf_counter() - start,
+            ),
+        )
+
+    insert(database.users, (
+        dict(id=i, disabled=False, login='user%d' % i, name='User %d' % i)
+        for i in range(1, args.users + 1)
+    ))
+    insert(database.packages, (
+        dict(
+            registry=REGISTRY,
+            norm_name='package-%d' % i,
+            last_refresh=now - timedelta(seconds=rand.randrange(86400)),
+            orig_name='Package-%d' % i,
+            description='Package number %d' % i,
+            description_type='text/plain',
+        )
+        for i in range(args.packages)
+    ))
+    insert(database.package_versions, (
+        dict(
+            registry=REGISTRY,
+            norm_name='package-%d' % i,
+            version='1.%d' % v,
+            release_date=now - timedelta(days=30 * (args.versions - v)),
+            yanked=False,
+            rank=args.versions - 1 - v,
+            status='ok',
+        )
+        for i in range(args.packages)
+        for v in range(args.versions)
+    ))
+    insert(database.statements, (
+        dict(
+            id=i,
+            registry=REGISTRY,
+            norm_name='package-%d' % rand.randrange(args.packages),
+            user_id=rand.randrange(1, args.users + 1),
+            type='note',
+            proof='',
+            created=now - timedelta(seconds=rand.randrange(86400 * 365)),
+            trust=0,
+        )
+        for i in range(1, args.statements + 1)
+    ))
+    insert(database.dependency_lists, (
+        dict(
+            id=i,
+            created=now,
+            registry=REGISTRY,
+            format='poetry',
+        )
+        for i in range(1, args.lists + 1)
+    ))
+    insert(database.dependency_list_items, (
+        dict(
+            list_id=i,
+            norm_name=name,
+            version='==1.0',
+            direct=False,
+            depends_on='',
+        )
+        for i in range(1, args.lists + 1)
+        for name in sorted({
+            'package-%d' % rand.randrange(args.packages)
+            for _ in range(args.items)
+        })
+    ))
+
+
+def queries(args):
+    package = 'package-%d' % (args.packages // 2)
+    list_id = args.lists // 2
+    yield 'index: latest statements', (
+        sqlalchemy.select([
+            database.statements.c.created,
+            database.statements.c.type,
+            database.users.c.login,
+        ])
+        .select_from(
+            database.statements
+            .join(
+                database.users,
+                database.statements.c.user_id == database.users.c.id,
+            )
+        )
+        .order_by(desc(database.statements.c.created))
+        .limit(10)
+    )
+    yield 'package: statements', (
+        sqlalchemy.select([
+            database.statements.c.id,
+            database.statements.c.type,
+        ])
+        .where(
+            database.statements.c.registry == REGISTRY,
+            database.statements.c.norm_name == package,
+        )
+    )
+    yield 'package: versions', (
+        sqlalchemy.select([
+            database.package_versions.c.version,
+            database.package_versions.c.release_date,
+        ])
+        .where(
+            database.package_versions.c.registry == REGISTRY,
+            database.package_versions.c.norm_name == package,
+        )
+        .order_by(desc(database.package_versions.c.release_date))
+    )
+    yield 'list: items and packages', (
+        sqlalchemy.select([
+            database.dependency_list_items.c.norm_name,
+            database.packages.c.orig_name,
+        ])
+        .select_from(
+            database.dependency_lists
+            .join(
+                database.dependency_list_items,
+                database.dependency_lists.c.id
+                == database.dependency_list_items.c.list_id,
+            )
+            .outerjoin(
+                database.packages,
+                and_(
+                    database.dependency_list_items.c.norm_name
+                    == database.packages.c.norm_name,
+                    database.dependency_lists.c.registry
+                    == database.packages.c.registry,
+                ),
+            )
+        )
+        .where(database.dependency_lists.c.id == list_id)
+    )
+    yield 'list: versions', (
+        sqlalchemy.select([
+            database.package_versions.c.norm_name,
+            database.package_versions.c.version,
+            database.package_versions.c.status,
+            database.packages.c.annotations_expire,
+        ])
+        .select_from(
+            database.dependency_list_items
+            .join(
+                database.package_versions,
+                and_(
+                    database.package_versions.c.norm_name
+                    == database.dependency_list_items.c.norm_name,
+                    database.package_versions.c.registry == REGISTRY,
+                ),
+            )
+            .join(
+                database.packages,
+                and_(
+                    database.packages.c.norm_name
+                    == database.package_versions.c.norm_name,
+                    database.packages.c.registry
+                    == database.package_versions.c.registry,
+                ),
+            )
+        )
+        .where(database.dependency_list_items.c.list_id == list_id)
+        .order_by(
+            database.dependency_list_items.c.norm_name,
+            database.package_versions.c.rank,
+        )
+    )
+    yield 'refresher: stale packages', (
+        sqlalchemy.select([
+            database.packages.c.registry,
+            database.packages.c.norm_name,
+        ])
+        .where(
+            database.packages.c.last_refresh
+            < datetime.utcnow() - timedelta(hours=20),
+        )
+        .order_by(database.packages.c.last_refresh)
+        .limit(500)
+    )
+
+
+def explain(conn, query):
+    sql = str(query.compile(
+        dialect=conn.dialect,
+        compile_kwargs={'literal_binds': True},
+    ))
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + sql)
+        return '\n'.join('    ' + row[-1] for row in rows)
+    elif conn.dialect.name == 'postgresql':
+        rows = conn.execute('EXPLAIN ' + sql)
+        return '\n'.join('    ' + row[0] for row in rows)
+    else:
+        return '    (no plan for %s)' % conn.dialect.name
+
+
+def run_queries(engine, args):
+    for name, query in queries(args):
+        with engine.connect() as conn:
+            plan = explain(conn, query)
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                conn.execute(query).fetchall()
+                times.append(time.perf_counter() - start)
+        print("%-28s %8.2f ms" % (name, min(times) * 1000))
+        print(plan)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help="Database URL (default: temporary "
+                                      "SQLite file)")
+    parser.add_argument('--packages', type=int, default=100000)
+    parser.add_argument('--versions', type=int, default=10,
+                        help="Versions per package")
+    parser.add_argument('--statements', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--lists', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=200,
+                        help="Items per list")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.url is None:
+        tmp = tempfile.mkdtemp(prefix='depreview-bench-')
+        args.url = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+    engine = database.connect(args.url)
+
+    # Create the tables without the secondary indexes
+    database.metadata.create_all(engine)
+    for table in database.metadata.sorted_tables:
+        for index in table.indexes:
+            index.drop(bind=engine)
+    populate(engine, args)
+    database.analyze(engine)
+
+    print("\nWithout indexes:")
+    run_queries(engine, args)
+
+    start = time.perf_counter()
+    database.create_indexes(engine)
+    print("\nCreated indexes in %.1fs" % (time.perf_counter() - start))
+
+    print("\nWith indexes:")
+    run_queries(engine, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark of the startup time of the web app.
+
+Each run is a new Python process, which imports the web app, looks up the
+registries, then starts the app (running the startup hooks against a
+temporary SQLite database) and serves a first request. Also shows which heavy
+optional modules got imported along the way.
+
+Usage: python benchmarks/bench_startup.py [--repeat 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from depreview import database
+from depreview import migrations
+
+
+# Modules that are only needed for some requests
+LAZY_MODULES = ['bleach', 'docutils', 'markdown', 'pkg_resources']
+
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+times = {}
+
+import depreview.web
+times['import'] = time.perf_counter() - start
+
+from depreview.registries import get_all_registry_names, get_registry
+get_all_registry_names()
+get_registry('pypi')
+times['registries'] = time.perf_counter() - start
+
+imported = [name for name in %r if name in sys.modules]
+
+import asyncio
+
+async def serve():
+    async with depreview.web.app.test_app() as test_app:
+        times['startup'] = time.perf_counter() - start
+        response = await test_app.test_client().get('/')
+        assert response.status_code == 200
+        times['first request'] = time.perf_counter() - start
+
+asyncio.run(serve())
+print(json.dumps({'times': times, 'imported': imported}))
+''' % (LAZY_MODULES,)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        migrations.upgrade(database.connect(db_url))
+        env = dict(
+            os.environ,
+            DATABASE_URL=db_url,
+            SECRET_KEY='benchmark',
+            BACKGROUND_REFRESH='0',
+            JOB_WORKERS='0',
+        )
+
+        results = []
+        for _ in range(args.repeat):
+            output = subprocess.check_output(
+                [sys.executable, '-W', 'ignore', '-c', CHILD],
+                env=env,
+                stderr=subprocess.DEVNULL,
+            )
+            results.append(json.loads(output.decode('utf-8')))
+
+    print("Cumulative time since process start, over %d runs:" % args.repeat)
+    for stage in results[0]['times']:
+        times = [result['times'][stage] for result in results]
+        print("%-16s median %7.1f ms  min %7.1f ms" % (
+            stage,
+            statistics.median(times) * 1000,
+            min(times) * 1000,
+        ))
+    print("\nImported before startup: %s" % (
+        ', '.join(results[0]['imported']) or 'none of %s' % (
+            ', '.join(LAZY_MODULES)
+        ),
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from . import bulk_import
+from . import database
+from . import migrations
+from .registries import get_registry, get_all_registry_names
+
+
+def cmd_db_upgrade(args):
+    engine = database.connect(args.database)
+    try:
+        applied = migrations.upgrade(engine, args.version)
+    except migrations.MigrationError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    if applied:
+        for name in applied:
+            print("Applied %s" % name)
+    else:
+        print("Already up to date")
+
+
+def cmd_db_current(args):
+    engine = database.connect(args.database)
+    version = migrations.get_version(engine)
+    if version is None:
+        print("Database is empty")
+    else:
+        print("Version %d (latest %d)" % (version, len(migrations.MIGRATIONS)))
+
+
+def cmd_db_history(args):
+    engine = database.connect(args.database)
+    version = migrations.get_version(engine) or 0
+    for num, (name, func, transactional) in enumerate(
+        migrations.MIGRATIONS,
+        1,
+    ):
+        print("%s %d %s%s" % (
+            '*' if num <= version else ' ',
+            num,
+            name,
+            '' if transactional else ' (non-transactional)',
+        ))
+
+
+def cmd_db_stamp(args):
+    engine = database.connect(args.database)
+    try:
+        migrations.stamp(engine, args.version)
+    except migrations.MigrationError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+def cmd_db_check(args):
+    engine = database.connect(args.database)
+    problems = migrations.check(engine)
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+
+
+def cmd_import(args):
+    registry_obj = get_registry(args.registry)
+    engine = database.connect(args.database)
+    if migrations.get_version(engine) != len(migrations.MIGRATIONS):
+        print(
+            "Database schema is not up to date, run 'depreview db upgrade'",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    if args.state is None:
+        args.state = os.path.normpath(args.dump) + '.import-state'
+    if args.restart and os.path.exists(args.state):
+        os.remove(args.state)
+
+    try:
+        written, invalid = bulk_import.import_dump(
+            engine, registry_obj, args.dump,
+            batch_size=args.batch_size,
+            state_path=args.state,
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print("Imported %d packages, %d invalid documents" % (written, invalid))
+
+
+def cmd_worker(args):
+    # Registers the job handlers. Slow to import, and only needed for this
+    # command
+    from . import web
+
+    web.db = database.connect_async(
+        args.database,
+        max_workers=web.DATABASE_THREADS,
+    )
+
+    try:
+        asyncio.run(web.run_job_workers(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(prog='depreview')
+    parser.add_argument(
+        '--database',
+        default=os.environ.get('DATABASE_URL'),
+        help="Database URL (default: $DATABASE_URL)",
+    )
+    subparsers = parser.add_subparsers(title="commands", metavar='')
+
+    parser_db = subparsers.add_parser('db', help="Manage the database schema")
+    subparsers_db = parser_db.add_subparsers(title="commands", metavar='')
+
+    parser_upgrade = subparsers_db.add_parser(
+        'upgrade',
+        help="Create the tables or apply the missing migrations",
+    )
+    parser_upgrade.add_argument(
+        'version', nargs=argparse.OPTIONAL, type=int,
+        help="Version to upgrade to (default: latest)",
+    )
+    parser_upgrade.set_defaults(func=cmd_db_upgrade)
+
+    parser_current = subparsers_db.add_parser(
+        'current',
+        help="Show the current version of the schema",
+    )
+    parser_current.set_defaults(func=cmd_db_current)
+
+    parser_history = subparsers_db.add_parser(
+        'history',
+        help="List the migrations, marking those that have been applied",
+    )
+    parser_history.set_defaults(func=cmd_db_history)
+
+    parser_stamp = subparsers_db.add_parser(
+        'stamp',
+        help="Set the version of the schema without running migrations",
+    )
+    parser_stamp.add_argument('version', type=int)
+    parser_stamp.set_defaults(func=cmd_db_stamp)
+
+    parser_check = subparsers_db.add_parser(
+        'check',
+        help="Report the tables, columns and indexes missing from the database",
+    )
+    parser_check.set_defaults(func=cmd_db_check)
+
+    parser_import = subparsers.add_parser(
+        'import',
+        help="Import package metadata from a dump",
+        description="Import package metadata from a directory or archive of "
+                    "JSON documents from the registry's API, or a file with "
+                    "one such document per line (.jsonl, .jsonl.gz). Progress "
+                    "is saved so that an interrupted import can resume.",
+    )
+    parser_import.add_argument(
+        '--registry', choices=get_all_registry_names(), default='pypi',
+    )
+    parser_import.add_argument(
+        '--batch-size', type=int, default=bulk_import.BATCH_SIZE,
+        help="Number of packages to write per transaction",
+    )
+    parser_import.add_argument(
+        '--state',
+        help="File where progress is saved (default: DUMP.import-state)",
+    )
+    parser_import.add_argument(
+        '--restart', action='store_true',
+        help="Start from the beginning, ignoring saved progress",
+    )
+    parser_import.add_argument('dump')
+    parser_import.set_defaults(func=cmd_import)
+
+    parser_worker = subparsers.add_parser(
+        'worker',
+        help="Process background jobs, such as analyzing new lists",
+    )
+    parser_worker.add_argument(
+        '--workers', type=int, default=4,
+        help="Number of jobs to process at the same time",
+    )
+    parser_worker.set_defaults(func=cmd_worker)
+
+    args = parser.parse_args()
+    if getattr(args, 'func', None) is None:
+        parser.error("Missing command")
+    if not args.database:
+        parser.error("No database, set DATABASE_URL or use --database")
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
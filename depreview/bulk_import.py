@@ -0,0 +1,240 @@
+from datetime import datetime
+import functools
+import gzip
+import logging
+import os
+import sqlalchemy
+import tarfile
+import zipfile
+
+from . import database
+from .decision import compute_annotations
+
+
+logger = logging.getLogger(__name__)
+
+
+BATCH_SIZE = 500
+READ_SIZE = 65536
+
+
+def _read_chunks(fp):
+    return iter(functools.partial(fp.read, READ_SIZE), b'')
+
+
+def _is_jsonl(path):
+    for ext in ('.gz', ''):
+        if path.endswith('.jsonl' + ext) or path.endswith('.ndjson' + ext):
+            return True
+    return False
+
+
+def iter_documents(path, start=0):
+    """Iterate on the documents in a dump, skipping the first `start`.
+
+    `path` is a directory or a tar or zip archive of JSON files, or a file
+    with one JSON document per line (`.jsonl` or `.ndjson`, can be gzipped).
+
+    Yields `(position, name, date, chunks)` where position counts from 0 in a
+    stable order (for resuming), date is the modification time of the file,
+    and chunks is an iterable of bytes that should be consumed before getting
+    the next document.
+    """
+    if os.path.isdir(path):
+        filenames = []
+        for dirpath, dirnames, files in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(files):
+                if filename.endswith('.json'):
+                    filenames.append(os.path.join(dirpath, filename))
+        for position, filename in enumerate(filenames):
+            if position < start:
+                continue
+            date = datetime.utcfromtimestamp(os.stat(filename).st_mtime)
+            with open(filename, 'rb') as fp:
+                yield position, filename, date, _read_chunks(fp)
+    elif _is_jsonl(path):
+        date = datetime.utcfromtimestamp(os.stat(path).st_mtime)
+        if path.endswith('.gz'):
+            fp = gzip.open(path, 'rb')
+        else:
+            fp = open(path, 'rb')
+        with fp:
+            for position, line in enumerate(fp):
+                if position < start or not line.strip():
+                    continue
+                yield position, '%s:%d' % (path, position + 1), date, [line]
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir() and info.filename.endswith('.json')
+            ]
+            for position, info in enumerate(members):
+                if position < start:
+                    continue
+                with archive.open(info) as fp:
+                    yield (
+                        position, info.filename, datetime(*info.date_time),
+                        _read_chunks(fp),
+                    )
+    elif tarfile.is_tarfile(path):
+        # Streaming mode, members are read in order without seeking
+        with tarfile.open(path, 'r|*') as archive:
+            position = 0
+            for member in archive:
+                if not member.isfile() or not member.name.endswith('.json'):
+                    continue
+                if position >= start:
+                    yield (
+                        position, member.name,
+                        datetime.utcfromtimestamp(member.mtime),
+                        _read_chunks(archive.extractfile(member)),
+                    )
+                position += 1
+    else:
+        raise ValueError("Unknown dump format: %s" % path)
+
+
+def write_packages(conn, registry_obj, packages, now=None):
+    """Insert or update packages in bulk.
+
+    Packages for which the database already has more recent data are skipped.
+    Returns the number of packages written.
+    """
+    by_name = {
+        registry_obj.normalize_name(package.orig_name): package
+        for package in packages
+    }
+    if now is None:
+        now = datetime.utcnow()
+
+    existing = dict(conn.execute(
+        sqlalchemy.select([
+            database.packages.c.norm_name,
+            database.packages.c.last_refresh,
+        ])
+        .where(
+            database.packages.c.registry == registry_obj.NAME,
+            database.packages.c.norm_name.in_(list(by_name)),
+        )
+    ).fetchall())
+
+    package_rows = []
+    version_rows = []
+    for norm_name, package in by_name.items():
+        if (
+            norm_name in existing
+            and existing[norm_name] >= package.last_refresh
+        ):
+            continue
+        annotated, expires = compute_annotations(
+            registry_obj, package.versions, [], now,
+        )
+        package_rows.append(dict(
+            registry=registry_obj.NAME,
+            norm_name=norm_name,
+            last_refresh=package.last_refresh,
+            orig_name=package.orig_name,
+            author=package.author,
+            description=package.description,
+            description_type=package.description_type,
+            repository=package.repository,
+            etag=package.etag,
+            last_modified=package.last_modified,
+            serial=package.serial,
+            annotations_expire=expires,
+            next_refresh=None,
+        ))
+        for rank, version in enumerate(annotated):
+            version_rows.append(dict(
+                registry=registry_obj.NAME,
+                norm_name=norm_name,
+                version=version.version,
+                release_date=version.release_date,
+                yanked=bool(version.yanked),
+                rank=rank,
+                status=(
+                    version.status if version.status == 'ok'
+                    else version.status[0]
+                ),
+            ))
+
+    database.upsert(
+        conn,
+        database.packages,
+        package_rows,
+        [
+            'last_refresh', 'orig_name', 'author', 'description',
+            'description_type', 'repository', 'etag', 'last_modified',
+            'serial', 'annotations_expire', 'next_refresh',
+        ],
+    )
+    database.upsert(
+        conn,
+        database.package_versions,
+        version_rows,
+        ['release_date', 'yanked', 'rank', 'status'],
+    )
+    return len(package_rows)
+
+
+def import_dump(
+    engine, registry_obj, path, *,
+    batch_size=BATCH_SIZE, state_path=None,
+):
+    """Import package documents from a dump into the database.
+
+    Packages are written by batches. If `state_path` is given, the position
+    in the dump is recorded there after each batch, and the import resumes
+    from it; the file is removed once the import completes.
+
+    Returns the number of packages written, and the number of invalid
+    documents.
+    """
+    start = 0
+    if state_path is not None and os.path.exists(state_path):
+        with open(state_path) as fp:
+            start = int(fp.read().strip() or 0)
+        logger.info("Resuming import at document %d", start)
+
+    written = invalid = 0
+    batch = []
+    position = start
+
+    def flush():
+        nonlocal written
+
+        with engine.begin() as conn:
+            written += write_packages(conn, registry_obj, batch)
+        batch.clear()
+        if state_path is not None:
+            with open(state_path, 'w') as fp:
+                fp.write('%d\n' % position)
+        logger.info(
+            "Imported %d packages (%d documents read)",
+            written, position,
+        )
+
+    for doc_position, name, date, chunks in iter_documents(path, start):
+        position = doc_position + 1
+        parser = registry_obj.document_parser()
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+            package = parser.close(last_refresh=date)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Invalid document %s: %s", name, e)
+            invalid += 1
+            continue
+        batch.append(package)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    if state_path is not None and os.path.exists(state_path):
+        os.remove(state_path)
+    database.analyze(engine)
+
+    return written, invalid
@@ -1,9 +1,16 @@
 import base64
 import binascii
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+import functools
 import hashlib
 import os
 import struct
+import threading
+
+try:
+    from cryptography.hazmat.decrepit.ciphers.algorithms import TripleDES
+except ImportError:  # cryptography < 43
+    TripleDES = algorithms.TripleDES
 
 
 class InvalidId(ValueError):
@@ -11,39 +18,123 @@ class InvalidId(ValueError):
     """
 
 
-KEY = hashlib.sha256(os.environ['SECRET_KEY'].encode('utf-8')).digest()[:8]
+# IDs are encrypted with AES, a 16-byte block holding the number after 8 zero
+# bytes (which are checked when decoding). This gives 22 characters.
+# IDs from before that are 11 characters, a number encrypted with TripleDES
+# using a single 8-byte key, and can still be decoded.
+ID_LENGTH = 22
+LEGACY_ID_LENGTH = 11
 
+_id_block = struct.Struct('>QQ')
+_legacy_id_block = struct.Struct('>Q')
 
-def encode_id(num, key=None):
-    if key is None:
-        key = KEY
-    cipher = Cipher(algorithms.TripleDES(key), modes.ECB())
+# Cipher contexts, by thread and key
+_contexts = threading.local()
 
-    # To bytes
-    block = struct.pack('>Q', num)
-    # Encrypt
-    block = cipher.encryptor().update(block)
-    # Base64 encode
-    return base64.urlsafe_b64encode(block).decode('ascii')[0:11]
 
+@functools.lru_cache(maxsize=8)
+def derive_keys(secret=None):
+    """Get the AES and TripleDES keys from a secret, default $SECRET_KEY.
+    """
+    if secret is None:
+        secret = os.environ['SECRET_KEY']
+    secret = secret.encode('utf-8')
+    legacy_key = hashlib.sha256(secret).digest()[:8]
+    return (
+        hashlib.sha256(b'depreview-id\0' + secret).digest(),
+        # Same as single-key DES, in the form cryptography accepts
+        legacy_key * 3,
+    )
 
-def decode_id(encoded, key=None):
-    if key is None:
-        key = KEY
-    cipher = Cipher(algorithms.TripleDES(key), modes.ECB())
 
-    # Base64 decode
-    if len(encoded) != 11:
-        raise InvalidId
+def _context(algorithm, key, direction):
+    # ECB contexts keep no state between calls for whole blocks, so they can
+    # be reused. They can't be shared between threads though
     try:
-        block = base64.urlsafe_b64decode(encoded + '=')
+        cache = _contexts.cache
+    except AttributeError:
+        cache = _contexts.cache = {}
+    try:
+        return cache[(key, direction)]
+    except KeyError:
+        cipher = Cipher(algorithm(key), modes.ECB())
+        if direction == 'encrypt':
+            context = cipher.encryptor()
+        else:
+            context = cipher.decryptor()
+        cache[(key, direction)] = context
+        return context
+
+
+def _b64decode(encoded):
+    # Our input is padded, check that the padding is 0 by round-tripping
+    padded = encoded + '=' * (-len(encoded) % 4)
+    try:
+        data = base64.urlsafe_b64decode(padded)
     except binascii.Error:
         raise InvalidId
-    # Our input is padded, check that the padding is 0 by round-tripping
-    b64roundtrip = base64.urlsafe_b64encode(block).decode('ascii')
-    if b64roundtrip != encoded + '=':
+    if base64.urlsafe_b64encode(data).decode('ascii') != padded:
         raise InvalidId
-    # Decrypt
-    block = cipher.decryptor().update(block)
-    # To number
-    return struct.unpack('>Q', block)[0]
+    return data
+
+
+def encode_ids(nums, secret=None):
+    """Encode multiple numbers, using a single call to the cipher.
+    """
+    key, legacy_key = derive_keys(secret)
+    data = _context(algorithms.AES, key, 'encrypt').update(
+        b''.join(_id_block.pack(0, num) for num in nums)
+    )
+    return [
+        # 16 bytes are 24 characters, the last 2 being padding
+        base64.urlsafe_b64encode(data[i:i + 16]).decode('ascii')[:ID_LENGTH]
+        for i in range(0, len(data), 16)
+    ]
+
+
+def decode_ids(encoded_ids, secret=None):
+    """Decode multiple IDs, using a single call to the cipher for each format.
+
+    Raises InvalidId if any of them is invalid.
+    """
+    key, legacy_key = derive_keys(secret)
+    blocks = []
+    legacy_blocks = []
+    for encoded in encoded_ids:
+        if len(encoded) == ID_LENGTH:
+            blocks.append(_b64decode(encoded))
+        elif len(encoded) == LEGACY_ID_LENGTH:
+            legacy_blocks.append(_b64decode(encoded))
+        else:
+            raise InvalidId
+
+    nums = legacy_nums = iter(())
+    if blocks:
+        nums = _id_block.iter_unpack(
+            _context(algorithms.AES, key, 'decrypt').update(b''.join(blocks))
+        )
+    if legacy_blocks:
+        legacy_nums = _legacy_id_block.iter_unpack(
+            _context(TripleDES, legacy_key, 'decrypt').update(
+                b''.join(legacy_blocks),
+            )
+        )
+
+    result = []
+    for encoded in encoded_ids:
+        if len(encoded) == ID_LENGTH:
+            check, num = next(nums)
+            if check != 0:
+                raise InvalidId
+        else:
+            num, = next(legacy_nums)
+        result.append(num)
+    return result
+
+
+def encode_id(num, secret=None):
+    return encode_ids([num], secret)[0]
+
+
+def decode_id(encoded, secret=None):
+    return decode_ids([encoded], secret)[0]
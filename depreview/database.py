@@ -1,6 +1,14 @@
+import asyncio
+import concurrent.futures
+import functools
 import logging
 import sqlalchemy.event
-from sqlalchemy import MetaData, Table, engine_from_config
+import threading
+from sqlalchemy import MetaData, Table, and_, bindparam, engine_from_config
+from sqlalchemy.schema import Index
+import sqlalchemy.dialects.postgresql
+import sqlalchemy.dialects.sqlite
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.schema import Column, ForeignKey, ForeignKeyConstraint
 from sqlalchemy.types import Boolean, DateTime, Integer, String
 
@@ -27,7 +35,23 @@ packages = Table(
     Column('author', String, nullable=True),
     Column('description', String, nullable=True),
     Column('description_type', String, nullable=True),
+    # Cache of the rendered description, and hash of the description it was
+    # rendered from (see web.description_hash())
+    Column('description_html', String, nullable=True),
+    Column('description_hash', String, nullable=True),
     Column('repository', String, nullable=True),
+    # Validators from the registry's last response, for conditional requests
+    Column('etag', String, nullable=True),
+    Column('last_modified', String, nullable=True),
+    Column('serial', Integer, nullable=True),
+    # When the statuses in package_versions need to be computed again, NULL
+    # if only new versions would change them
+    Column('annotations_expire', DateTime, nullable=True),
+    # When the background refresher can try again after failing to refresh
+    # the package, NULL if the last refresh worked
+    Column('next_refresh', DateTime, nullable=True),
+    # For the background refresher
+    Index('ix_packages_last_refresh', 'last_refresh'),
 )
 
 package_versions = Table(
@@ -38,6 +62,11 @@ package_versions = Table(
     Column('version', String, primary_key=True),
     Column('release_date', DateTime, nullable=False),
     Column('yanked', Boolean, nullable=False),
+    # Precomputed from decision.compute_annotations(), NULL if not computed
+    # Position from the latest version (0) to the oldest
+    Column('rank', Integer, nullable=True),
+    # 'ok', 'yanked', 'outdated', or 'very-outdated'
+    Column('status', String, nullable=True),
     ForeignKeyConstraint(
         ['registry', 'norm_name'],
         ['packages.registry', 'packages.norm_name'],
@@ -68,6 +97,10 @@ statements = Table(
         ['registry', 'norm_name'],
         ['packages.registry', 'packages.norm_name'],
     ),
+    # For the latest changes on the index page
+    Index('ix_statements_created', 'created'),
+    # For the statements on a package's page
+    Index('ix_statements_registry_norm_name', 'registry', 'norm_name'),
 )
 
 reviews = Table(
@@ -89,6 +122,9 @@ dependency_lists = Table(
     Column('created', DateTime, nullable=False),
     Column('registry', String, nullable=False),
     Column('format', String, nullable=False),
+    # Hash of the normalized content, to reuse the list if uploaded again
+    Column('content_hash', String, nullable=True),
+    Index('ix_dependency_lists_content_hash', 'content_hash', unique=True),
 )
 
 dependency_list_items = Table(
@@ -101,6 +137,57 @@ dependency_list_items = Table(
     Column('depends_on', String, nullable=True),
 )
 
+# Background jobs, processed by the workers in jobs.py
+jobs = Table(
+    'jobs',
+    metadata,
+    Column('id', Integer, primary_key=True),
+    Column('type', String, nullable=False),
+    Column('list_id', Integer, ForeignKey('dependency_lists.id'), nullable=True),
+    # 'queued', 'running', 'done', or 'failed'
+    Column('status', String, nullable=False),
+    # Number of times a worker picked it up, used to claim it atomically
+    Column('attempts', Integer, nullable=False),
+    Column('created', DateTime, nullable=False),
+    Column('started', DateTime, nullable=True),
+    Column('finished', DateTime, nullable=True),
+    # Updated by the worker as it makes progress, to detect abandoned jobs
+    Column('heartbeat', DateTime, nullable=True),
+    Column('progress', Integer, nullable=False),
+    Column('total', Integer, nullable=True),
+    Column('error', String, nullable=True),
+    # For workers looking for jobs
+    Index('ix_jobs_status', 'status'),
+    # For the progress of a list
+    Index('ix_jobs_list_id', 'list_id'),
+)
+
+# Migrations that have been applied, see migrations.py
+schema_migrations = Table(
+    'schema_migrations',
+    metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied', DateTime, nullable=False),
+)
+
+
+def create_indexes(engine):
+    """Create the indexes that are missing from an existing database.
+    """
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    analyze(engine)
+
+
+def analyze(engine):
+    """Update the statistics used by the query planner.
+    """
+    if engine.dialect.name in ('sqlite', 'postgresql'):
+        with engine.begin() as conn:
+            conn.execute('ANALYZE')
+
 
 def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
@@ -108,6 +195,62 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor.close()
 
 
+def upsert(conn, table, rows, update_columns):
+    """Insert multiple rows, updating the existing ones.
+
+    Rows that conflict on the primary key get the columns in `update_columns`
+    overwritten. This is a single statement on PostgreSQL and SQLite.
+    """
+    if not rows:
+        return
+
+    if conn.dialect.name in ('postgresql', 'sqlite'):
+        if conn.dialect.name == 'postgresql':
+            stmt = sqlalchemy.dialects.postgresql.insert(table)
+        else:
+            stmt = sqlalchemy.dialects.sqlite.insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(table.primary_key.columns),
+            set_={col: stmt.excluded[col] for col in update_columns},
+        )
+        conn.execute(stmt, rows)
+        return
+
+    # Generic version: find which rows exist, then update those and insert
+    # the others
+    key_columns = [col.name for col in table.primary_key.columns]
+    existing = set()
+    for row in rows:
+        exists = conn.execute(
+            sqlalchemy.select([table.primary_key.columns[key_columns[0]]])
+            .where(and_(*[
+                table.c[col] == row[col]
+                for col in key_columns
+            ]))
+        ).first()
+        if exists:
+            existing.add(tuple(row[col] for col in key_columns))
+    to_update = []
+    to_insert = []
+    for row in rows:
+        if tuple(row[col] for col in key_columns) in existing:
+            to_update.append({'_' + k: v for k, v in row.items()})
+        else:
+            to_insert.append(row)
+    if to_update:
+        conn.execute(
+            table.update()
+            .where(and_(*[
+                table.c[col] == bindparam('_' + col)
+                for col in key_columns
+            ]))
+            .values({col: bindparam('_' + col) for col in update_columns}),
+            to_update,
+        )
+    if to_insert:
+        conn.execute(table.insert(), to_insert)
+
+
 def connect(db_url):
     """Connect to the database.
     """
@@ -120,6 +263,10 @@ def connect(db_url):
     logger.info("Connecting to SQL database %r", db_url)
     if db_url.startswith('sqlite:'):
         db_dict['connect_args'] = {'check_same_thread': False}
+        if db_url in ('sqlite://', 'sqlite:///:memory:'):
+            # An in-memory database only exists within its connection, share
+            # it between threads
+            db_dict['poolclass'] = StaticPool
     engine = engine_from_config(db_dict, prefix='')
     # logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
 
@@ -131,3 +278,108 @@ def connect(db_url):
         )
 
     return engine
+
+
+class AsyncEngine(object):
+    """Wrapper running database operations on a bounded thread pool.
+
+    The SQLAlchemy engine is synchronous, and using it from a coroutine would
+    block the event loop for the duration of the query. This runs the queries
+    on worker threads instead, so other requests can proceed meanwhile.
+    """
+
+    def __init__(self, engine, max_workers=None):
+        # `engine` can also be a function creating the engine, which is then
+        # only called when the database is first used
+        if callable(engine):
+            self._connect = engine
+            self._sync_engine = None
+        else:
+            self._connect = None
+            self._sync_engine = engine
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def sync_engine(self):
+        if self._sync_engine is None:
+            with self._lock:
+                if self._sync_engine is None:
+                    self._sync_engine = self._connect()
+        return self._sync_engine
+
+    def _get_executor(self):
+        if self._executor is not None:
+            return self._executor
+
+        max_workers = self._max_workers
+        if max_workers is None:
+            # Don't use more threads than connections in the pool
+            pool = self.sync_engine.pool
+            if hasattr(pool, 'size') and hasattr(pool, '_max_overflow'):
+                max_workers = pool.size() + max(pool._max_overflow, 0)
+            else:
+                max_workers = 5
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='database',
+        )
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking function on the database thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(),
+            functools.partial(func, *args, **kwargs),
+        )
+
+    async def execute(self, statement):
+        """Execute a statement, returning all the rows as a list.
+        """
+        def execute():
+            with self.sync_engine.connect() as conn:
+                result = conn.execute(statement)
+                if result.returns_rows:
+                    return result.fetchall()
+                return None
+
+        return await self.run(execute)
+
+    async def first(self, statement):
+        """Execute a statement, returning only the first row or None.
+        """
+        def first():
+            with self.sync_engine.connect() as conn:
+                return conn.execute(statement).first()
+
+        return await self.run(first)
+
+    async def transaction(self, func, *args, **kwargs):
+        """Call a function within a transaction, on the thread pool.
+
+        The function gets the connection as its first argument. The transaction
+        is committed if it returns, rolled back if it raises.
+        """
+        def transaction():
+            with self.sync_engine.begin() as trans:
+                return func(trans, *args, **kwargs)
+
+        return await self.run(transaction)
+
+
+def connect_async(db_url, max_workers=None):
+    """Connect to the database, for use from asyncio code.
+
+    The connection is only made when the database is first used. `db_url` can
+    be a function returning the URL, which is then also called at that time.
+    """
+    def connect_engine():
+        if callable(db_url):
+            return connect(db_url())
+        else:
+            return connect(db_url)
+
+    return AsyncEngine(connect_engine, max_workers)
@@ -13,6 +13,7 @@ class AnnotatedVersion(PackageVersion):
             version.version,
             release_date=version.release_date,
             yanked=version.yanked,
+            sort_key=version.sort_key,
         )
         self.status = 'ok'
 
@@ -46,34 +47,54 @@ def format_time(td):
         return _format_count(years, 'year')
 
 
-def annotate_versions(registry_obj, versions, statements):
+def _status(status, release_date, now):
+    if status == 'ok':
+        return 'ok'
+    elif status == 'yanked':
+        return 'yanked', 'yanked'
+    else:
+        time = format_time(now - release_date)
+        return status, f'{time} out of date'
+
+
+def compute_annotations(registry_obj, versions, statements, now=None):
+    """Annotate versions with whether they are outdated.
+
+    Returns the list of AnnotatedVersion, from latest to oldest, and the time
+    at which the result will change (or None if it won't unless the versions
+    do).
+    """
     versions = sorted(
         versions.values(),
-        key=lambda v: registry_obj.version_comparison_key(v.version),
+        key=registry_obj.version_sort_key,
         reverse=True,
     )
 
-    now = datetime.utcnow()
+    if now is None:
+        now = datetime.utcnow()
 
     annotated = []
+    expires = []
     next_version = None
     for version in versions:
         version = AnnotatedVersion(version)
 
         if version.yanked:
             # Yanked versions should not be used
-            version.status = 'yanked', 'yanked'
-        elif (
+            version.status = _status('yanked', version.release_date, now)
+        elif next_version is not None:
+            outdated_at = next_version.release_date + MIN_AGE
+            very_outdated_at = version.release_date + MAX_AGE
             # The next version has been out for a bit
-            next_version is not None
-            and next_version.release_date + MIN_AGE < now
-        ):
-            time = format_time(now - version.release_date)
-            msg = f'{time} out of date'
-            if version.release_date + MAX_AGE < now:
-                version.status = 'very-outdated', msg
+            if outdated_at < now:
+                if very_outdated_at < now:
+                    status = 'very-outdated'
+                else:
+                    status = 'outdated'
+                    expires.append(very_outdated_at)
+                version.status = _status(status, version.release_date, now)
             else:
-                version.status = 'outdated', msg
+                expires.append(outdated_at)
 
         annotated.append(version)
 
@@ -81,4 +102,26 @@ def annotate_versions(registry_obj, versions, statements):
         if not registry_obj.is_prerelease(version.version):
             next_version = version
 
+    return annotated, min(expires, default=None)
+
+
+def annotate_versions(registry_obj, versions, statements):
+    annotated, expires = compute_annotations(
+        registry_obj,
+        versions,
+        statements,
+    )
     return annotated
+
+
+def restore_annotation(version, status, now=None):
+    """Make an AnnotatedVersion from a status computed previously.
+
+    `status` is the first element of the status tuple (or 'ok'), as stored in
+    the database.
+    """
+    if now is None:
+        now = datetime.utcnow()
+    version = AnnotatedVersion(version)
+    version.status = _status(status, version.release_date, now)
+    return version
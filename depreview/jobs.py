@@ -0,0 +1,226 @@
+"""Queue of background jobs, stored in the database.
+
+Jobs are processed by workers in the web server processes, or by a separate
+`depreview worker` process. What a job does is up to the handler registered
+for its type with `handler()`.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import os
+import sqlalchemy
+from sqlalchemy import and_, desc
+
+from . import database
+
+
+logger = logging.getLogger(__name__)
+
+
+# How often idle workers look for new jobs, in seconds
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2'))
+# Running jobs that haven't reported progress for that long are considered
+# abandoned (e.g. the worker was killed) and get picked up again
+TIMEOUT = timedelta(minutes=15)
+MAX_ATTEMPTS = 3
+
+
+# Job type -> coroutine function
+_handlers = {}
+
+_workers = []
+# Set to wake up the workers of this process
+_wakeup = None
+
+
+def handler(job_type):
+    """Register the function running jobs of a type.
+
+    It is called with the list ID and a coroutine function
+    `set_progress(progress, total=None)`, which should be called regularly:
+    jobs that don't report progress for TIMEOUT are given to another worker.
+    """
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+
+    return decorator
+
+
+def enqueue_job(trans, job_type, list_id, total=None):
+    """Add a job to the queue, in a transaction.
+
+    Call wake_workers() once committed.
+    """
+    trans.execute(
+        database.jobs.insert()
+        .values(
+            type=job_type,
+            list_id=list_id,
+            status='queued',
+            attempts=0,
+            created=datetime.utcnow(),
+            progress=0,
+            total=total,
+        )
+    )
+
+
+def wake_workers():
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def get_list_job(db, list_id):
+    """Get the latest job for a list, as a dict, or None.
+    """
+    row = await db.first(
+        sqlalchemy.select([
+            database.jobs.c.status,
+            database.jobs.c.progress,
+            database.jobs.c.total,
+            database.jobs.c.error,
+        ])
+        .where(database.jobs.c.list_id == list_id)
+        .order_by(desc(database.jobs.c.id))
+        .limit(1)
+    )
+    if row is None:
+        return None
+    return dict(row._mapping)
+
+
+def _claim_job(trans):
+    # Find a job that is queued, or that got abandoned, and take it by
+    # updating it only if nobody else did (compare-and-swap on attempts)
+    now = datetime.utcnow()
+    candidates = trans.execute(
+        sqlalchemy.select([
+            database.jobs.c.id,
+            database.jobs.c.type,
+            database.jobs.c.list_id,
+            database.jobs.c.attempts,
+        ])
+        .where(sqlalchemy.or_(
+            database.jobs.c.status == 'queued',
+            and_(
+                database.jobs.c.status == 'running',
+                sqlalchemy.func.coalesce(
+                    database.jobs.c.heartbeat,
+                    database.jobs.c.started,
+                ) < now - TIMEOUT,
+            ),
+        ))
+        .order_by(database.jobs.c.id)
+        .limit(10)
+    ).fetchall()
+    for job_id, job_type, list_id, attempts in candidates:
+        if attempts >= MAX_ATTEMPTS:
+            values = dict(
+                status='failed',
+                finished=now,
+                error="Too many attempts",
+            )
+        else:
+            values = dict(status='running', started=now, heartbeat=now)
+        result = trans.execute(
+            database.jobs.update()
+            .values(attempts=attempts + 1, **values)
+            .where(
+                database.jobs.c.id == job_id,
+                database.jobs.c.attempts == attempts,
+            )
+        )
+        if result.rowcount == 1 and values['status'] == 'running':
+            return job_id, job_type, list_id
+    return None
+
+
+async def _update_job(db, job_id, **values):
+    await db.execute(
+        database.jobs.update()
+        .values(**values)
+        .where(database.jobs.c.id == job_id)
+    )
+
+
+async def run_job(db, job_id, job_type, list_id):
+    logger.info("Running job %d: %s %r", job_id, job_type, list_id)
+
+    async def set_progress(progress, total=None):
+        # Also shows that the job is still running
+        values = dict(progress=progress, heartbeat=datetime.utcnow())
+        if total is not None:
+            values['total'] = total
+        await _update_job(db, job_id, **values)
+
+    try:
+        try:
+            func = _handlers[job_type]
+        except KeyError:
+            raise ValueError("Unknown job type %r" % job_type)
+        await func(list_id, set_progress)
+    except asyncio.CancelledError:
+        # Shutting down, let another worker pick it up
+        await asyncio.shield(_update_job(db, job_id, status='queued'))
+        raise
+    except Exception as e:
+        logger.exception("Error running job %d", job_id)
+        await _update_job(
+            db,
+            job_id,
+            status='failed',
+            finished=datetime.utcnow(),
+            error=repr(e),
+        )
+    else:
+        await _update_job(
+            db, job_id, status='done', finished=datetime.utcnow(),
+        )
+
+
+async def job_worker(db):
+    """Process background jobs from the database, one at a time.
+    """
+    while True:
+        try:
+            job = await db.transaction(_claim_job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Error getting a job")
+            job = None
+
+        if job is not None:
+            await run_job(db, *job)
+            continue
+
+        # Wait for a new job
+        try:
+            await asyncio.wait_for(_wakeup.wait(), POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def start_workers(db, count):
+    """Start job workers on the running event loop.
+
+    Returns the tasks, which stop_workers() cancels.
+    """
+    global _wakeup
+
+    _wakeup = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for _ in range(count):
+        _workers.append(loop.create_task(job_worker(db)))
+    return list(_workers)
+
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    if _workers:
+        await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -0,0 +1,151 @@
+import codecs
+import json
+import re
+
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+# What can follow the part of a number decoded so far, if it got cut
+_number_tail = re.compile(r'[0-9.eE+\-]*')
+
+
+class ObjectStreamParser(object):
+    """Incremental parser for a JSON document that is an object.
+
+    Data is fed in chunks as it arrives, and the members of the object are
+    returned as soon as they are complete, as `(path, value)` pairs where path
+    is a tuple of keys. Only one member has to be held in memory at a time.
+
+    Members whose key is in `expand` must be objects, and their own members are
+    returned one by one instead (with a path of `(key, subkey)`).
+
+    Each value is decoded by the standard library's JSON decoder, only the
+    top-level structure is handled here.
+    """
+
+    def __init__(self, expand=()):
+        self.expand = frozenset(expand)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        # Don't try to parse again until the buffer reaches that size, so that
+        # large values don't get parsed over and over as they come in
+        self._retry_at = 0
+        self._path = ()
+        self._key = None
+        self._state = 'begin'
+
+    def feed(self, data):
+        """Parse more data, returning the list of completed members.
+        """
+        self._buffer += self._text_decoder.decode(data)
+        if len(self._buffer) < self._retry_at:
+            return []
+        return self._parse(final=False)
+
+    def close(self):
+        """Signal the end of the document, returning the remaining members.
+        """
+        self._buffer += self._text_decoder.decode(b'', final=True)
+        result = self._parse(final=True)
+        if self._state != 'end':
+            raise ValueError("Truncated JSON document")
+        return result
+
+    def _decode(self, final):
+        # Decode a value, returns None if we need more data
+        try:
+            value, end = self._json_decoder.raw_decode(
+                self._buffer,
+                self._pos,
+            )
+        except json.JSONDecodeError:
+            if final:
+                raise
+            self._retry_at = 2 * len(self._buffer) - self._pos
+            return None
+        if (
+            not final
+            and isinstance(value, (int, float))
+            and not isinstance(value, bool)
+            and _number_tail.match(self._buffer, end).end() == len(self._buffer)
+        ):
+            # Could be a number that continues in the next chunk, e.g. we got
+            # '12.' and the decoder stopped before the '.'
+            self._retry_at = len(self._buffer) + 1
+            return None
+        self._pos = end
+        return value,
+
+    def _end_object(self):
+        if self._path:
+            self._path = self._path[:-1]
+            self._state = 'comma'
+        else:
+            self._state = 'end'
+
+    def _parse(self, final):
+        result = []
+        buffer = self._buffer
+        while True:
+            self._pos = _whitespace.match(buffer, self._pos).end()
+            if self._pos >= len(buffer):
+                break
+            char = buffer[self._pos]
+
+            if self._state == 'begin':
+                if char != '{':
+                    raise ValueError("JSON document is not an object")
+                self._pos += 1
+                self._state = 'key_or_end'
+            elif self._state in ('key', 'key_or_end'):
+                if char == '}' and self._state == 'key_or_end':
+                    self._pos += 1
+                    self._end_object()
+                    continue
+                if char != '"':
+                    raise ValueError("Invalid JSON, expected key")
+                key = self._decode(final)
+                if key is None:
+                    break
+                self._key = key[0]
+                self._state = 'colon'
+            elif self._state == 'colon':
+                if char != ':':
+                    raise ValueError("Invalid JSON, expected ':'")
+                self._pos += 1
+                self._state = 'value'
+            elif self._state == 'value':
+                if not self._path and self._key in self.expand:
+                    if char != '{':
+                        raise ValueError(
+                            "Invalid JSON, expected object for %r" % self._key
+                        )
+                    self._pos += 1
+                    self._path = (self._key,)
+                    self._state = 'key_or_end'
+                    continue
+                value = self._decode(final)
+                if value is None:
+                    break
+                result.append((self._path + (self._key,), value[0]))
+                self._state = 'comma'
+            elif self._state == 'comma':
+                if char == ',':
+                    self._pos += 1
+                    self._state = 'key'
+                elif char == '}':
+                    self._pos += 1
+                    self._end_object()
+                else:
+                    raise ValueError("Invalid JSON, expected ',' or '}'")
+            elif self._state == 'end':
+                raise ValueError("Extra data after JSON document")
+
+        # Drop the data we're done with
+        if self._pos > 4096 and self._pos * 2 > len(buffer):
+            self._retry_at -= self._pos
+            self._buffer = buffer[self._pos:]
+            self._pos = 0
+
+        return result
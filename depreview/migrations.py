@@ -0,0 +1,267 @@
+from datetime import datetime
+import logging
+import re
+import sqlalchemy
+from sqlalchemy.schema import CreateIndex
+
+from . import database
+
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(Exception):
+    """The database can't be migrated.
+    """
+
+
+# List of (name, function, transactional)
+# The schema version is the number of migrations that have been applied
+MIGRATIONS = []
+
+
+def migration(transactional=True):
+    """Register a migration.
+
+    The function gets a connection, in a transaction unless `transactional`
+    is False (for example to create indexes concurrently on PostgreSQL). Those
+    non-transactional migrations should be safe to run again if interrupted,
+    which add_column() and create_index() are.
+    """
+    def decorator(func):
+        MIGRATIONS.append((func.__name__, func, transactional))
+        return func
+
+    return decorator
+
+
+def add_column(conn, column):
+    """Add a column to an existing table, if it doesn't exist.
+
+    Only nullable columns without defaults can be added this way, which
+    doesn't require rewriting the table.
+    """
+    assert column.nullable and column.server_default is None
+    table = column.table
+    existing = {
+        col['name']
+        for col in sqlalchemy.inspect(conn).get_columns(table.name)
+    }
+    if column.name in existing:
+        return
+    preparer = conn.dialect.identifier_preparer
+    conn.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+        preparer.format_table(table),
+        preparer.format_column(column),
+        column.type.compile(dialect=conn.dialect),
+    ))
+
+
+_create_index = re.compile(r'^CREATE (?:UNIQUE )?INDEX')
+
+
+def _invalid_indexes(conn):
+    # Creating an index concurrently on PostgreSQL leaves it behind if that
+    # fails (or gets interrupted), marked invalid
+    if conn.dialect.name != 'postgresql':
+        return set()
+    rows = conn.execute(
+        'SELECT c.relname FROM pg_index i'
+        ' JOIN pg_class c ON c.oid = i.indexrelid'
+        ' WHERE NOT i.indisvalid AND pg_table_is_visible(c.oid)'
+    )
+    return {name for name, in rows}
+
+
+def create_index(conn, index):
+    """Create an index if it doesn't exist.
+
+    On PostgreSQL, the index is created concurrently, without locking the table
+    against writes. This requires the connection to be in autocommit mode. An
+    invalid index left by an interrupted attempt is dropped first, it would be
+    skipped otherwise.
+    """
+    sql = str(CreateIndex(index, if_not_exists=True).compile(
+        dialect=conn.dialect,
+    ))
+    if conn.dialect.name == 'postgresql':
+        if index.name in _invalid_indexes(conn):
+            logger.warning("Dropping invalid index %s", index.name)
+            conn.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % (
+                conn.dialect.identifier_preparer.quote(index.name),
+            ))
+        sql, n = _create_index.subn(r'\g<0> CONCURRENTLY', sql)
+        assert n == 1
+    conn.execute(sql)
+
+
+@migration()
+def add_description_cache(conn):
+    add_column(conn, database.packages.c.description_html)
+    add_column(conn, database.packages.c.description_hash)
+
+
+@migration()
+def add_conditional_request_validators(conn):
+    add_column(conn, database.packages.c.etag)
+    add_column(conn, database.packages.c.last_modified)
+    add_column(conn, database.packages.c.serial)
+
+
+@migration()
+def add_precomputed_annotations(conn):
+    add_column(conn, database.packages.c.annotations_expire)
+    add_column(conn, database.package_versions.c.rank)
+    add_column(conn, database.package_versions.c.status)
+
+
+@migration(transactional=False)
+def add_query_indexes(conn):
+    for indexes in [
+        database.packages.indexes,
+        database.statements.indexes,
+    ]:
+        for idx in sorted(indexes, key=lambda i: i.name):
+            create_index(conn, idx)
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        conn.execute('ANALYZE')
+
+
+@migration(transactional=False)
+def add_list_content_hash(conn):
+    add_column(conn, database.dependency_lists.c.content_hash)
+    index, = database.dependency_lists.indexes
+    create_index(conn, index)
+
+
+@migration()
+def add_jobs(conn):
+    database.jobs.create(bind=conn, checkfirst=True)
+
+
+@migration()
+def add_refresh_retry(conn):
+    add_column(conn, database.packages.c.next_refresh)
+
+
+@migration()
+def add_job_heartbeat(conn):
+    add_column(conn, database.jobs.c.heartbeat)
+
+
+def get_version(engine):
+    """Get the current schema version, or None if the database is empty.
+    """
+    inspector = sqlalchemy.inspect(engine)
+    if not inspector.has_table(database.schema_migrations.name):
+        if inspector.has_table(database.packages.name):
+            # Database from before migrations were introduced
+            return 0
+        return None
+    with engine.connect() as conn:
+        version = conn.execute(
+            sqlalchemy.select([
+                sqlalchemy.func.max(database.schema_migrations.c.version),
+            ])
+        ).scalar()
+    return version or 0
+
+
+def _set_version(conn, version, name):
+    conn.execute(
+        database.schema_migrations.insert()
+        .values(version=version, name=name, applied=datetime.utcnow())
+    )
+
+
+def upgrade(engine, target=None):
+    """Bring the database schema to the latest version (or `target`).
+
+    Returns the list of names of the migrations that were applied.
+    """
+    if target is None:
+        target = len(MIGRATIONS)
+    elif not 0 <= target <= len(MIGRATIONS):
+        raise MigrationError("No such version: %d" % target)
+
+    current = get_version(engine)
+    if current is None:
+        # Empty database, create everything at the latest version
+        if target != len(MIGRATIONS):
+            raise MigrationError(
+                "Can only initialize the database at the latest version",
+            )
+        logger.info("Creating tables")
+        database.metadata.create_all(engine)
+        with engine.begin() as conn:
+            _set_version(conn, target, 'initial')
+        return ['initial']
+    elif current > len(MIGRATIONS):
+        raise MigrationError(
+            "Database is at version %d, newer than this code (%d)" % (
+                current, len(MIGRATIONS),
+            ),
+        )
+    elif current > target:
+        raise MigrationError("Downgrading is not supported")
+
+    if current == 0:
+        # Adding the version table is the only change to existing tables
+        database.schema_migrations.create(bind=engine, checkfirst=True)
+
+    applied = []
+    for version in range(current + 1, target + 1):
+        name, func, transactional = MIGRATIONS[version - 1]
+        logger.info("Applying migration %d: %s", version, name)
+        if transactional:
+            with engine.begin() as conn:
+                func(conn)
+                _set_version(conn, version, name)
+        else:
+            with engine.connect() as conn:
+                func(conn.execution_options(isolation_level='AUTOCOMMIT'))
+            with engine.begin() as conn:
+                _set_version(conn, version, name)
+        applied.append(name)
+    return applied
+
+
+def stamp(engine, version):
+    """Record the database as being at a version, without changing it.
+    """
+    if not 0 <= version <= len(MIGRATIONS):
+        raise MigrationError("No such version: %d" % version)
+    database.schema_migrations.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        conn.execute(database.schema_migrations.delete())
+        name = MIGRATIONS[version - 1][0] if version > 0 else 'initial'
+        _set_version(conn, version, name)
+
+
+def check(engine):
+    """Compare the database to the schema in the code.
+
+    Returns a list of problems, e.g. missing tables or columns.
+    """
+    inspector = sqlalchemy.inspect(engine)
+    with engine.connect() as conn:
+        invalid_indexes = _invalid_indexes(conn)
+    problems = []
+    existing_tables = set(inspector.get_table_names())
+    for table in database.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            problems.append("Missing table %s" % table.name)
+            continue
+        columns = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                problems.append(
+                    "Missing column %s.%s" % (table.name, column.name),
+                )
+        indexes = {idx['name'] for idx in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                problems.append("Missing index %s" % index.name)
+            elif index.name in invalid_indexes:
+                problems.append("Invalid index %s" % index.name)
+    return problems
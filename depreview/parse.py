@@ -1,22 +1,118 @@
+import json
 import re
 import tomli
 
+from .jsonstream import ObjectStreamParser
+from .registries.node_npm import NodeNPM
 from .registries.python_pypi import PythonPyPI
 
 
+# Default limits on uploaded files
+MAX_SIZE = 20 * 1024 * 1024
+MAX_ENTRIES = 20000
+
+READ_SIZE = 65536
+
+
 class UnknownFormat(ValueError):
     """The file is not in a format we recognize.
     """
 
 
-def poetry_lock(list_file):
+class LimitExceeded(UnknownFormat):
+    """The file is too large, or has too many entries.
+    """
+
+
+def _read_lines(list_file, max_size):
+    """Read lines from a file, raising LimitExceeded after `max_size` bytes.
+    """
+    remaining = max_size
+    while True:
+        # Limit the read so a huge line doesn't get loaded
+        line = list_file.readline(remaining + 1)
+        if not line:
+            return
+        remaining -= len(line)
+        if remaining < 0:
+            raise LimitExceeded("File is too large")
+        yield line
+
+
+def _read(list_file, max_size):
+    data = list_file.read(max_size + 1)
+    if len(data) > max_size:
+        raise LimitExceeded("File is too large")
+    return data
+
+
+def _read_chunks(list_file, max_size):
+    remaining = max_size
+    while True:
+        chunk = list_file.read(min(READ_SIZE, remaining + 1))
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        if remaining < 0:
+            raise LimitExceeded("File is too large")
+        yield chunk
+
+
+def _count(entries, max_entries):
+    for num, entry in enumerate(entries, 1):
+        if num > max_entries:
+            raise LimitExceeded("Too many dependencies")
+        yield entry
+
+
+def _loads_toml(data):
     try:
-        data = tomli.load(list_file)
-    except tomli.TOMLDecodeError:
+        return tomli.loads(data.decode('utf-8'))
+    except (tomli.TOMLDecodeError, UnicodeDecodeError):
         raise UnknownFormat('Invalid TOML')
-    try:
-        packages = []
-        for package in data['package']:
+
+
+_package_header = re.compile(br'^\[\[\s*package\s*\]\]')
+_package_subtable = re.compile(br'^\[\s*package\.')
+_table_header = re.compile(br'^\[')
+
+
+def _poetry_lock_blocks(list_file, max_size):
+    # Split the lock file into [[package]] blocks, each of which is a valid
+    # TOML document on its own. Other tables (e.g. [metadata]) are skipped.
+    # Poetry writes table headers at the start of lines, and indents the
+    # continuation lines of arrays.
+    block = None
+    for line in _read_lines(list_file, max_size):
+        if _package_header.match(line):
+            if block is not None:
+                yield b''.join(block)
+            block = [line]
+        elif _table_header.match(line) and not _package_subtable.match(line):
+            if block is not None:
+                yield b''.join(block)
+            block = None
+        elif block is not None:
+            block.append(line)
+    if block is not None:
+        yield b''.join(block)
+
+
+def poetry_lock(list_file, *, max_size=MAX_SIZE, max_entries=MAX_ENTRIES):
+    """Parse a poetry.lock file.
+
+    Generates `(norm_name, version, dependencies)`. Each [[package]] block is
+    parsed separately, so the whole file is never loaded.
+    """
+    found = False
+    for block in _count(
+        _poetry_lock_blocks(list_file, max_size),
+        max_entries,
+    ):
+        found = True
+        package, = _loads_toml(block)['package']
+
+        try:
             # Get package name and version
             if (
                 not isinstance(package['name'], str)
@@ -25,39 +121,42 @@ def poetry_lock(list_file):
                 raise UnknownFormat('Invalid lock file')
             elif not isinstance(package['version'], str):
                 raise UnknownFormat('Invalid lock file')
+        except KeyError:
+            raise UnknownFormat('Invalid lock file')
 
-            # Get dependencies
-            dependencies = []
-            if package.get('dependencies'):
-                if not isinstance(package['dependencies'], dict):
+        # Get dependencies
+        dependencies = []
+        if package.get('dependencies'):
+            if not isinstance(package['dependencies'], dict):
+                raise UnknownFormat('Invalid lock file')
+            for name, version in package['dependencies'].items():
+                if not isinstance(name, str):
                     raise UnknownFormat('Invalid lock file')
-                for name, version in package['dependencies'].items():
-                    if not isinstance(name, str):
-                        raise UnknownFormat('Invalid lock file')
-                    dependencies.append(PythonPyPI.normalize_name(name))
-            # TODO: Support extras
-
-            packages.append((
-                PythonPyPI.normalize_name(package['name']),
-                '==' + package['version'],
-                sorted(dependencies),
-            ))
-        return packages
-    except KeyError:
+                dependencies.append(PythonPyPI.normalize_name(name))
+        # TODO: Support extras
+
+        yield (
+            PythonPyPI.normalize_name(package['name']),
+            '==' + package['version'],
+            sorted(dependencies),
+        )
+
+    if not found:
         raise UnknownFormat('Invalid lock file')
 
 
+_major = re.compile(r'^([0-9]+)(.*)$')
+_minor = re.compile(r'^([0-9]+\.)([0-9]+)(.*)$')
+
+
 def next_major(version):
-    major, rest = re.match(r'^([0-9]+)(.*)$', version).groups()
+    major, rest = _major.match(version).groups()
     major = int(major, 10)
     return f'{major + 1}.0.0'
 
 
 def next_minor(version):
-    major, minor, rest = re.match(
-        r'^([0-9]+\.)([0-9]+)(.*)$',
-        version,
-    ).groups()
+    major, minor, rest = _minor.match(version).groups()
     minor = int(minor, 10)
     return f'{major}{minor + 1}.0'
 
@@ -88,17 +187,23 @@ def poetry_to_standard_spec(spec):
     return ','.join(result)
 
 
-def pyproject_toml(list_file):
-    try:
-        data = tomli.load(list_file)
-    except tomli.TOMLDecodeError:
-        raise UnknownFormat('Invalid TOML')
+def pyproject_toml(list_file, *, max_size=MAX_SIZE, max_entries=MAX_ENTRIES):
+    """Parse the Poetry dependencies from a pyproject.toml file.
+
+    Generates `(norm_name, version_specifier, None)`.
+    """
+    data = _loads_toml(_read(list_file, max_size))
     try:
-        packages = []
         if not isinstance(data['tool']['poetry']['dependencies'], dict):
             raise UnknownFormat('Invalid Poetry project file')
+        lists = [data['tool']['poetry']['dependencies']]
+        if data['tool']['poetry'].get('dev-dependencies'):
+            lists.append(data['tool']['poetry']['dev-dependencies'])
+    except KeyError:
+        raise UnknownFormat('Invalid lock file')
 
-        def add_list(pkgs):
+    def entries():
+        for pkgs in lists:
             for orig_name, version in pkgs.items():
                 if (
                     not isinstance(orig_name, str)
@@ -108,39 +213,262 @@ def pyproject_toml(list_file):
                 if orig_name.lower() == 'python':
                     # Doesn't count
                     continue
-                norm_name = PythonPyPI.normalize_name(orig_name)
-                packages.append((
-                    norm_name,
+                yield (
+                    PythonPyPI.normalize_name(orig_name),
                     poetry_to_standard_spec(version),
                     None,
-                ))
+                )
 
-        add_list(data['tool']['poetry']['dependencies'])
-        if data['tool']['poetry'].get('dev-dependencies'):
-            add_list(data['tool']['poetry']['dev-dependencies'])
-        return packages
-    except KeyError:
-        raise UnknownFormat('Invalid lock file')
+    yield from _count(entries(), max_entries)
 
 
-def requirements_txt(list_file):
-    try:
-        packages = []
+_requirement = re.compile(br'([^ =<>]+)==([^ #]+)')
+
+
+def requirements_txt(
+    list_file, *, max_size=MAX_SIZE, max_entries=MAX_ENTRIES,
+):
+    """Parse a requirements.txt file with pinned versions.
+
+    Generates `(norm_name, version, None)`.
+    """
+    def entries():
         escaped = False
-        for line in iter(list_file.readline, b''):
+        for line in _read_lines(list_file, max_size):
             was_escaped, escaped = escaped, False
             line = line.strip()
             if not line or line[0:1] == b'#':
                 continue
-            if not was_escaped:
-                m = re.match(br'([^ =<>]+)==([^ #]+)', line)
-                packages.append((
+            if line[-1:] == b'\\':
+                escaped = True
+            if was_escaped:
+                continue
+            elif line[0:1] == b'-':
+                # Option, e.g. --index-url or -r other.txt
+                continue
+            m = _requirement.match(line)
+            if m is None:
+                raise UnknownFormat("Invalid requirement, versions should be "
+                                    "pinned with ==")
+            try:
+                yield (
                     PythonPyPI.normalize_name(m.group(1).decode('ascii')),
                     '==' + m.group(2).decode('ascii'),
                     None,
-                ))
-            if line[-1:] == b'\\':
-                escaped = True
-        return packages
-    except UnicodeDecodeError:
-        raise UnknownFormat("Invalid characters in file")
+                )
+            except UnicodeDecodeError:
+                raise UnknownFormat("Invalid characters in file")
+
+    yield from _count(entries(), max_entries)
+
+
+def _stream_json(list_file, max_size, expand):
+    parser = ObjectStreamParser(expand=expand)
+    try:
+        for chunk in _read_chunks(list_file, max_size):
+            yield from parser.feed(chunk)
+        yield from parser.close()
+    except UnknownFormat:
+        raise
+    except ValueError:
+        raise UnknownFormat('Invalid JSON')
+
+
+def package_json(list_file, *, max_size=MAX_SIZE, max_entries=MAX_ENTRIES):
+    """Parse the dependencies from a package.json file.
+
+    Generates `(norm_name, version_range, None)`.
+    """
+    try:
+        data = json.loads(_read(list_file, max_size))
+    except ValueError:
+        raise UnknownFormat('Invalid JSON')
+    if not isinstance(data, dict):
+        raise UnknownFormat('Invalid package.json file')
+    lists = []
+    for key in ('dependencies', 'devDependencies', 'optionalDependencies'):
+        if data.get(key) is None:
+            continue
+        if not isinstance(data[key], dict):
+            raise UnknownFormat('Invalid package.json file')
+        lists.append(data[key])
+
+    def entries():
+        for pkgs in lists:
+            for orig_name, version in pkgs.items():
+                if not isinstance(version, str):
+                    raise UnknownFormat('Invalid package.json file')
+                yield NodeNPM.normalize_name(orig_name), version, None
+
+    yield from _count(entries(), max_entries)
+
+
+def _npm_dependencies(entry, *keys):
+    dependencies = []
+    for key in keys:
+        if not entry.get(key):
+            continue
+        if not isinstance(entry[key], dict):
+            raise UnknownFormat('Invalid lock file')
+        dependencies.extend(
+            NodeNPM.normalize_name(name) for name in entry[key]
+        )
+    return sorted(dependencies)
+
+
+def package_lock_json(
+    list_file, *, max_size=MAX_SIZE, max_entries=MAX_ENTRIES,
+):
+    """Parse a package-lock.json (or npm-shrinkwrap.json) file.
+
+    Generates `(norm_name, version, dependencies)` for the packages at the top
+    of node_modules. Entries are parsed one at a time, so the whole file is
+    never loaded.
+    """
+    def entries():
+        is_lock = False
+        has_packages = False
+        for path, entry in _stream_json(
+            list_file, max_size, ('packages', 'dependencies'),
+        ):
+            if path == ('lockfileVersion',):
+                is_lock = True
+            if len(path) != 2:
+                continue
+            if not isinstance(entry, dict):
+                raise UnknownFormat('Invalid lock file')
+
+            if path[0] == 'packages':
+                # lockfileVersion 2 and 3, keyed by location in node_modules
+                has_packages = True
+                location = path[1]
+                # Skip the project itself, links to workspaces, and copies
+                # nested under other packages (those are different versions
+                # of packages at the top)
+                if (
+                    not location.startswith('node_modules/')
+                    or location.count('node_modules/') != 1
+                    or entry.get('link')
+                ):
+                    continue
+                name = entry.get('name') or location[13:]
+                dependencies = _npm_dependencies(
+                    entry, 'dependencies', 'optionalDependencies',
+                )
+            elif not has_packages:
+                # lockfileVersion 1, only when there is no 'packages'
+                name = path[1]
+                dependencies = _npm_dependencies(entry, 'requires')
+            else:
+                continue
+
+            if 'version' not in entry:
+                continue
+            if not isinstance(name, str) or not isinstance(
+                entry['version'], str,
+            ):
+                raise UnknownFormat('Invalid lock file')
+            yield NodeNPM.normalize_name(name), entry['version'], dependencies
+
+        if not is_lock:
+            raise UnknownFormat('Invalid lock file')
+
+    yield from _count(entries(), max_entries)
+
+
+_yarn_field = re.compile(r'^("(?:[^"\\]|\\.)*"|[^\s:"]+):?(?:\s+(.*))?$')
+
+
+def _yarn_unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        try:
+            return json.loads(value)
+        except ValueError:
+            raise UnknownFormat('Invalid lock file')
+    return value
+
+
+def _yarn_package_name(header):
+    # Entries can have multiple descriptors, which resolve to the same
+    # package, e.g. 'name@^1.0.0, name@^1.1.0' (Yarn 1 quotes each descriptor
+    # if needed, later versions quote the whole list)
+    if header.startswith('"'):
+        end = header.find('"', 1)
+        if end == -1:
+            raise UnknownFormat('Invalid lock file')
+        header = header[1:end]
+    descriptor = header.split(',')[0].strip()
+
+    # Descriptors are 'name@range', where the name can start with '@'
+    at = descriptor.find('@', 1)
+    if at == -1:
+        raise UnknownFormat('Invalid lock file')
+    name, spec = descriptor[:at], descriptor[at + 1:]
+    if spec.startswith(('workspace:', 'link:', 'portal:')):
+        # Local package, not from the registry
+        return None
+    if spec.startswith('npm:') and spec.find('@', 5) != -1:
+        # Alias for another package, 'alias@npm:name@range'
+        name = spec[4:spec.find('@', 5)]
+    return name
+
+
+def yarn_lock(list_file, *, max_size=MAX_SIZE, max_entries=MAX_ENTRIES):
+    """Parse a yarn.lock file, from Yarn 1 or later versions.
+
+    Generates `(norm_name, version, dependencies)`.
+    """
+    def entries():
+        found = False
+        name = version = section = None
+        dependencies = []
+        for line in _read_lines(list_file, max_size):
+            try:
+                line = line.decode('utf-8').rstrip()
+            except UnicodeDecodeError:
+                raise UnknownFormat("Invalid characters in file")
+            if not line or line.lstrip().startswith('#'):
+                continue
+            indent = len(line) - len(line.lstrip(' '))
+            line = line.lstrip(' ')
+
+            if indent == 0:
+                if name is not None and version is not None:
+                    yield (
+                        NodeNPM.normalize_name(name),
+                        version,
+                        sorted(dependencies),
+                    )
+                if not line.endswith(':'):
+                    raise UnknownFormat('Invalid lock file')
+                found = True
+                if line == '__metadata:':
+                    name = None
+                else:
+                    name = _yarn_package_name(line[:-1])
+                version = section = None
+                dependencies = []
+                continue
+            elif not found:
+                raise UnknownFormat('Invalid lock file')
+
+            m = _yarn_field.match(line)
+            if m is None:
+                raise UnknownFormat('Invalid lock file')
+            key, value = m.groups()
+            key = _yarn_unquote(key)
+            if indent == 2:
+                section = None
+                if key == 'version' and value:
+                    version = _yarn_unquote(value)
+                elif key in ('dependencies', 'optionalDependencies'):
+                    section = key
+            elif section is not None:
+                dependencies.append(NodeNPM.normalize_name(key))
+
+        if name is not None and version is not None:
+            yield NodeNPM.normalize_name(name), version, sorted(dependencies)
+        if not found:
+            raise UnknownFormat('Invalid lock file')
+
+    yield from _count(entries(), max_entries)
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+
+class TokenBucket(object):
+    """Rate limiter allowing `rate` requests per second, in bursts of `burst`.
+
+    Callers reserve their slot when calling `acquire()`, so they go through in
+    order. This doesn't use any asyncio primitive, so it can be shared between
+    event loops.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+
+    def _reserve(self):
+        # Take a token, returns how long to wait before using it
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst,
+            self._tokens + (now - self._updated) * self.rate,
+        )
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            wait = 0
+        else:
+            wait = -self._tokens / self.rate
+        return max(wait, self._blocked_until - now)
+
+    async def acquire(self):
+        """Wait until a request can be made.
+        """
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def block(self, seconds):
+        """Don't let new requests through for some time.
+
+        This is used when the server tells us to back off (Retry-After).
+        """
+        self._blocked_until = max(
+            self._blocked_until,
+            time.monotonic() + seconds,
+        )
@@ -0,0 +1,160 @@
+"""Background refresh of the packages stored in the database.
+
+Packages are refreshed a bit before they expire, the ones that were viewed
+recently first. How they get fetched is up to the caller.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import os
+import sqlalchemy
+
+from . import database
+from .registries.base import PackageNotFound
+
+
+logger = logging.getLogger(__name__)
+
+
+# Packages older than this are refreshed when viewed
+MAX_AGE = timedelta(hours=6)
+
+# The background refresher updates packages this long before they reach
+# MAX_AGE, so they rarely get served stale
+REFRESH_AHEAD = timedelta(minutes=30)
+# How often the background refresher looks for packages to update, in seconds
+INTERVAL = float(os.environ.get('REFRESH_INTERVAL', '60'))
+# Maximum number of packages refreshed per run of the background refresher
+BATCH_SIZE = int(os.environ.get('REFRESH_BATCH_SIZE', '50'))
+# Packages that couldn't be refreshed (e.g. the registry returned an error, or
+# they were deleted) are tried again after that long, so they don't hold up
+# the others
+RETRY_DELAY = timedelta(hours=1)
+# Number of recently-accessed packages remembered to prioritize refreshes
+RECENT_ACCESS_SIZE = 10000
+
+
+# Recently-accessed packages, (registry, norm_name) -> time of last access
+_recent_access = {}
+
+
+def record_access(registry, norm_name):
+    """Remember that a package was viewed, to prioritize its refresh.
+    """
+    key = registry, norm_name
+    # Re-insert so the dict stays ordered by access time
+    _recent_access.pop(key, None)
+    _recent_access[key] = datetime.utcnow()
+    if len(_recent_access) > RECENT_ACCESS_SIZE:
+        del _recent_access[next(iter(_recent_access))]
+
+
+def can_refresh(package):
+    """Whether a package can be refreshed, it isn't waiting after a failure.
+    """
+    return (
+        package.next_refresh is None
+        or package.next_refresh <= datetime.utcnow()
+    )
+
+
+async def record_failures(db, registry, norm_names):
+    """Record that packages failed to refresh, to try again later.
+
+    Returns the time until which they won't be refreshed.
+    """
+    next_refresh = datetime.utcnow() + RETRY_DELAY
+    if norm_names:
+        await db.execute(
+            database.packages.update()
+            .values(next_refresh=next_refresh)
+            .where(
+                database.packages.c.registry == registry,
+                database.packages.c.norm_name.in_(sorted(norm_names)),
+            )
+        )
+    return next_refresh
+
+
+async def refresh_worker(db, refresh_packages):
+    """Periodically refresh the packages that are getting old.
+    """
+    while True:
+        try:
+            await refresh_stale_packages(db, refresh_packages)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Error in background refresh")
+        await asyncio.sleep(INTERVAL)
+
+
+async def refresh_stale_packages(db, refresh_packages):
+    """Refresh a batch of the packages that are getting old.
+
+    `refresh_packages(registry, norm_names)` is an async iterator yielding
+    `(norm_name, package)`, where package is the exception if it could not be
+    refreshed.
+    """
+    now = datetime.utcnow()
+    threshold = now - (MAX_AGE - REFRESH_AHEAD)
+    rows = await db.execute(
+        sqlalchemy.select([
+            database.packages.c.registry,
+            database.packages.c.norm_name,
+        ])
+        .select_from(database.packages)
+        .where(
+            database.packages.c.last_refresh < threshold,
+            sqlalchemy.or_(
+                database.packages.c.next_refresh.is_(None),
+                database.packages.c.next_refresh < now,
+            ),
+        )
+        .order_by(database.packages.c.last_refresh)
+        .limit(BATCH_SIZE * 10)
+    )
+    if not rows:
+        return
+
+    # Recently-viewed packages first, then the oldest
+    never = datetime.min
+    rows = sorted(
+        enumerate(rows),
+        key=lambda r: (_recent_access.get(tuple(r[1]), never), -r[0]),
+        reverse=True,
+    )
+    rows = [row for _, row in rows[:BATCH_SIZE]]
+    logger.info("Refreshing %d packages in the background", len(rows))
+
+    by_registry = {}
+    for registry, norm_name in rows:
+        by_registry.setdefault(registry, []).append(norm_name)
+
+    async def refresh(registry, norm_names):
+        failed = set(norm_names)
+        async for norm_name, package in refresh_packages(registry, norm_names):
+            if isinstance(package, PackageNotFound):
+                logger.warning(
+                    "Package %r / %r not found in registry",
+                    registry,
+                    norm_name,
+                )
+            elif isinstance(package, Exception):
+                logger.error(
+                    "Error refreshing package %r / %r",
+                    registry,
+                    norm_name,
+                    exc_info=package,
+                )
+            else:
+                failed.discard(norm_name)
+
+        # Record the attempt, so that they are not picked again right away
+        await record_failures(db, registry, failed)
+
+    await asyncio.gather(*[
+        refresh(registry, norm_names)
+        for registry, norm_names in by_registry.items()
+    ])
@@ -1,30 +1,44 @@
-import pkg_resources
+import importlib.metadata
 
 
-_registries = None
+_entry_points = None
+_registries = {}
 
 
 def _load_entrypoints():
-    global _registries
+    """Get the entry points of the registries, by name.
 
-    if _registries is None:
-        _registries = {}
-        for entry in pkg_resources.iter_entry_points('depreview.registries'):
-            cls = entry.load()
-            assert cls.NAME == entry.name
-            _registries[entry.name] = cls()
+    The metadata is only read once, and the registries are only imported when
+    they are first used.
+    """
+    global _entry_points
 
+    if _entry_points is None:
+        entry_points = importlib.metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            entry_points = entry_points.select(group='depreview.registries')
+        else:
+            # Python < 3.10
+            entry_points = entry_points.get('depreview.registries', ())
+        _entry_points = {entry.name: entry for entry in entry_points}
+    return _entry_points
 
-def get_registry(registry):
-    _load_entrypoints()
 
+def get_registry(registry):
     try:
         return _registries[registry]
+    except KeyError:
+        pass
+
+    try:
+        entry = _load_entrypoints()[registry]
     except KeyError:
         return None
+    cls = entry.load()
+    assert cls.NAME == entry.name
+    _registries[registry] = cls()
+    return _registries[registry]
 
 
 def get_all_registry_names():
-    _load_entrypoints()
-
-    return sorted(_registries)
+    return sorted(_load_entrypoints())
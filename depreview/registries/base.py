@@ -1,8 +1,195 @@
-from datetime import datetime
+import aiohttp
+import asyncio
+from datetime import datetime, timezone
+import email.utils
+import logging
+import random
+import urllib.parse
+
+from ..ratelimit import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+# Responses that are worth retrying
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# Rate limiters, by host
+_host_buckets = {}
+
+
+class PackageNotModified(Exception):
+    """The package didn't change since the given ETag/modification date.
+    """
+
+
+class PackageNotFound(Exception):
+    """The package doesn't exist in the registry.
+    """
+
+
+def parse_retry_after(value):
+    """Parse the Retry-After header, as a number of seconds.
+
+    Returns None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
 
 
 class BaseRegistry(object):
-    async def get_package(self, name, http):
+    # Default number of concurrent requests in get_packages()
+    BATCH_CONCURRENCY = 8
+
+    # Requests per second to each host, and how many can be made at once
+    RATE_LIMIT = 20.0
+    RATE_BURST = 40
+
+    # Retries on errors, with exponential backoff (in seconds)
+    MAX_RETRIES = 4
+    RETRY_BACKOFF = 0.5
+    # Give up if asked to wait longer than this
+    RETRY_MAX_DELAY = 30.0
+
+    async def get_package(self, name, http, *, etag=None, last_modified=None):
+        """Get a package from the registry.
+
+        If `etag` or `last_modified` are given (from a previous Package), the
+        registry may raise PackageNotModified instead of returning the package.
+        """
+        raise NotImplementedError
+
+    async def fetch(self, http, url, read, *, headers=None):
+        """Make a GET request to the registry, with rate limiting and retries.
+
+        `read` is a coroutine function getting the response and returning the
+        result. It is called for successful responses only, and is retried with
+        the request on transient errors (connection errors, timeouts, 429 and
+        5xx statuses).
+
+        Raises PackageNotModified for 304 and PackageNotFound for 404.
+        """
+        host = urllib.parse.urlsplit(url).hostname
+        try:
+            bucket = _host_buckets[host]
+        except KeyError:
+            bucket = TokenBucket(self.RATE_LIMIT, self.RATE_BURST)
+            _host_buckets[host] = bucket
+
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            retry_after = None
+            try:
+                async with http.get(url, headers=headers) as resp:
+                    if resp.status == 304:
+                        raise PackageNotModified
+                    elif resp.status == 404:
+                        raise PackageNotFound
+                    elif resp.status in RETRY_STATUSES:
+                        retry_after = parse_retry_after(
+                            resp.headers.get('Retry-After'),
+                        )
+                    resp.raise_for_status()
+                    return await read(resp)
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRY_STATUSES:
+                    raise
+                error = e
+            except (
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ) as e:
+                error = e
+
+            attempt += 1
+            if attempt > self.MAX_RETRIES:
+                raise error
+
+            # Exponential backoff with full jitter
+            delay = random.uniform(
+                0,
+                min(self.RETRY_MAX_DELAY, self.RETRY_BACKOFF * 2 ** attempt),
+            )
+            if retry_after is not None:
+                if retry_after > self.RETRY_MAX_DELAY:
+                    raise error
+                # Applies to all our requests to that host
+                bucket.block(retry_after)
+                delay = max(delay, retry_after)
+            logger.warning(
+                "Error getting %s (%r), retrying in %.1fs",
+                url, error, delay,
+            )
+            await asyncio.sleep(delay)
+
+    async def get_packages(self, names, http, *, validators=None, limit=None):
+        """Get multiple packages from the registry.
+
+        This is an async iterator of `(name, package)`, in the order the
+        packages arrive. If getting a package fails, the exception is returned
+        in place of the package, so that the others can still be used.
+
+        `validators` maps names to `(etag, last_modified)` for conditional
+        requests, PackageNotModified may then be returned for those.
+
+        `limit` is a function returning an async context manager to hold
+        during each request, for example a semaphore. By default, up to
+        `BATCH_CONCURRENCY` requests are made at a time.
+
+        The default implementation calls get_package() concurrently, registries
+        with a bulk API can override it.
+        """
+        if validators is None:
+            validators = {}
+        if limit is None:
+            semaphore = asyncio.Semaphore(self.BATCH_CONCURRENCY)
+
+            def limit():
+                return semaphore
+
+        async def get(name):
+            etag, last_modified = validators.get(name, (None, None))
+            try:
+                async with limit():
+                    package = await self.get_package(
+                        name, http,
+                        etag=etag,
+                        last_modified=last_modified,
+                    )
+            except Exception as e:
+                return name, e
+            return name, package
+
+        tasks = [asyncio.ensure_future(get(name)) for name in names]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            # If the caller stops early
+            for task in tasks:
+                task.cancel()
+
+    def document_parser(self):
+        """Get a parser for the registry's package documents.
+
+        The parser has a `feed(data)` method taking bytes, and a
+        `close(**kwargs)` method returning the Package (the arguments are
+        passed to Package). This is used to import packages from dumps.
+        """
         raise NotImplementedError
 
     def normalize_name(self, name):
@@ -14,12 +201,30 @@ class BaseRegistry(object):
     def version_comparison_key(self, version):
         raise NotImplementedError
 
+    def version_sort_key(self, version):
+        """Get the comparison key of a PackageVersion, caching it on the object.
+        """
+        if version.sort_key is None:
+            version.sort_key = self.version_comparison_key(version.version)
+        return version.sort_key
+
     def is_prerelease(self, version):
         return False
 
     def version_match_specifier(self, version, specifier):
         return version == specifier
 
+    def find_version(self, versions, specifier):
+        """Find the first version matching a specifier.
+
+        `versions` is a list of PackageVersion in order of preference. Returns
+        None if none of them match.
+        """
+        for version in versions:
+            if self.version_match_specifier(version.version, specifier):
+                return version
+        return None
+
 
 class Package(object):
     def __init__(
@@ -33,6 +238,10 @@ class Package(object):
         description_type,
         repository,
         last_refresh=None,
+        etag=None,
+        last_modified=None,
+        serial=None,
+        next_refresh=None,
     ):
         self.registry = registry
         self.orig_name = orig_name
@@ -45,16 +254,23 @@ class Package(object):
             self.last_refresh = datetime.utcnow()
         else:
             self.last_refresh = last_refresh
+        self.etag = etag
+        self.last_modified = last_modified
+        self.serial = serial
+        # When to try refreshing again after a failure (see refresh.py)
+        self.next_refresh = next_refresh
 
     def __repr__(self):
         return '<Package %r>' % self.orig_name
 
 
 class PackageVersion(object):
-    def __init__(self, version, *, release_date, yanked):
+    def __init__(self, version, *, release_date, yanked, sort_key=None):
         self.version = version
         self.release_date = release_date
         self.yanked = yanked
+        # Comparison key from the registry, see BaseRegistry.version_sort_key()
+        self.sort_key = sort_key
 
     def __cmp__(self, other):
         raise NotImplementedError
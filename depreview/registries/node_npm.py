@@ -1,5 +1,217 @@
-from .base import BaseRegistry
+from datetime import datetime
+import logging
+import re
+import urllib.parse
+
+from ..jsonstream import ObjectStreamParser
+from .. import semver
+from .base import BaseRegistry, Package, PackageVersion
+
+
+logger = logging.getLogger(__name__)
+
+
+_repository_shorthand = re.compile(
+    r'^(?:(github|gitlab|bitbucket):)?([^/:@]+/[^/:]+)$'
+)
+_repository_hosts = {
+    'github': 'https://github.com/',
+    'gitlab': 'https://gitlab.com/',
+    'bitbucket': 'https://bitbucket.org/',
+}
+
+
+CHUNK_SIZE = 65536
+
+
+def _parse_date(date):
+    return datetime.fromisoformat(date.rstrip('Z'))
+
+
+def _parse_repository(repository):
+    if isinstance(repository, dict):
+        repository = repository.get('url')
+    if not isinstance(repository, str) or not repository:
+        return None
+    m = _repository_shorthand.match(repository)
+    if m is not None:
+        host, path = m.groups()
+        return _repository_hosts[host or 'github'] + path
+    if repository.startswith('git+'):
+        repository = repository[4:]
+    if repository.startswith('git://'):
+        repository = 'https://' + repository[6:]
+    return repository
 
 
 class NodeNPM(BaseRegistry):
     NAME = 'npm'
+
+    REGISTRY_URL = 'https://registry.npmjs.org'
+
+    # The registry is behind a CDN and made for installs, which fetch all the
+    # packages of a project at once; lock files have thousands of entries
+    BATCH_CONCURRENCY = 16
+    RATE_LIMIT = 50.0
+    RATE_BURST = 100
+
+    async def get_package(self, name, http, *, etag=None, last_modified=None):
+        norm_name = self.normalize_name(name)
+        # The full document is needed, the abbreviated one
+        # (application/vnd.npm.install-v1+json) doesn't have the release dates
+        headers = {'Accept': 'application/json'}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+
+        async def read(resp):
+            parser = DocumentParser(self)
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                parser.feed(chunk)
+            return parser.close(
+                etag=resp.headers.get('ETag'),
+                last_modified=resp.headers.get('Last-Modified'),
+            )
+
+        return await self.fetch(
+            http,
+            '%s/%s' % (
+                self.REGISTRY_URL,
+                urllib.parse.quote(norm_name, safe='@'),
+            ),
+            read,
+            headers=headers,
+        )
+
+    def document_parser(self):
+        return DocumentParser(self)
+
+    def _make_package(self, document, versions, **kwargs):
+        author = document.get('author')
+        if isinstance(author, dict):
+            author = author.get('name')
+        if not isinstance(author, str):
+            author = None
+
+        description = document.get('readme')
+        description_type = 'text/markdown'
+        if not description:
+            description = document.get('description')
+            description_type = 'text/plain'
+
+        return Package(
+            self.NAME,
+            document['name'],
+            versions,
+            author=author,
+            description=description or None,
+            description_type=description_type,
+            repository=_parse_repository(document.get('repository')),
+            **kwargs,
+        )
+
+    @staticmethod
+    def normalize_name(name):
+        # Names are case-sensitive, some old packages have capitals
+        return name.strip()
+
+    def get_link(self, name):
+        norm_name = self.normalize_name(name)
+        return f'https://www.npmjs.com/package/{norm_name}'
+
+    def version_comparison_key(self, version):
+        return semver.parse_version(version)
+
+    def is_prerelease(self, version):
+        return semver.is_prerelease(semver.parse_version(version))
+
+    def version_match_specifier(self, version, specifier):
+        return semver.satisfies(version, specifier)
+
+    def find_version(self, versions, specifier):
+        try:
+            sets, pinned = semver.compile_range(specifier)
+        except semver.InvalidRange:
+            return None
+
+        # Fast path for exact versions, which is what lock files have
+        if pinned is not None:
+            for version in versions:
+                if version.version == pinned:
+                    return version
+
+        for version in versions:
+            try:
+                key = self.version_sort_key(version)
+            except semver.InvalidVersion:
+                continue
+            if semver.match_range(sets, key):
+                return version
+        return None
+
+
+class DocumentParser(object):
+    """Incremental parser for the package documents of the npm registry.
+
+    Feed it the document in chunks, then call `close()` to get the Package.
+    Only the fields we use are kept, one version manifest at a time.
+    """
+
+    _fields = ('name', 'author', 'description', 'readme', 'repository')
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._parser = ObjectStreamParser(expand=('versions', 'time'))
+        self._document = {}
+        self._deprecated = {}
+        self._dates = {}
+
+    def feed(self, data):
+        self._handle(self._parser.feed(data))
+
+    def close(self, **kwargs):
+        self._handle(self._parser.close())
+        if not isinstance(self._document.get('name'), str):
+            raise ValueError("Invalid package document, no name")
+
+        # Versions need a release date, which are in a separate object
+        versions = {}
+        for num, deprecated in self._deprecated.items():
+            date = self._dates.get(num)
+            if date is None:
+                continue
+            try:
+                sort_key = semver.parse_version(num)
+            except semver.InvalidVersion:
+                continue
+            versions[num] = PackageVersion(
+                num,
+                release_date=date,
+                # Deprecated versions should not be used either
+                yanked=deprecated,
+                sort_key=sort_key,
+            )
+
+        return self.registry._make_package(
+            self._document,
+            versions,
+            **kwargs,
+        )
+
+    def _handle(self, members):
+        for path, value in members:
+            if len(path) == 1:
+                if path[0] in self._fields:
+                    self._document[path[0]] = value
+            elif path[0] == 'versions':
+                self._deprecated[path[1]] = bool(
+                    isinstance(value, dict) and value.get('deprecated')
+                )
+            elif path[0] == 'time':
+                if path[1] in ('created', 'modified'):
+                    continue
+                try:
+                    self._dates[path[1]] = _parse_date(value)
+                except (TypeError, ValueError):
+                    continue
@@ -1,9 +1,11 @@
 from datetime import datetime
+import functools
 import logging
 import packaging.specifiers
 import packaging.version
 import re
 
+from ..jsonstream import ObjectStreamParser
 from .base import BaseRegistry, Package, PackageVersion
 
 
@@ -13,24 +15,75 @@ logger = logging.getLogger(__name__)
 _repository_url = re.compile(r'^https?://(github.com|gitlab.com|codeberg.org)(?:/.*)?$')
 
 
+CHUNK_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_version(version):
+    """Parse a version number, with a cache.
+
+    Raises packaging.version.InvalidVersion (which is not cached).
+    """
+    return packaging.version.parse(version)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_specifier(specifier):
+    """Parse a version specifier, with a cache.
+
+    Returns the SpecifierSet, and the version string if the specifier pins an
+    exact version (e.g. '==1.2.0'), else None.
+    """
+    specifier_set = packaging.specifiers.SpecifierSet(specifier)
+    pinned = None
+    if len(specifier_set) == 1:
+        single, = specifier_set
+        if single.operator == '==' and not single.version.endswith('.*'):
+            pinned = single.version
+    return specifier_set, pinned
+
+
 class PythonPyPI(BaseRegistry):
     NAME = 'pypi'
 
-    async def get_package(self, name, http):
+    async def get_package(self, name, http, *, etag=None, last_modified=None):
         norm_name = self.normalize_name(name)
-        async with http.get(f'https://pypi.org/pypi/{norm_name}/json') as resp:
-            data = await resp.json()
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+
+        async def read(resp):
+            parser = DocumentParser(self)
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                parser.feed(chunk)
+            return parser.close(
+                etag=resp.headers.get('ETag'),
+                last_modified=resp.headers.get('Last-Modified'),
+            )
+
+        return await self.fetch(
+            http,
+            f'https://pypi.org/pypi/{norm_name}/json',
+            read,
+            headers=headers,
+        )
 
-        orig_name = data['info']['name']
-        author = data['info'].get('author')
-        description = data['info'].get('description')
-        description_type = data['info'].get('description_content_type') or 'text/x-rst'
+    def document_parser(self):
+        return DocumentParser(self)
+
+    def _make_package(self, info, versions, **kwargs):
+        orig_name = info['name']
+        author = info.get('author')
+        description = info.get('description')
+        description_type = info.get('description_content_type') or 'text/x-rst'
 
         # Collect URLs
         urls_lower = {}
-        if 'home_page' in data['info']:
-            urls_lower['home_page'] = [data['info']['home_page']]
-        for k, v in (data['info'].get('project_urls') or {}).items():
+        if info.get('home_page'):
+            urls_lower['home_page'] = [info['home_page']]
+        for k, v in (info.get('project_urls') or {}).items():
             urls_lower.setdefault(k.lower(), []).append(v)
 
         # Find repository
@@ -46,19 +99,6 @@ class PythonPyPI(BaseRegistry):
             ):
                 repository = urls_lower['home_page'][0]
 
-        # Go over versions
-        def is_version_valid(num):
-            try:
-                packaging.version.parse(num)
-                return True
-            except packaging.version.InvalidVersion:
-                return False
-        versions = {
-            k: self._parse_version(k, v)
-            for k, v in data['releases'].items()
-            if v and is_version_valid(k)
-        }
-
         return Package(
             self.NAME,
             orig_name,
@@ -67,6 +107,7 @@ class PythonPyPI(BaseRegistry):
             description=description,
             description_type=description_type,
             repository=repository,
+            **kwargs,
         )
 
     def _parse_version(self, version, data):
@@ -95,11 +136,83 @@ class PythonPyPI(BaseRegistry):
         return f'https://pypi.org/project/{norm_name}/'
 
     def version_comparison_key(self, version):
-        return packaging.version.parse(version)
+        return parse_version(version)
 
     def is_prerelease(self, version):
-        return packaging.version.parse(version).is_prerelease
+        return parse_version(version).is_prerelease
 
     def version_match_specifier(self, version, specifier):
-        specifier = packaging.specifiers.SpecifierSet(specifier)
-        return version in specifier
+        specifier_set, pinned = compile_specifier(specifier)
+        if pinned is not None and version == pinned:
+            return True
+        try:
+            return specifier_set.contains(parse_version(version))
+        except packaging.version.InvalidVersion:
+            return False
+
+    def find_version(self, versions, specifier):
+        specifier_set, pinned = compile_specifier(specifier)
+
+        # Fast path for pinned versions: compare strings directly
+        if pinned is not None:
+            for version in versions:
+                if version.version == pinned:
+                    return version
+
+        # Fall back to full matching, which also handles equivalent spellings
+        # of the pinned version (e.g. '1.0' for '==1.0.0')
+        for version in versions:
+            try:
+                key = self.version_sort_key(version)
+            except packaging.version.InvalidVersion:
+                continue
+            if specifier_set.contains(key):
+                return version
+        return None
+
+
+class DocumentParser(object):
+    """Incremental parser for the package documents of PyPI's JSON API.
+
+    Feed it the document in chunks, then call `close()` to get the Package.
+    Only the fields we use are kept, one release at a time.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._parser = ObjectStreamParser(expand=('releases',))
+        self._info = None
+        self._serial = None
+        self._versions = {}
+
+    def feed(self, data):
+        self._handle(self._parser.feed(data))
+
+    def close(self, **kwargs):
+        self._handle(self._parser.close())
+        if self._info is None:
+            raise ValueError("Invalid package document, no info")
+        return self.registry._make_package(
+            self._info,
+            self._versions,
+            serial=self._serial,
+            **kwargs,
+        )
+
+    def _handle(self, members):
+        for path, value in members:
+            if path == ('info',):
+                self._info = value
+            elif path == ('last_serial',):
+                self._serial = value
+            elif path[0] == 'releases':
+                num = path[1]
+                if not value:
+                    continue
+                try:
+                    sort_key = parse_version(num)
+                except packaging.version.InvalidVersion:
+                    continue
+                version = self.registry._parse_version(num, value)
+                version.sort_key = sort_key
+                self._versions[num] = version
@@ -0,0 +1,267 @@
+"""Semantic versions and ranges, as used by npm.
+
+This follows node-semver: versions are ordered by precedence, and ranges use
+its syntax, e.g. `^1.2.3`, `~1.2`, `1.x`, `1.2.3 - 2.0.0`, `>=1.0.0 <2 || 3`.
+"""
+
+import functools
+import operator
+import re
+
+
+class InvalidVersion(ValueError):
+    """The string is not a semantic version.
+    """
+
+
+class InvalidRange(ValueError):
+    """The string is not a range we can match versions against.
+    """
+
+
+_version = re.compile(
+    r'^\s*[v=]*\s*'
+    r'([0-9]+)\.([0-9]+)\.([0-9]+)'
+    r'(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?'
+    r'(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?'
+    r'\s*$'
+)
+
+_partial = re.compile(
+    r'^[v=]*([0-9]+|[xX*])'
+    r'(?:\.([0-9]+|[xX*])'
+    r'(?:\.([0-9]+|[xX*])'
+    r'(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?'
+    r'(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?'
+    r')?)?$'
+)
+
+_comparator = re.compile(r'^(<=|>=|<|>|=|~>|~|\^)?(.*)$')
+_operator_space = re.compile(r'(<=|>=|<|>|=|~>|~|\^)\s+')
+_hyphen = re.compile(r'\s+-\s+')
+
+_operators = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '=': operator.eq,
+}
+
+
+def _prerelease_key(prerelease):
+    # Numeric identifiers sort before alphanumeric ones
+    return tuple(
+        (0, int(part, 10)) if part.isdigit() else (1, part)
+        for part in prerelease.split('.')
+    )
+
+
+def _key(major, minor, patch, prerelease=()):
+    # Releases sort after their prereleases
+    if prerelease:
+        return (major, minor, patch, 0, prerelease)
+    else:
+        return (major, minor, patch, 1, ())
+
+
+def _floor(major, minor, patch):
+    # The lowest version there is before major.minor.patch, i.e. its '-0'
+    # prerelease, to exclude the prereleases of an upper bound
+    return (major, minor, patch, 0, ((0, 0),))
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_version(version):
+    """Get the comparison key of a version, with a cache.
+
+    Raises InvalidVersion (which is not cached).
+    """
+    m = _version.match(version)
+    if m is None:
+        raise InvalidVersion(version)
+    major, minor, patch, prerelease = m.groups()
+    return _key(
+        int(major, 10), int(minor, 10), int(patch, 10),
+        _prerelease_key(prerelease) if prerelease else (),
+    )
+
+
+def is_prerelease(key):
+    """Whether the version with this comparison key is a prerelease.
+    """
+    return key[3] == 0
+
+
+def _parse_partial(text):
+    # Parse a version where the minor and patch parts can be missing or
+    # wildcards, returns None for those
+    m = _partial.match(text)
+    if m is None:
+        raise InvalidRange(text)
+    parts = []
+    for part in m.group(1, 2, 3):
+        if part is None or part in ('x', 'X', '*') or None in parts:
+            parts.append(None)
+        else:
+            parts.append(int(part, 10))
+    major, minor, patch = parts
+    prerelease = ()
+    if patch is not None and m.group(4):
+        prerelease = _prerelease_key(m.group(4))
+    return major, minor, patch, prerelease
+
+
+def _upper(major, minor):
+    # Exclusive upper bound of a partial version
+    if minor is None:
+        return _floor(major + 1, 0, 0)
+    else:
+        return _floor(major, minor + 1, 0)
+
+
+def _primitive(op, text):
+    major, minor, patch, prerelease = _parse_partial(text)
+    if major is None:
+        if op in ('<', '>'):
+            # Nothing is allowed
+            return [('<', _floor(0, 0, 0))]
+        return []
+    if patch is not None:
+        return [(op or '=', _key(major, minor, patch, prerelease))]
+
+    lower = _key(major, minor or 0, 0)
+    if op in ('', '='):
+        return [('>=', lower), ('<', _upper(major, minor))]
+    elif op == '>=':
+        return [('>=', lower)]
+    elif op == '>':
+        if minor is None:
+            return [('>=', _key(major + 1, 0, 0))]
+        else:
+            return [('>=', _key(major, minor + 1, 0))]
+    elif op == '<':
+        return [('<', _floor(major, minor or 0, 0))]
+    else:  # '<='
+        return [('<', _upper(major, minor))]
+
+
+def _tilde(text):
+    # Allow patch-level changes, or minor-level if only the major is given
+    major, minor, patch, prerelease = _parse_partial(text)
+    if major is None:
+        return []
+    return [
+        ('>=', _key(major, minor or 0, patch or 0, prerelease)),
+        ('<', _upper(major, minor)),
+    ]
+
+
+def _caret(text):
+    # Allow changes that don't modify the left-most non-zero part
+    major, minor, patch, prerelease = _parse_partial(text)
+    if major is None:
+        return []
+    lower = ('>=', _key(major, minor or 0, patch or 0, prerelease))
+    if major or minor is None:
+        upper = _floor(major + 1, 0, 0)
+    elif minor or patch is None:
+        upper = _floor(0, minor + 1, 0)
+    else:
+        upper = _floor(0, 0, patch + 1)
+    return [lower, ('<', upper)]
+
+
+def _hyphen_range(first, last):
+    comparators = []
+    major, minor, patch, prerelease = _parse_partial(first)
+    if major is not None:
+        comparators.append(
+            ('>=', _key(major, minor or 0, patch or 0, prerelease)),
+        )
+    major, minor, patch, prerelease = _parse_partial(last)
+    if major is not None:
+        if patch is not None:
+            comparators.append(
+                ('<=', _key(major, minor, patch, prerelease)),
+            )
+        else:
+            comparators.append(('<', _upper(major, minor)))
+    return comparators
+
+
+def _compile_set(text):
+    text = _operator_space.sub(r'\1', text.strip())
+    parts = _hyphen.split(text)
+    if len(parts) == 2:
+        return tuple(_hyphen_range(*parts))
+    elif len(parts) > 2:
+        raise InvalidRange(text)
+
+    comparators = []
+    for token in text.split():
+        op, version = _comparator.match(token).groups()
+        if op == '^':
+            comparators.extend(_caret(version))
+        elif op in ('~', '~>'):
+            comparators.extend(_tilde(version))
+        else:
+            comparators.extend(_primitive(op or '', version))
+    return tuple(comparators)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_range(text):
+    """Parse a range, with a cache.
+
+    Returns the sets of comparators (a version matches the range if it matches
+    all the comparators of one of the sets), and the version string if the
+    range is an exact version (e.g. '1.2.0'), else None.
+
+    Raises InvalidRange, for example for dist-tags ('latest') or URLs.
+    """
+    sets = tuple(_compile_set(part) for part in text.split('||'))
+    pinned = None
+    if len(sets) == 1 and len(sets[0]) == 1 and sets[0][0][0] == '=':
+        pinned = text.strip().lstrip('v=').strip()
+    return sets, pinned
+
+
+def _match_set(comparators, key):
+    for op, bound in comparators:
+        if not _operators[op](key, bound):
+            return False
+    if is_prerelease(key):
+        # Prereleases only match if a comparator in the set is a prerelease
+        # of the same version, e.g. '>=1.2.0-beta' matches '1.2.0-rc', but
+        # not '1.3.0-rc'
+        for op, bound in comparators:
+            if is_prerelease(bound) and bound[:3] == key[:3]:
+                return True
+        return False
+    return True
+
+
+def match_range(sets, key):
+    """Whether a version matches a range from compile_range().
+
+    `key` is the comparison key from parse_version().
+    """
+    for comparators in sets:
+        if _match_set(comparators, key):
+            return True
+    return False
+
+
+def satisfies(version, text):
+    """Whether a version string matches a range string.
+
+    Invalid versions or ranges never match.
+    """
+    try:
+        sets, pinned = compile_range(text)
+        if pinned is not None and version == pinned:
+            return True
+        return match_range(sets, parse_version(version))
+    except (InvalidVersion, InvalidRange):
+        return False
@@ -1,37 +1,195 @@
 import aiohttp
-import bleach
+import asyncio
+import contextlib
 from datetime import datetime, timedelta
-import docutils.core
+import hashlib
+import json
 import logging
-import markdown
 from markupsafe import Markup
 import os
-from quart import Quart, render_template, redirect, url_for, request
+from quart import Quart, render_template, redirect, url_for, request, \
+    stream_with_context
 import sqlalchemy
 from sqlalchemy import and_, desc
 
 from .. import crypto
 from .. import database
-from ..decision import annotate_versions
+from ..decision import annotate_versions, compute_annotations, \
+    restore_annotation
+from .. import jobs
+from .. import migrations
 from .. import parse
+from .. import refresh
 from ..registries import get_registry, get_all_registry_names
-from ..registries.base import Package, PackageVersion
+from ..registries.base import Package, PackageNotFound, PackageNotModified, \
+    PackageVersion
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-MAX_AGE = timedelta(hours=6)
+# Set to 0 to disable the background refresher, e.g. on all but one worker
+BACKGROUND_REFRESH = os.environ.get('BACKGROUND_REFRESH', '1') != '0'
+
+# Maximum number of packages fetched from registries at the same time
+FETCH_CONCURRENCY = int(os.environ.get('FETCH_CONCURRENCY', '16'))
+# Maximum number of packages fetched from the same registry at the same time,
+# so that one large list can't starve fetches to other registries
+FETCH_CONCURRENCY_PER_HOST = int(
+    os.environ.get('FETCH_CONCURRENCY_PER_HOST', '8'),
+)
+
+# Settings for the HTTP client used to talk to registries
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '100'))
+HTTP_POOL_SIZE_PER_HOST = int(os.environ.get('HTTP_POOL_SIZE_PER_HOST', '20'))
+HTTP_DNS_CACHE_TTL = int(os.environ.get('HTTP_DNS_CACHE_TTL', '300'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '60'))
+
+# Number of workers processing background jobs (e.g. analyzing new lists) in
+# this process, set to 0 if they run elsewhere (`depreview worker`)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+
+# Packages that the registry doesn't have are not fetched again for that long
+NOT_FOUND_TTL = timedelta(minutes=30)
+# Number of those missing packages remembered
+NOT_FOUND_CACHE_SIZE = 10000
+
+# Limits on uploaded dependency lists
+LIST_MAX_SIZE = int(os.environ.get('LIST_MAX_SIZE', parse.MAX_SIZE))
+LIST_MAX_ENTRIES = int(os.environ.get('LIST_MAX_ENTRIES', parse.MAX_ENTRIES))
+# Number of items per INSERT when storing a list
+LIST_INSERT_BATCH_SIZE = 1000
 
 
 app = Quart(__name__)
+# Enough for two files (e.g. poetry.lock and pyproject.toml)
+app.config['MAX_CONTENT_LENGTH'] = 2 * LIST_MAX_SIZE + 65536
+
+
+# Number of threads running queries, defaults to the connection pool size
+DATABASE_THREADS = int(os.environ.get('DATABASE_THREADS', '0')) or None
+
+
+# Connects on first use, DATABASE_URL is only read then
+db = database.connect_async(
+    lambda: os.environ['DATABASE_URL'],
+    max_workers=DATABASE_THREADS,
+)
+
+
+# Shared HTTP client session, created when the app starts serving
+http = None
+
+
+@app.before_serving
+async def check_schema_version():
+    version = await db.run(migrations.get_version, db.sync_engine)
+    if version != len(migrations.MIGRATIONS):
+        logger.warning(
+            "Database schema is at version %s, latest is %d, run "
+            "'depreview db upgrade'",
+            version, len(migrations.MIGRATIONS),
+        )
+
+
+@app.before_serving
+async def open_http_session():
+    global http, _fetch_semaphore
+
+    # Fetch limits are bound to the event loop, start from new ones
+    _fetch_semaphore = None
+    _registry_semaphores.clear()
+
+    http = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_SIZE_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        ),
+        timeout=aiohttp.ClientTimeout(
+            total=HTTP_TIMEOUT,
+            sock_connect=HTTP_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+@app.before_serving
+async def start_background_refresh():
+    global _refresh_worker
+
+    if BACKGROUND_REFRESH:
+        _refresh_worker = asyncio.get_running_loop().create_task(
+            refresh.refresh_worker(db, refresh_packages),
+        )
+
+
+@app.before_serving
+async def start_job_workers():
+    jobs.start_workers(db, JOB_WORKERS)
+
+
+@app.after_serving
+async def stop_background_tasks():
+    global _refresh_worker
 
+    if _refresh_worker is not None:
+        _refresh_worker.cancel()
+        _refresh_worker = None
+    await jobs.stop_workers()
+    for task in list(_background_tasks):
+        task.cancel()
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
 
-db = database.connect(os.environ['DATABASE_URL'])
 
+@app.after_serving
+async def close_http_session():
+    global http
 
+    if http is not None:
+        await http.close()
+        http = None
+
+
+_fetch_semaphore = None
+_registry_semaphores = {}
+
+
+def fetch_limit(registry_obj):
+    """Get the semaphores limiting concurrent fetches from a registry.
+
+    The per-registry semaphore should be acquired first, so that we don't hold
+    a global slot while waiting for our turn on a busy registry.
+    """
+    global _fetch_semaphore
+
+    # Created lazily so they are bound to the running event loop
+    if _fetch_semaphore is None:
+        _fetch_semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    try:
+        registry_semaphore = _registry_semaphores[registry_obj.NAME]
+    except KeyError:
+        registry_semaphore = asyncio.Semaphore(FETCH_CONCURRENCY_PER_HOST)
+        _registry_semaphores[registry_obj.NAME] = registry_semaphore
+    return registry_semaphore, _fetch_semaphore
+
+
+@contextlib.asynccontextmanager
+async def fetch_slot(registry_obj):
+    """Wait for our turn to make a request to a registry.
+    """
+    registry_semaphore, global_semaphore = fetch_limit(registry_obj)
+    async with registry_semaphore, global_semaphore:
+        yield
+
+
+# The libraries rendering descriptions are slow to import, and only needed for
+# the package pages, so they are imported when first used
 def clean_html(html):
+    import bleach
+
     return bleach.clean(
         html,
         tags=[
@@ -46,8 +204,12 @@ def clean_html(html):
 
 def render_description(description, description_type):
     if description_type == 'text/markdown':
+        import markdown
+
         return clean_html(markdown.markdown(description))
     elif description_type == 'text/x-rst':
+        import docutils.core
+
         return clean_html(docutils.core.publish_parts(
             description,
             writer_name='html',
@@ -58,9 +220,76 @@ def render_description(description, description_type):
     )
 
 
+def description_hash(description, description_type):
+    h = hashlib.sha256()
+    h.update((description_type or '').encode('utf-8'))
+    h.update(b'\0')
+    h.update(description.encode('utf-8'))
+    return h.hexdigest()
+
+
+def list_content_hash(registry, list_format, items):
+    """Hash the normalized content of a dependency list.
+
+    Uploads of the same list get the same hash, whatever the order of the
+    dependencies in the file.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([registry, list_format]).encode('utf-8'))
+    for item in sorted(items, key=lambda i: i['norm_name']):
+        h.update(b'\n')
+        h.update(json.dumps([
+            item['norm_name'],
+            item['version'],
+            item['direct'],
+            item['depends_on'],
+        ]).encode('utf-8'))
+    return h.hexdigest()
+
+
+async def get_rendered_description(registry_obj, norm_name, package):
+    """Get the description as sanitized HTML, rendering it if not cached.
+    """
+    if not package.description:
+        return ''
+
+    key = description_hash(package.description, package.description_type)
+    cached = await db.first(
+        sqlalchemy.select([database.packages.c.description_html])
+        .select_from(database.packages)
+        .where(
+            database.packages.c.registry == registry_obj.NAME,
+            database.packages.c.norm_name == norm_name,
+            database.packages.c.description_hash == key,
+        )
+    )
+    if cached is not None and cached[0] is not None:
+        return cached[0]
+
+    # Render in a thread, this can take a while for long documents
+    loop = asyncio.get_running_loop()
+    html = await loop.run_in_executor(
+        None,
+        render_description,
+        package.description,
+        package.description_type,
+    )
+
+    await db.execute(
+        database.packages.update()
+        .values(description_html=html, description_hash=key)
+        .where(
+            database.packages.c.registry == registry_obj.NAME,
+            database.packages.c.norm_name == norm_name,
+        )
+    )
+
+    return html
+
+
 @app.get('/')
 async def index():
-    latest_changes = db.execute(
+    latest_changes = await db.execute(
         sqlalchemy.select([
             database.statements.c.created,
             database.statements.c.registry,
@@ -89,7 +318,7 @@ async def index():
     )
 
 
-@app.get('/p/<registry>/<name>')
+@app.get('/p/<registry>/<path:name>')
 async def package(registry, name):
     registry_obj = get_registry(registry)
     if registry_obj is None:
@@ -107,10 +336,16 @@ async def package(registry, name):
         )
     del name
 
-    package = await get_package(registry_obj, norm_name)
+    try:
+        package = await get_package(registry_obj, norm_name)
+    except PackageNotFound:
+        return await render_template(
+            'package_notfound.html',
+            error='No such package',
+        ), 404
 
     # Get the statements
-    statements = list(db.execute(
+    statements = await db.execute(
         sqlalchemy.select([
             database.statements.c.id,
             database.statements.c.type,
@@ -122,7 +357,7 @@ async def package(registry, name):
             database.statements.c.registry == registry,
             database.statements.c.norm_name == norm_name,
         )
-    ))
+    )
 
     # Annotate versions with whether they are outdated
     versions = annotate_versions(
@@ -136,9 +371,10 @@ async def package(registry, name):
         package=package,
         versions=versions,
         link=registry_obj.get_link(norm_name),
-        rendered_description=Markup(render_description(
-            package.description,
-            package.description_type,
+        rendered_description=Markup(await get_rendered_description(
+            registry_obj,
+            norm_name,
+            package,
         )),
     )
 
@@ -163,95 +399,172 @@ async def search_package():
     )
 
 
-@app.post('/upload-list')
-async def upload_list():
-    files = await request.files
-    all_dependencies = None
-    direct_dependencies = None
-    registry = list_format = None
+def read_list_files(registry_obj, list_format, files):
+    """Parse the uploaded files into the items of a dependency list.
+
+    Raises parse.UnknownFormat if they are invalid.
+    """
+    limits = dict(max_size=LIST_MAX_SIZE, max_entries=LIST_MAX_ENTRIES)
     # Note: use files.get(...) to check for files
     # If a file input was left empty, the dict is still populated, but the
     # FileStorage object is false-ish
-    try:
-        if 'poetry-lock' in files or 'pyproject-toml' in files:
-            # Python Poetry
-            registry = 'pypi'
-            list_format = 'poetry'
-            if files.get('poetry-lock'):
-                all_dependencies = parse.poetry_lock(
-                    files['poetry-lock'],
-                )
-            if files.get('pyproject-toml'):
-                direct_dependencies = parse.pyproject_toml(
-                    files['pyproject-toml'],
-                )
-            if not all_dependencies:
-                all_dependencies = direct_dependencies
-        elif 'requirements-txt' in files:
-            # Python requirements.txt
-            registry = 'pypi'
-            list_format = 'requirements.txt'
-            all_dependencies = parse.requirements_txt(
-                files['requirements-txt'],
+    direct_dependencies = None
+    if list_format == 'poetry':
+        if files.get('pyproject-toml'):
+            direct_dependencies = list(parse.pyproject_toml(
+                files['pyproject-toml'],
+                **limits,
+            ))
+        if files.get('poetry-lock'):
+            all_dependencies = parse.poetry_lock(
+                files['poetry-lock'],
+                **limits,
             )
         else:
-            return await render_template(
-                'list_invalid.html',
-                error='No files provided',
-            )
-    except parse.UnknownFormat as e:
-        return await render_template(
-            'list_invalid.html',
-            error=e.args[0],
+            all_dependencies = direct_dependencies
+    elif list_format in ('npm', 'yarn'):
+        if files.get('package-json'):
+            direct_dependencies = list(parse.package_json(
+                files['package-json'],
+                **limits,
+            ))
+        if files.get('npm-lock'):
+            if list_format == 'yarn':
+                lock_parser = parse.yarn_lock
+            else:
+                lock_parser = parse.package_lock_json
+            all_dependencies = lock_parser(files['npm-lock'], **limits)
+        else:
+            all_dependencies = direct_dependencies
+    else:
+        all_dependencies = parse.requirements_txt(
+            files['requirements-txt'],
+            **limits,
         )
-
-    # Normalize names
-    registry_obj = get_registry(registry)
-    if direct_dependencies is not None:
-        direct_dependencies = [
-            (registry_obj.normalize_name(name), version, depends_on)
-            for name, version, depends_on in direct_dependencies
-        ]
-    if all_dependencies is not None:
-        all_dependencies = [
-            (registry_obj.normalize_name(name), version, depends_on)
-            for name, version, depends_on in all_dependencies
-        ]
+    if all_dependencies is None:
+        raise parse.UnknownFormat('No files provided')
 
     if direct_dependencies is None:
         direct_dependency_names = None
     else:
         direct_dependency_names = {
-            name
+            registry_obj.normalize_name(name)
             for name, version, depends_on in direct_dependencies
         }
 
-    # Insert in the database
-    with db.begin() as trans:
+    def make_items(dependencies):
+        items = []
+        seen = set()
+        for dep_name, dep_version, depends_on in dependencies:
+            dep_name = registry_obj.normalize_name(dep_name)
+            # Keep the first one if a package is listed multiple times (e.g.
+            # locked to different versions for different platforms)
+            if dep_name in seen:
+                continue
+            seen.add(dep_name)
+            if direct_dependency_names is None:
+                direct = None  # We don't know
+            else:
+                direct = dep_name in direct_dependency_names
+            if depends_on is not None:
+                depends_on = '#'.join(depends_on)
+            items.append(dict(
+                norm_name=dep_name,
+                version=dep_version,
+                direct=direct,
+                depends_on=depends_on,
+            ))
+        return items
+
+    items = make_items(all_dependencies)
+    if not items and direct_dependencies:
+        items = make_items(direct_dependencies)
+    return items
+
+
+@app.post('/upload-list')
+async def upload_list():
+    files = await request.files
+    if 'poetry-lock' in files or 'pyproject-toml' in files:
+        # Python Poetry
+        registry = 'pypi'
+        list_format = 'poetry'
+    elif 'requirements-txt' in files:
+        # Python requirements.txt
+        registry = 'pypi'
+        list_format = 'requirements.txt'
+    elif 'npm-lock' in files or 'package-json' in files:
+        # Node, package-lock.json or yarn.lock
+        registry = 'npm'
+        if (
+            files.get('npm-lock')
+            and files['npm-lock'].filename.endswith('.lock')
+        ):
+            list_format = 'yarn'
+        else:
+            list_format = 'npm'
+    else:
+        return await render_template(
+            'list_invalid.html',
+            error='No files provided',
+        )
+    registry_obj = get_registry(registry)
+
+    # Parse in a thread, large files take a while
+    try:
+        items = await asyncio.get_running_loop().run_in_executor(
+            None,
+            read_list_files, registry_obj, list_format, files,
+        )
+    except parse.UnknownFormat as e:
+        return await render_template(
+            'list_invalid.html',
+            error=e.args[0],
+        )
+
+    content_hash = list_content_hash(registry, list_format, items)
+
+    # Insert in the database, unless we have the same list already
+    def find_list(trans):
+        row = trans.execute(
+            sqlalchemy.select([database.dependency_lists.c.id])
+            .where(database.dependency_lists.c.content_hash == content_hash)
+        ).first()
+        return row and row[0]
+
+    def insert_list(trans):
+        list_id = find_list(trans)
+        if list_id is not None:
+            return list_id
         list_id, = trans.execute(
             database.dependency_lists.insert()
             .values(
                 created=datetime.utcnow(),
                 registry=registry,
                 format=list_format,
+                content_hash=content_hash,
             )
         ).inserted_primary_key
-        for dep_name, dep_version, depends_on in all_dependencies:
-            if direct_dependency_names is None:
-                direct = None  # We don't know
-            else:
-                direct = dep_name in direct_dependency_names
-            depends_on = '#'.join(depends_on)
+        jobs.enqueue_job(trans, 'analyze_list', list_id, total=len(items))
+        for i in range(0, len(items), LIST_INSERT_BATCH_SIZE):
             trans.execute(
-                database.dependency_list_items.insert()
-                .values(
-                    list_id=list_id,
-                    norm_name=dep_name,
-                    version=dep_version,
-                    direct=direct,
-                    depends_on=depends_on,
-                )
+                database.dependency_list_items.insert(),
+                [
+                    dict(item, list_id=list_id)
+                    for item in items[i:i + LIST_INSERT_BATCH_SIZE]
+                ],
             )
+        return list_id
+
+    try:
+        list_id = await db.transaction(insert_list)
+    except sqlalchemy.exc.IntegrityError:
+        # The same list was inserted concurrently
+        list_id = await db.transaction(find_list)
+        if list_id is None:
+            raise
+    else:
+        jobs.wake_workers()
 
     return redirect(
         url_for('view_list', list_id=crypto.encode_id(list_id)),
@@ -266,8 +579,318 @@ async def view_list(list_id):
     except crypto.InvalidId:
         return await render_template('list_notfound.html'), 404
 
-    # Get packages from the database
-    rows = db.execute(
+    registry, list_format, deps = await get_list(list_id)
+    if registry is None:
+        return await render_template('list_notfound.html'), 404
+    registry_obj = get_registry(registry)
+
+    # If the list is still being analyzed, show the progress
+    job = await jobs.get_list_job(db, list_id)
+    if job is not None and job['status'] in ('queued', 'running'):
+        return await render_template(
+            'list_progress.html',
+            registry=registry,
+            format=list_format,
+            job=job,
+            refresh=jobs.POLL_INTERVAL,
+        )
+
+    annotations = await get_list_versions(list_id, registry_obj, deps)
+
+    # Refresh old packages in the background, they get served stale
+    now = datetime.utcnow()
+    for norm_name, (package, version, direct, depends_on) in deps.items():
+        refresh.record_access(registry_obj.NAME, norm_name)
+        if (
+            package is not None
+            and now - package.last_refresh > refresh.MAX_AGE
+        ):
+            schedule_refresh(registry_obj, package)
+
+    # Get missing packages from registry, in a batch
+    missing_packages = [
+        norm_name
+        for norm_name, (package, version, direct, depends_on) in deps.items()
+        if package is None
+    ]
+    # Packages that we failed to get, shown as such instead of missing
+    unavailable = set()
+    if missing_packages:
+        logger.info(
+            '%d packages not in database, getting from registry',
+            len(missing_packages),
+        )
+        async for norm_name, package in fetch_packages(
+            registry_obj, missing_packages,
+        ):
+            if isinstance(package, PackageNotFound):
+                # Shown as missing
+                continue
+            elif isinstance(package, Exception):
+                logger.warning(
+                    "Error getting package %r / %r: %r",
+                    registry_obj.NAME, norm_name, package,
+                )
+                unavailable.add(norm_name)
+                continue
+            _, version, direct, depends_on = deps[norm_name]
+            deps[norm_name] = package, version, direct, depends_on
+
+    tree_mode = is_tree(deps)
+    roots = get_roots(deps)
+
+    for (
+        norm_name,
+        (package, required_version, direct, depends_on)
+    ) in deps.items():
+        deps[norm_name] = (
+            package,
+            annotate_dependency(
+                registry_obj, package, required_version,
+                annotations.get(norm_name),
+            ),
+            required_version,
+            direct,
+            depends_on,
+        )
+
+    if tree_mode:
+        try:
+            max_depth = int(request.args['depth'], 10)
+        except (KeyError, ValueError):
+            max_depth = None
+        tree = build_tree(deps, roots, max_depth)
+
+        return await render_template(
+            'list_tree.html',
+            registry=registry,
+            format=list_format,
+            dependencies=tree,
+            unavailable=unavailable,
+            list_id=crypto.encode_id(list_id),
+            max_depth=max_depth,
+        )
+    else:
+        return await render_template(
+            'list.html',
+            registry=registry,
+            format=list_format,
+            dependencies=[
+                (norm_name,) + dep
+                for norm_name, dep in sorted(deps.items())
+            ],
+            unavailable=unavailable,
+        )
+
+
+def dependency_json(list_id, norm_name, dep):
+    package, required_version, direct, depends_on = dep
+    result = {
+        'name': norm_name,
+        'package': package.orig_name if package is not None else None,
+        'required_version': required_version,
+        'direct': direct,
+        'url': url_for('api_list_dependency', list_id=list_id, name=norm_name),
+    }
+    if depends_on:
+        result['dependencies'] = depends_on
+    return result
+
+
+def annotation_json(
+    registry_obj, norm_name, package, version, unavailable=False,
+):
+    result = {
+        'name': norm_name,
+        'package': None,
+        'link': None,
+        'version': None,
+        'status': None,
+        'message': None,
+    }
+    if package is None and unavailable:
+        result['status'] = 'unavailable'
+        result['message'] = 'could not be fetched from the registry'
+        return result
+    elif package is None:
+        result['status'] = 'not-found'
+        result['message'] = 'not found in the registry'
+        return result
+    result['package'] = package.orig_name
+    result['link'] = url_for(
+        'package',
+        registry=registry_obj.NAME,
+        name=package.orig_name,
+    )
+    if version is not None:
+        result['version'] = version.version
+        result['release_date'] = version.release_date.isoformat()
+        if version.status == 'ok':
+            result['status'] = 'ok'
+        else:
+            result['status'], result['message'] = version.status
+    return result
+
+
+@app.get('/api/list/<list_id>')
+async def api_list(list_id):
+    """Get the top level of a dependency list, without annotations.
+
+    The children of each node and its annotation can be obtained from the
+    node's URL, or for all nodes at once from the annotations URL.
+    """
+    encoded_id = list_id
+    try:
+        list_id = crypto.decode_id(list_id)
+    except crypto.InvalidId:
+        return {'error': 'List not found'}, 404
+
+    registry, list_format, deps = await get_list(list_id)
+    if registry is None:
+        return {'error': 'List not found'}, 404
+
+    if is_tree(deps):
+        names = get_roots(deps)
+    else:
+        names = sorted(deps)
+    job = await jobs.get_list_job(db, list_id)
+    if job is not None:
+        job = {
+            k: job[k]
+            for k in ('status', 'progress', 'total')
+        }
+    return {
+        'job': job,
+        'registry': registry,
+        'format': list_format,
+        'tree': is_tree(deps),
+        'size': len(deps),
+        'annotations_url': url_for('api_list_annotations', list_id=encoded_id),
+        'dependencies': [
+            dependency_json(encoded_id, norm_name, deps[norm_name])
+            for norm_name in names
+        ],
+    }
+
+
+@app.get('/api/list/<list_id>/deps/<path:name>')
+async def api_list_dependency(list_id, name):
+    """Get a node of a dependency list, with its annotation and children.
+    """
+    encoded_id = list_id
+    try:
+        list_id = crypto.decode_id(list_id)
+    except crypto.InvalidId:
+        return {'error': 'List not found'}, 404
+
+    registry, list_format, deps = await get_list(list_id)
+    if registry is None:
+        return {'error': 'List not found'}, 404
+    try:
+        dep = deps[name]
+    except KeyError:
+        return {'error': 'Dependency not found'}, 404
+    registry_obj = get_registry(registry)
+
+    try:
+        package = await get_package(registry_obj, name)
+    except PackageNotFound:
+        package = None
+    _, required_version, direct, depends_on = dep
+    result = annotation_json(
+        registry_obj,
+        name,
+        package,
+        annotate_dependency(registry_obj, package, required_version),
+    )
+    result['required_version'] = required_version
+    result['direct'] = direct
+    result['dependencies'] = [
+        dependency_json(encoded_id, norm_name, deps[norm_name])
+        for norm_name in depends_on
+        if norm_name in deps
+    ]
+    return result
+
+
+@app.get('/api/list/<list_id>/annotations')
+async def api_list_annotations(list_id):
+    """Stream the annotations of all the dependencies in a list.
+
+    The response is newline-delimited JSON, one annotation per line, sent as
+    they are computed. Packages we already have come first, then the ones
+    getting fetched from the registry, as they come in.
+    """
+    try:
+        list_id = crypto.decode_id(list_id)
+    except crypto.InvalidId:
+        return {'error': 'List not found'}, 404
+
+    registry, list_format, deps = await get_list(list_id)
+    if registry is None:
+        return {'error': 'List not found'}, 404
+    registry_obj = get_registry(registry)
+    annotations = {}
+
+    async def annotate(norm_name):
+        package, required_version, direct, depends_on = deps[norm_name]
+        if package is None:
+            try:
+                package = await load_package(registry_obj, norm_name)
+            except PackageNotFound:
+                pass
+            except Exception as e:
+                logger.warning(
+                    "Error getting package %r / %r: %r",
+                    registry_obj.NAME, norm_name, e,
+                )
+                return annotation_json(
+                    registry_obj, norm_name, None, None, unavailable=True,
+                )
+        return annotation_json(
+            registry_obj,
+            norm_name,
+            package,
+            annotate_dependency(
+                registry_obj, package, required_version,
+                annotations.get(norm_name),
+            ),
+        )
+
+    @stream_with_context
+    async def stream():
+        annotations.update(
+            await get_list_versions(list_id, registry_obj, deps),
+        )
+
+        now = datetime.utcnow()
+        missing = []
+        for norm_name, (package, _, _, _) in sorted(deps.items()):
+            refresh.record_access(registry_obj.NAME, norm_name)
+            if package is None:
+                missing.append(norm_name)
+                continue
+            if now - package.last_refresh > refresh.MAX_AGE:
+                schedule_refresh(registry_obj, package)
+            yield json.dumps(await annotate(norm_name)) + '\n'
+
+        for future in asyncio.as_completed([
+            annotate(norm_name) for norm_name in missing
+        ]):
+            yield json.dumps(await future) + '\n'
+
+    return stream(), 200, {'Content-Type': 'application/x-ndjson'}
+
+
+async def get_list(list_id):
+    """Get a dependency list from the database.
+
+    Returns `(registry, list_format, deps)`, where deps maps the names to
+    `(package, required_version, direct, depends_on)`. The packages don't have
+    their versions (see get_list_versions()), and are None if not in the
+    database. If the list doesn't exist, registry is None.
+    """
+    rows = await db.execute(
         sqlalchemy.select([
             database.dependency_lists.c.registry,
             database.dependency_list_items.c.norm_name,
@@ -277,6 +900,10 @@ async def view_list(list_id):
             database.packages.c.author,
             database.packages.c.description,
             database.packages.c.description_type,
+            database.packages.c.etag,
+            database.packages.c.last_modified,
+            database.packages.c.serial,
+            database.packages.c.next_refresh,
             database.dependency_lists.c.format,
             database.dependency_list_items.c.version,
             database.dependency_list_items.c.direct,
@@ -306,8 +933,8 @@ async def view_list(list_id):
     for row in rows:
         [
             registry, norm_name, orig_name, last_refresh, repository, author,
-            description, description_type,
-            list_format, version, direct, depends_on,
+            description, description_type, etag, last_modified, serial,
+            next_refresh, list_format, version, direct, depends_on,
         ] = row
         if orig_name is None:
             package = None
@@ -318,6 +945,10 @@ async def view_list(list_id):
                 description_type=description_type,
                 repository=repository,
                 last_refresh=last_refresh,
+                etag=etag,
+                last_modified=last_modified,
+                serial=serial,
+                next_refresh=next_refresh,
             )
         if depends_on:
             depends_on = depends_on.split('#')
@@ -325,17 +956,24 @@ async def view_list(list_id):
             depends_on = []
         deps[norm_name] = package, version, direct, depends_on
 
-    if registry is None:
-        return await render_template('list_notfound.html'), 404
-    registry_obj = get_registry(registry)
+    return registry, list_format, deps
+
+
+async def get_list_versions(list_id, registry_obj, deps):
+    """Fill in the versions of the packages from get_list().
 
-    # Fill in versions
-    rows = db.execute(
+    Returns the annotated versions of each package, from latest to oldest,
+    from the statuses stored in the database. Those that have expired are
+    computed again and stored.
+    """
+    rows = await db.execute(
         sqlalchemy.select([
             database.package_versions.c.norm_name,
             database.package_versions.c.version,
             database.package_versions.c.release_date,
             database.package_versions.c.yanked,
+            database.package_versions.c.status,
+            database.packages.c.annotations_expire,
         ])
         .select_from(
             database.dependency_list_items
@@ -344,121 +982,210 @@ async def view_list(list_id):
                 and_(
                     database.package_versions.c.norm_name
                     == database.dependency_list_items.c.norm_name,
-                    database.package_versions.c.registry == registry,
+                    database.package_versions.c.registry == registry_obj.NAME,
+                ),
+            )
+            .join(
+                database.packages,
+                and_(
+                    database.packages.c.norm_name
+                    == database.package_versions.c.norm_name,
+                    database.packages.c.registry
+                    == database.package_versions.c.registry,
                 ),
             )
         )
         .where(database.dependency_list_items.c.list_id == list_id)
+        .order_by(
+            database.dependency_list_items.c.norm_name,
+            database.package_versions.c.rank,
+        )
     )
+    now = datetime.utcnow()
+    annotations = {}
+    expired = set()
     for row in rows:
-        norm_name, version, release_date, yanked = row
-        deps[norm_name][0].versions[version] = PackageVersion(
+        norm_name, version, release_date, yanked, status, expire = row
+        if deps[norm_name][0] is None:
+            # Inserted since get_list(), the caller will load it
+            continue
+        version = PackageVersion(
             version,
             release_date=release_date,
             yanked=bool(yanked),
         )
-
-    # Get missing packages from registry
-    if logger.isEnabledFor(logging.INFO):
-        missing_packages = sum(1 for d in deps.values() if d[0] is None)
-        if missing_packages > 0:
-            logger.info(
-                '%d packages not in database, getting from registry',
-                missing_packages,
+        deps[norm_name][0].versions[version.version] = version
+        if status is None or (expire is not None and expire <= now):
+            expired.add(norm_name)
+        elif norm_name not in expired:
+            annotations.setdefault(norm_name, []).append(
+                restore_annotation(version, status, now),
             )
-    for norm_name, (package, version, direct, depends_on) in deps.items():
-        if package is None:
-            package = await load_package(registry_obj, norm_name)
-            deps[norm_name] = package, version, direct, depends_on
 
-    # TODO: Get statements
-    statements = []
+    if expired:
+        def update(trans):
+            for norm_name in expired:
+                annotations[norm_name] = _store_annotations(
+                    trans,
+                    registry_obj,
+                    norm_name,
+                    deps[norm_name][0].versions,
+                )
+
+        await db.transaction(update)
+
+    return annotations
+
+
+def _annotate_versions(registry_obj, norm_name, versions):
+    """Compute the annotations of a package's versions.
+
+    Returns the annotated versions, the time at which they expire, and the
+    rows for package_versions including their rank and status.
+    """
+    annotated, expires = compute_annotations(registry_obj, versions, [])
+    rows = [
+        dict(
+            registry=registry_obj.NAME,
+            norm_name=norm_name,
+            version=version.version,
+            release_date=version.release_date,
+            yanked=bool(version.yanked),
+            rank=rank,
+            status=(
+                version.status if version.status == 'ok'
+                else version.status[0]
+            ),
+        )
+        for rank, version in enumerate(annotated)
+    ]
+    return annotated, expires, rows
+
+
+def _store_annotations(trans, registry_obj, norm_name, versions):
+    annotated, expires, version_rows = _annotate_versions(
+        registry_obj, norm_name, versions,
+    )
+    database.upsert(
+        trans,
+        database.package_versions,
+        version_rows,
+        ['release_date', 'yanked', 'rank', 'status'],
+    )
+    trans.execute(
+        database.packages.update()
+        .values(annotations_expire=expires)
+        .where(
+            database.packages.c.registry == registry_obj.NAME,
+            database.packages.c.norm_name == norm_name,
+        )
+    )
+    return annotated
+
+
+def annotate_dependency(
+    registry_obj, package, required_version, annotated=None,
+):
+    """Get the version used by a dependency, annotated with its status.
+
+    `annotated` are the package's annotated versions, if already available.
+    Returns None if the version is not found, or the package doesn't exist.
+    """
+    if package is None:
+        return None
+    if annotated is None:
+        # TODO: Get statements
+        statements = []
 
-    for (
-        norm_name,
-        (package, required_version, direct, depends_on)
-    ) in deps.items():
-        # Annotate versions
         annotated = annotate_versions(
             registry_obj,
             package.versions,
             statements,
         )
 
-        # Find the one we want
-        version = None
-        for annotation in annotated:
-            if registry_obj.version_match_specifier(
-                annotation.version, required_version,
-            ):
-                # Grab the first one, they are in reverse order
-                version = annotation
-                break
+    # Find the one we want, they are in reverse order so this gets the
+    # latest matching version
+    return registry_obj.find_version(annotated, required_version)
 
-        deps[norm_name] = (
+
+def is_tree(deps):
+    """Whether the list should be shown as a tree.
+
+    That is the case if we have some direct and some indirect dependencies.
+    """
+    return (
+        any(d[2] is True for d in deps.values())
+        and any(d[2] is False for d in deps.values())
+    )
+
+
+def get_roots(deps):
+    return [
+        norm_name
+        for norm_name, dep in sorted(deps.items())
+        if dep[2] is True
+    ]
+
+
+def build_tree(deps, roots, max_depth=None):
+    """Build the dependency tree, expanding each package only once.
+
+    `deps` maps names to (package, version, required_version, direct,
+    depends_on). Returns a list of nodes, which are tuples:
+    (norm_name, package, version, required_version, children, kind)
+    where kind is one of:
+    * 'node': the package, with its dependencies as children
+    * 'ref': the package was already expanded elsewhere in the tree
+    * 'truncated': the dependencies were not expanded because of max_depth
+    """
+    expanded = set()
+
+    def render(norm_name, depth):
+        package, version, required_version, direct, depends_on = (
+            deps[norm_name]
+        )
+        depends_on = [n for n in depends_on if n in deps]
+        if not depends_on:
+            return norm_name, package, version, required_version, [], 'node'
+        if norm_name in expanded:
+            # Already shown (or a cycle), refer to it
+            return norm_name, package, version, required_version, [], 'ref'
+        if max_depth is not None and depth >= max_depth:
+            return (
+                norm_name, package, version, required_version, [],
+                'truncated',
+            )
+        expanded.add(norm_name)
+        return (
+            norm_name,
             package,
             version,
             required_version,
-            direct,
-            depends_on,
+            [render(n, depth + 1) for n in depends_on],
+            'node',
         )
 
-    # Format as tree if we have some direct and some indirect dependencies
-    if (
-        any(d[3] is True for d in deps.values())
-        and any(d[3] is False for d in deps.values())
-    ):
-        tree = []
-
-        def render(norm_name, seen):
-            # Avoid cycles
-            if norm_name in seen:
-                return
-            seen = set(seen)
-            seen.add(norm_name)
-
-            (
-                package,
-                version,
-                required_version,
-                direct,
-                depends_on,
-            ) = deps[norm_name]
-            return (
-                package,
-                version,
-                required_version,
-                [render(n, seen) for n in depends_on],
-            )
+    return [render(norm_name, 0) for norm_name in roots]
 
-        for norm_name, (package, version, required_version, direct, depends_on) in sorted(
-            deps.items(),
-            key=lambda p: p[0],
-        ):
-            if direct is True:
-                tree.append(render(norm_name, set()))
 
-        return await render_template(
-            'list_tree.html',
-            registry=registry,
-            format=list_format,
-            dependencies=tree,
-        )
-    else:
-        return await render_template(
-            'list.html',
-            registry=registry,
-            format=list_format,
-            dependencies=[
-                p[1]
-                for p in sorted(deps.items(), key=lambda p: p[0])
-            ],
-        )
+async def get_package(registry_obj, norm_name):
+    refresh.record_access(registry_obj.NAME, norm_name)
 
+    package = await get_package_from_db(registry_obj, norm_name)
 
-async def get_package(registry_obj, norm_name):
-    # Get from database
-    package = db.execute(
+    # If not in database, load from registry API
+    if package is None:
+        return await load_package(registry_obj, norm_name)
+
+    # If too old, serve it anyway but refresh it in the background
+    if datetime.utcnow() - package.last_refresh > refresh.MAX_AGE:
+        schedule_refresh(registry_obj, package)
+
+    return package
+
+
+async def get_package_from_db(registry_obj, norm_name):
+    package = await db.first(
         sqlalchemy.select([
             database.packages.c.orig_name,
             database.packages.c.last_refresh,
@@ -466,6 +1193,10 @@ async def get_package(registry_obj, norm_name):
             database.packages.c.author,
             database.packages.c.description,
             database.packages.c.description_type,
+            database.packages.c.etag,
+            database.packages.c.last_modified,
+            database.packages.c.serial,
+            database.packages.c.next_refresh,
         ])
         .select_from(database.packages)
         .where(
@@ -473,11 +1204,10 @@ async def get_package(registry_obj, norm_name):
             database.packages.c.norm_name == norm_name,
         )
         .limit(1)
-    ).first()
+    )
 
-    # If not in database, load from registry API
     if not package:
-        return await load_package(registry_obj, norm_name)
+        return None
 
     [
         orig_name,
@@ -486,9 +1216,13 @@ async def get_package(registry_obj, norm_name):
         author,
         description,
         description_type,
+        etag,
+        last_modified,
+        serial,
+        next_refresh,
     ] = package
 
-    versions = db.execute(
+    versions = await db.execute(
         sqlalchemy.select([
             database.package_versions.c.version,
             database.package_versions.c.release_date,
@@ -510,7 +1244,7 @@ async def get_package(registry_obj, norm_name):
         for version, release_date, yanked in versions
     }
 
-    package = Package(
+    return Package(
         registry_obj.NAME,
         orig_name,
         versions,
@@ -519,56 +1253,251 @@ async def get_package(registry_obj, norm_name):
         description_type=description_type,
         repository=repository,
         last_refresh=last_refresh,
+        etag=etag,
+        last_modified=last_modified,
+        serial=serial,
+        next_refresh=next_refresh,
     )
 
-    # If too old, refresh
-    if datetime.utcnow() - package.last_refresh > MAX_AGE:
-        package = await refresh_package(registry_obj, package)
 
-    return package
+# Fetches in progress, (registry, norm_name) -> task
+_inflight = {}
+
+# Packages missing from their registry, (registry, norm_name) -> expiry
+_not_found = {}
+
+
+def _is_not_found(key):
+    """Check whether a package was recently found to not exist.
+    """
+    expiry = _not_found.get(key)
+    if expiry is None:
+        return False
+    if expiry < datetime.utcnow():
+        del _not_found[key]
+        return False
+    return True
+
+
+def _set_not_found(key):
+    # Re-insert so the dict stays ordered by expiry
+    _not_found.pop(key, None)
+    _not_found[key] = datetime.utcnow() + NOT_FOUND_TTL
+    if len(_not_found) > NOT_FOUND_CACHE_SIZE:
+        del _not_found[next(iter(_not_found))]
+
+
+async def single_flight(key, func, *args):
+    """Run a coroutine function, or wait for the same call already running.
+
+    All the callers with the same key share the same call and get its result
+    (or exception). A caller getting cancelled doesn't cancel the call.
+    """
+    try:
+        task = _inflight[key]
+    except KeyError:
+        task = asyncio.get_running_loop().create_task(func(*args))
+        _add_inflight(key, task)
+    return await asyncio.shield(task)
+
+
+def _add_inflight(key, task):
+    _inflight[key] = task
+
+    def done(_):
+        if _inflight.get(key) is task:
+            del _inflight[key]
+        # Mark the exception as retrieved, the callers might all be gone
+        if not task.cancelled():
+            task.exception()
+
+    task.add_done_callback(done)
+
+
+async def fetch_packages(registry_obj, norm_names, old_packages=None):
+    """Load or refresh multiple packages, yielding them as they arrive.
+
+    Packages that are already being fetched are waited on, the others are
+    fetched in a batch with the registry's get_packages(). The packages in
+    `old_packages` (norm_name -> Package) are refreshed, the others are new.
+
+    Yields `(norm_name, package)`, where package is the exception if it could
+    not be fetched. New packages that were recently not found are not fetched
+    again, PackageNotFound is yielded right away.
+    """
+    if old_packages is None:
+        old_packages = {}
+
+    loop = asyncio.get_running_loop()
+    pending = {}
+    batch = {}
+    not_found = []
+    for norm_name in norm_names:
+        key = registry_obj.NAME, norm_name
+        if norm_name not in old_packages and _is_not_found(key):
+            not_found.append(norm_name)
+            continue
+        task = _inflight.get(key)
+        if task is None:
+            task = loop.create_future()
+            _add_inflight(key, task)
+            batch[norm_name] = task
+        pending[task] = norm_name
+
+    if batch:
+        # Not tied to the caller, others might be waiting on those packages
+        task = loop.create_task(
+            _fetch_batch(registry_obj, batch, old_packages),
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    for norm_name in not_found:
+        yield norm_name, PackageNotFound()
+
+    while pending:
+        done, _ = await asyncio.wait(
+            pending,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        for task in done:
+            try:
+                result = task.result()
+            except Exception as e:
+                result = e
+            yield pending.pop(task), result
+
+
+async def _fetch_batch(registry_obj, futures, old_packages):
+    logger.info(
+        "Fetching %d packages from %r...",
+        len(futures),
+        registry_obj.NAME,
+    )
+
+    validators = {
+        norm_name: (old_packages[norm_name].etag,
+                    old_packages[norm_name].last_modified)
+        for norm_name in futures
+        if norm_name in old_packages
+    }
+    try:
+        async for norm_name, package in registry_obj.get_packages(
+            list(futures), http,
+            validators=validators,
+            limit=lambda: fetch_slot(registry_obj),
+        ):
+            future = futures[norm_name]
+            try:
+                if isinstance(package, PackageNotModified):
+                    package = None
+                elif isinstance(package, PackageNotFound):
+                    if norm_name not in old_packages:
+                        _set_not_found((registry_obj.NAME, norm_name))
+                    raise package
+                elif isinstance(package, Exception):
+                    raise package
+                if norm_name in old_packages:
+                    package = await _store_refresh(
+                        registry_obj, norm_name,
+                        old_packages[norm_name], package,
+                    )
+                else:
+                    await db.transaction(
+                        _insert_package, registry_obj, norm_name, package,
+                    )
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(package)
+    except Exception as e:
+        # The whole batch failed, the waiters get the error
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(e)
+    finally:
+        for future in futures.values():
+            if not future.done():
+                future.cancel()
 
 
 async def load_package(registry_obj, norm_name):
+    if _is_not_found((registry_obj.NAME, norm_name)):
+        raise PackageNotFound
+    return await single_flight(
+        (registry_obj.NAME, norm_name),
+        _load_package, registry_obj, norm_name,
+    )
+
+
+async def _load_package(registry_obj, norm_name):
     logger.info(
         "Loading package %r / %r...",
         registry_obj.NAME,
         norm_name,
     )
 
-    async with aiohttp.ClientSession() as http:
-        package = await registry_obj.get_package(norm_name, http)
-
-    with db.begin() as trans:
-        trans.execute(
-            database.packages.insert()
-            .values(
-                registry=registry_obj.NAME,
-                norm_name=norm_name,
-                last_refresh=package.last_refresh,
-                orig_name=package.orig_name,
-                author=package.author,
-                description=package.description,
-                description_type=package.description_type,
-                repository=package.repository,
-            )
-        )
+    async with fetch_slot(registry_obj):
+        try:
+            package = await registry_obj.get_package(norm_name, http)
+        except PackageNotFound:
+            _set_not_found((registry_obj.NAME, norm_name))
+            raise
 
-        for num, version in package.versions.items():
-            trans.execute(
-                database.package_versions.insert()
-                .values(
-                    registry=registry_obj.NAME,
-                    norm_name=registry_obj.normalize_name(package.orig_name),
-                    version=num,
-                    release_date=version.release_date,
-                    yanked=bool(version.yanked),
-                )
-            )
+    await db.transaction(_insert_package, registry_obj, norm_name, package)
 
     return package
 
 
+def _insert_package(trans, registry_obj, norm_name, package):
+    _, expires, version_rows = _annotate_versions(
+        registry_obj, norm_name, package.versions,
+    )
+
+    # Use upserts, another process might have inserted the package meanwhile
+    database.upsert(
+        trans,
+        database.packages,
+        [dict(
+            registry=registry_obj.NAME,
+            norm_name=norm_name,
+            last_refresh=package.last_refresh,
+            orig_name=package.orig_name,
+            author=package.author,
+            description=package.description,
+            description_type=package.description_type,
+            repository=package.repository,
+            etag=package.etag,
+            last_modified=package.last_modified,
+            serial=package.serial,
+            annotations_expire=expires,
+            next_refresh=None,
+        )],
+        [
+            'last_refresh', 'orig_name', 'author', 'description',
+            'description_type', 'repository', 'etag', 'last_modified',
+            'serial', 'annotations_expire', 'next_refresh',
+        ],
+    )
+    database.upsert(
+        trans,
+        database.package_versions,
+        version_rows,
+        ['release_date', 'yanked', 'rank', 'status'],
+    )
+
+
 async def refresh_package(registry_obj, old_package):
+    return await single_flight(
+        (
+            registry_obj.NAME,
+            registry_obj.normalize_name(old_package.orig_name),
+        ),
+        _refresh_package, registry_obj, old_package,
+    )
+
+
+async def _refresh_package(registry_obj, old_package):
     logger.info(
         "Refreshing package %r / %r...",
         registry_obj.NAME,
@@ -577,43 +1506,227 @@ async def refresh_package(registry_obj, old_package):
 
     norm_name = registry_obj.normalize_name(old_package.orig_name)
 
-    async with aiohttp.ClientSession() as http:
-        new_package = await registry_obj.get_package(norm_name, http)
-
-    with db.begin() as trans:
-        # Update package data
-        update = {'last_refresh': new_package.last_refresh}
-        if new_package.orig_name != old_package.orig_name:
-            update['orig_name'] = new_package.orig_name
-        if new_package.author != old_package.author:
-            update['author'] = new_package.author
-        if new_package.description != old_package.description:
-            update['description'] = new_package.description
-        if new_package.description_type != old_package.description_type:
-            update['description_type'] = new_package.description_type
-        if new_package.repository != old_package.repository:
-            update['repository'] = new_package.repository
-        trans.execute(
+    try:
+        async with fetch_slot(registry_obj):
+            try:
+                new_package = await registry_obj.get_package(
+                    norm_name, http,
+                    etag=old_package.etag,
+                    last_modified=old_package.last_modified,
+                )
+            except PackageNotModified:
+                new_package = None
+    except Exception:
+        # Don't try again on every view
+        old_package.next_refresh = await refresh.record_failures(
+            db, registry_obj.NAME, [norm_name],
+        )
+        raise
+
+    return await _store_refresh(
+        registry_obj, norm_name, old_package, new_package,
+    )
+
+
+async def _store_refresh(registry_obj, norm_name, old_package, new_package):
+    """Update a package in the database after getting it again.
+
+    `new_package` is None if it wasn't modified. Returns the current package.
+    """
+    # The serial number changes with every change to a package (if the
+    # registry has one), we can skip the update if it's the same
+    if (
+        new_package is not None
+        and new_package.serial is not None
+        and new_package.serial == old_package.serial
+    ):
+        # Keep the new validators though, the old ones might not match anymore
+        old_package.etag = new_package.etag
+        old_package.last_modified = new_package.last_modified
+        new_package = None
+
+    if new_package is None:
+        # Nothing changed, only record that we checked
+        old_package.last_refresh = datetime.utcnow()
+        old_package.next_refresh = None
+        await db.execute(
             database.packages.update()
-            .values(**update)
+            .values(
+                last_refresh=old_package.last_refresh,
+                etag=old_package.etag,
+                last_modified=old_package.last_modified,
+                serial=old_package.serial,
+                next_refresh=None,
+            )
             .where(
                 database.packages.c.registry == registry_obj.NAME,
                 database.packages.c.norm_name == norm_name,
             )
         )
+        return old_package
 
-        # Update versions
-        for num, version in new_package.versions.items():
-            if num not in old_package.versions:
-                trans.execute(
-                    database.package_versions.insert()
-                    .values(
-                        registry=registry_obj.NAME,
-                        norm_name=norm_name,
-                        version=num,
-                        release_date=version.release_date,
-                        yanked=bool(version.yanked),
-                    )
-                )
+    await db.transaction(
+        _update_package, registry_obj, norm_name, old_package, new_package,
+    )
 
     return new_package
+
+
+def _update_package(trans, registry_obj, norm_name, old_package, new_package):
+    # Update package data
+    update = {
+        'last_refresh': new_package.last_refresh,
+        'etag': new_package.etag,
+        'last_modified': new_package.last_modified,
+        'serial': new_package.serial,
+        'next_refresh': None,
+    }
+    if new_package.orig_name != old_package.orig_name:
+        update['orig_name'] = new_package.orig_name
+    if new_package.author != old_package.author:
+        update['author'] = new_package.author
+    if new_package.description != old_package.description:
+        update['description'] = new_package.description
+    if new_package.description_type != old_package.description_type:
+        update['description_type'] = new_package.description_type
+    if 'description' in update or 'description_type' in update:
+        # Invalidate the rendered description
+        update['description_html'] = None
+        update['description_hash'] = None
+    if new_package.repository != old_package.repository:
+        update['repository'] = new_package.repository
+
+    # If versions are new or changed (e.g. got yanked), the rank and status
+    # of all of them are computed again
+    versions_changed = False
+    for num, version in new_package.versions.items():
+        old_version = old_package.versions.get(num)
+        if (
+            old_version is None
+            or old_version.release_date != version.release_date
+            or bool(old_version.yanked) != bool(version.yanked)
+        ):
+            versions_changed = True
+            break
+    if versions_changed:
+        _, update['annotations_expire'], version_rows = _annotate_versions(
+            registry_obj, norm_name, new_package.versions,
+        )
+
+    trans.execute(
+        database.packages.update()
+        .values(**update)
+        .where(
+            database.packages.c.registry == registry_obj.NAME,
+            database.packages.c.norm_name == norm_name,
+        )
+    )
+
+    if versions_changed:
+        database.upsert(
+            trans,
+            database.package_versions,
+            version_rows,
+            ['release_date', 'yanked', 'rank', 'status'],
+        )
+
+
+_background_tasks = set()
+_refresh_worker = None
+
+
+def schedule_refresh(registry_obj, package):
+    """Refresh a package in the background.
+
+    Does nothing if refreshing it failed recently.
+    """
+    if not refresh.can_refresh(package):
+        return
+
+    async def run():
+        try:
+            await refresh_package(registry_obj, package)
+        except PackageNotFound:
+            logger.warning(
+                "Package %r / %r not found in registry",
+                registry_obj.NAME,
+                package.orig_name,
+            )
+        except Exception:
+            logger.exception(
+                "Error refreshing package %r / %r",
+                registry_obj.NAME,
+                package.orig_name,
+            )
+
+    task = asyncio.get_running_loop().create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def refresh_packages(registry, norm_names):
+    """Refresh packages from the database, for the background refresher.
+    """
+    registry_obj = get_registry(registry)
+    if registry_obj is None:
+        return
+    old_packages = {}
+    for norm_name in norm_names:
+        package = await get_package_from_db(registry_obj, norm_name)
+        if package is not None:
+            old_packages[norm_name] = package
+    async for norm_name, package in fetch_packages(
+        registry_obj, list(old_packages), old_packages,
+    ):
+        yield norm_name, package
+
+
+@jobs.handler('analyze_list')
+async def analyze_list(list_id, set_progress):
+    """Get the missing packages of a list, and update their annotations.
+
+    Packages that can't be fetched are left for view_list() to try again.
+    """
+    registry, list_format, deps = await get_list(list_id)
+    if registry is None:
+        raise ValueError("List not found")
+    registry_obj = get_registry(registry)
+
+    # Computes the expired annotations again
+    await get_list_versions(list_id, registry_obj, deps)
+
+    missing = [
+        norm_name
+        for norm_name, (package, _, _, _) in deps.items()
+        if package is None
+    ]
+    progress = len(deps) - len(missing)
+    await set_progress(progress, total=len(deps))
+
+    last_update = datetime.utcnow()
+    async for norm_name, package in fetch_packages(registry_obj, missing):
+        progress += 1
+        if isinstance(package, Exception) and not isinstance(
+            package, PackageNotFound,
+        ):
+            logger.warning(
+                "Error getting package %r / %r: %r",
+                registry_obj.NAME, norm_name, package,
+            )
+        now = datetime.utcnow()
+        if now - last_update > timedelta(seconds=1):
+            last_update = now
+            await set_progress(progress)
+
+    await set_progress(progress)
+
+
+async def run_job_workers(count):
+    """Run job workers outside of the web server, until cancelled.
+    """
+    await open_http_session()
+    try:
+        await asyncio.gather(*jobs.start_workers(db, count))
+    finally:
+        await stop_background_tasks()
+        await close_http_session()
@@ -0,0 +1,141 @@
+import json
+import os
+import sqlalchemy
+import tarfile
+import tempfile
+import unittest
+
+from depreview import bulk_import
+from depreview import database
+from depreview import migrations
+from depreview.registries.python_pypi import PythonPyPI
+
+
+def make_document(name, versions):
+    return json.dumps({
+        'info': {
+            'name': name,
+            'author': 'someone',
+            'description': 'A package',
+            'description_content_type': 'text/markdown',
+            'home_page': 'https://github.com/someone/%s' % name,
+        },
+        'last_serial': 42,
+        'releases': {
+            version: [{
+                'upload_time_iso_8601': '%sT12:00:00.000000Z' % date,
+                'yanked': False,
+            }]
+            for version, date in versions
+        },
+    }).encode('utf-8')
+
+
+class TestBulkImport(unittest.TestCase):
+    def setUp(self):
+        self.engine = database.connect('sqlite://')
+        migrations.upgrade(self.engine)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        self.documents = [
+            ('Alpha', make_document('Alpha', [
+                ('1.0', '2020-01-01'), ('2.0', '2022-01-01'),
+            ])),
+            ('beta', make_document('beta', [('0.1', '2021-06-01')])),
+            ('broken', b'{"info": '),
+            ('gamma', make_document('gamma', [('3.0', '2022-05-01')])),
+        ]
+
+    def get_versions(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sqlalchemy.select([
+                    database.package_versions.c.norm_name,
+                    database.package_versions.c.version,
+                    database.package_versions.c.rank,
+                    database.package_versions.c.status,
+                ])
+                .order_by(
+                    database.package_versions.c.norm_name,
+                    database.package_versions.c.rank,
+                )
+            ).fetchall()
+
+    def test_directory(self):
+        for name, document in self.documents:
+            with open(os.path.join(self.tmp.name, name + '.json'), 'wb') as fp:
+                fp.write(document)
+
+        written, invalid = bulk_import.import_dump(
+            self.engine, PythonPyPI(), self.tmp.name, batch_size=2,
+        )
+        self.assertEqual((written, invalid), (3, 1))
+        self.assertEqual(
+            self.get_versions(),
+            [
+                ('alpha', '2.0', 0, 'ok'),
+                ('alpha', '1.0', 1, 'very-outdated'),
+                ('beta', '0.1', 0, 'ok'),
+                ('gamma', '3.0', 0, 'ok'),
+            ],
+        )
+        with self.engine.connect() as conn:
+            self.assertEqual(
+                conn.execute(
+                    sqlalchemy.select([
+                        database.packages.c.orig_name,
+                        database.packages.c.repository,
+                        database.packages.c.serial,
+                    ])
+                    .where(database.packages.c.norm_name == 'alpha')
+                ).fetchall(),
+                [('Alpha', 'https://github.com/someone/Alpha', 42)],
+            )
+
+        # Importing again doesn't overwrite, the data is not more recent
+        written, invalid = bulk_import.import_dump(
+            self.engine, PythonPyPI(), self.tmp.name,
+        )
+        self.assertEqual((written, invalid), (0, 1))
+
+    def test_resume(self):
+        jsonl = os.path.join(self.tmp.name, 'dump.jsonl')
+        with open(jsonl, 'wb') as fp:
+            for name, document in self.documents:
+                fp.write(document + b'\n')
+        state = os.path.join(self.tmp.name, 'state')
+        with open(state, 'w') as fp:
+            fp.write('2\n')
+
+        written, invalid = bulk_import.import_dump(
+            self.engine, PythonPyPI(), jsonl, state_path=state,
+        )
+        self.assertEqual((written, invalid), (1, 1))
+        self.assertEqual(
+            [row[0] for row in self.get_versions()],
+            ['gamma'],
+        )
+        self.assertFalse(os.path.exists(state))
+
+    def test_archive(self):
+        for name, document in self.documents:
+            with open(os.path.join(self.tmp.name, name + '.json'), 'wb') as fp:
+                fp.write(document)
+        archive = os.path.join(self.tmp.name, 'dump.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            for name, document in self.documents:
+                tar.add(
+                    os.path.join(self.tmp.name, name + '.json'),
+                    'dump/%s.json' % name,
+                )
+
+        self.assertEqual(
+            [
+                (position, name)
+                for position, name, date, chunks
+                in bulk_import.iter_documents(archive, 1)
+            ],
+            [(1, 'dump/beta.json'), (2, 'dump/broken.json'),
+             (3, 'dump/gamma.json')],
+        )
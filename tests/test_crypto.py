@@ -0,0 +1,36 @@
+import unittest
+
+from depreview import crypto
+
+
+class TestIds(unittest.TestCase):
+    def test_roundtrip(self):
+        encoded = crypto.encode_ids([0, 1, 42, 2 ** 64 - 1], 'sekrit')
+        self.assertEqual([len(e) for e in encoded], [22] * 4)
+        self.assertEqual(encoded[2], crypto.encode_id(42, 'sekrit'))
+        self.assertEqual(
+            crypto.decode_ids(encoded, 'sekrit'),
+            [0, 1, 42, 2 ** 64 - 1],
+        )
+        self.assertEqual(crypto.decode_id(encoded[2], 'sekrit'), 42)
+        with self.assertRaises(crypto.InvalidId):
+            crypto.decode_id(encoded[2], 'other')
+
+    def test_legacy(self):
+        # Encoded with TripleDES by previous versions
+        self.assertEqual(
+            crypto.decode_ids(
+                ['QDBXNO2LhEo', crypto.encode_id(7, 'sekrit'), 'Y_Tw8c-l53M'],
+                'sekrit',
+            ),
+            [42, 7, 1],
+        )
+
+    def test_invalid(self):
+        encoded = crypto.encode_id(42, 'sekrit')
+        for invalid in [
+            '', 'abc', 'A' * 22, encoded[:-1] + 'B', 'A' + encoded[1:],
+            '!' * 11, 'QDBXNO2LhEp',
+        ]:
+            with self.assertRaises(crypto.InvalidId):
+                crypto.decode_id(invalid, 'sekrit')
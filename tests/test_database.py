@@ -0,0 +1,104 @@
+from datetime import datetime
+import sqlalchemy
+import unittest
+from unittest import mock
+
+from depreview import database
+from depreview import migrations
+
+
+def package_row(norm_name, last_refresh, author, description):
+    return dict(
+        registry='pypi',
+        norm_name=norm_name,
+        orig_name=norm_name,
+        last_refresh=last_refresh,
+        author=author,
+        description=description,
+    )
+
+
+class TestUpsert(unittest.TestCase):
+    def setUp(self):
+        self.engine = database.connect('sqlite://')
+        migrations.upgrade(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(
+                database.packages.insert(),
+                [
+                    package_row('a', datetime(2020, 1, 1), 'old', 'old'),
+                    package_row('b', datetime(2020, 1, 1), 'old', 'old'),
+                ],
+            )
+
+    def upsert(self, conn):
+        database.upsert(
+            conn,
+            database.packages,
+            [
+                # Existing
+                package_row('b', datetime(2022, 1, 1), 'new', 'new'),
+                # New
+                package_row('c', datetime(2022, 1, 1), 'new', 'new'),
+                package_row('d', datetime(2022, 1, 1), 'new', 'new'),
+            ],
+            ['last_refresh', 'author'],
+        )
+
+    def check(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                sqlalchemy.select([
+                    database.packages.c.norm_name,
+                    database.packages.c.last_refresh,
+                    database.packages.c.author,
+                    database.packages.c.description,
+                ])
+                .order_by(database.packages.c.norm_name)
+            ).fetchall()
+        self.assertEqual(
+            [tuple(row) for row in rows],
+            [
+                ('a', datetime(2020, 1, 1), 'old', 'old'),
+                # Only the columns in update_columns got updated
+                ('b', datetime(2022, 1, 1), 'new', 'old'),
+                ('c', datetime(2022, 1, 1), 'new', 'new'),
+                ('d', datetime(2022, 1, 1), 'new', 'new'),
+            ],
+        )
+
+    def test_on_conflict(self):
+        statements = []
+        with self.engine.begin() as conn:
+            sqlalchemy.event.listen(
+                conn, 'before_cursor_execute',
+                lambda *args: statements.append(args[2]),
+            )
+            self.upsert(conn)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('ON CONFLICT', statements[0])
+        self.check()
+
+    def test_generic(self):
+        statements = []
+        with self.engine.begin() as conn:
+            sqlalchemy.event.listen(
+                conn, 'before_cursor_execute',
+                lambda *args: statements.append(args[2]),
+            )
+            with mock.patch.object(conn.dialect, 'name', 'other'):
+                self.upsert(conn)
+        self.assertFalse(any('ON CONFLICT' in stmt for stmt in statements))
+        self.check()
+
+    def test_empty(self):
+        with self.engine.begin() as conn:
+            database.upsert(conn, database.packages, [], ['author'])
+        with self.engine.connect() as conn:
+            self.assertEqual(
+                conn.execute(
+                    sqlalchemy.select([sqlalchemy.func.count()])
+                    .select_from(database.packages)
+                ).scalar(),
+                2,
+            )
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import unittest
+
+from depreview.decision import annotate_versions, compute_annotations, \
+    restore_annotation
+from depreview.registries.base import PackageVersion
+from depreview.registries.python_pypi import PythonPyPI
+
+
+class TestAnnotate(unittest.TestCase):
+    def test_annotate_versions(self):
+        now = datetime.utcnow()
+
+        def version(num, days, yanked=False):
+            return num, PackageVersion(
+                num,
+                release_date=now - timedelta(days=days),
+                yanked=yanked,
+            )
+
+        versions = dict([
+            version('2.0rc1', 1),
+            version('1.10', 40),
+            version('1.9', 50, yanked=True),
+            version('1.2', 100),
+            version('1.1', 200),
+        ])
+        result = annotate_versions(PythonPyPI(), versions, [])
+        self.assertEqual(
+            [(v.version, v.status[0] if v.status != 'ok' else 'ok')
+             for v in result],
+            [
+                ('2.0rc1', 'ok'),
+                ('1.10', 'ok'),
+                ('1.9', 'yanked'),
+                ('1.2', 'very-outdated'),
+                ('1.1', 'very-outdated'),
+            ],
+        )
+        # Comparison keys got cached on the versions
+        self.assertIsNotNone(versions['1.10'].sort_key)
+
+    def test_annotations_expire(self):
+        now = datetime(2022, 6, 1)
+        versions = {
+            num: PackageVersion(
+                num,
+                release_date=now - timedelta(days=days),
+                yanked=False,
+            )
+            for num, days in [('1.2', 40), ('1.1', 80), ('1.0', 200)]
+        }
+        annotated, expires = compute_annotations(
+            PythonPyPI(), versions, [], now,
+        )
+        self.assertEqual(
+            [v.status if v.status == 'ok' else v.status[0] for v in annotated],
+            ['ok', 'outdated', 'very-outdated'],
+        )
+        # 1.1 becomes very outdated in 11 days
+        self.assertEqual(expires, now + timedelta(days=11))
+
+        restored = restore_annotation(versions['1.0'], 'very-outdated', now)
+        self.assertEqual(restored.status, annotated[2].status)
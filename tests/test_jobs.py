@@ -0,0 +1,198 @@
+import asyncio
+from datetime import datetime, timedelta
+import os
+import sqlalchemy
+import tempfile
+import unittest
+from unittest import mock
+
+from depreview import database
+from depreview import jobs
+from depreview import migrations
+
+
+class JobsTestCase(unittest.TestCase):
+    def setUp(self):
+        # A file, so that each claimant gets its own connection
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.engine = database.connect(
+            'sqlite:///' + os.path.join(tmp.name, 'jobs.db'),
+        )
+        self.addCleanup(self.engine.dispose)
+        migrations.upgrade(self.engine)
+
+        with self.engine.begin() as trans:
+            for list_id in (1, 2):
+                trans.execute(
+                    database.dependency_lists.insert()
+                    .values(
+                        id=list_id,
+                        created=datetime.utcnow(),
+                        registry='pypi',
+                        format='requirements.txt',
+                        content_hash='hash%d' % list_id,
+                    )
+                )
+                jobs.enqueue_job(trans, 'analyze_list', list_id)
+
+    def get_jobs(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sqlalchemy.select([
+                    database.jobs.c.list_id,
+                    database.jobs.c.status,
+                    database.jobs.c.attempts,
+                ])
+                .order_by(database.jobs.c.id)
+            ).fetchall()
+
+
+class TestClaimJob(JobsTestCase):
+    def test_sequential(self):
+        with self.engine.begin() as trans:
+            job1 = jobs._claim_job(trans)
+        with self.engine.begin() as trans:
+            job2 = jobs._claim_job(trans)
+        with self.engine.begin() as trans:
+            self.assertIsNone(jobs._claim_job(trans))
+
+        self.assertEqual(job1[1:], ('analyze_list', 1))
+        self.assertEqual(job2[1:], ('analyze_list', 2))
+        self.assertEqual(
+            self.get_jobs(),
+            [(1, 'running', 1), (2, 'running', 1)],
+        )
+
+    def test_concurrent(self):
+        """Another worker claims the first job between our SELECT and UPDATE.
+        """
+        engine = self.engine
+        other_job = []
+
+        class Interleaved(object):
+            def __init__(self, trans):
+                self.trans = trans
+                self.first = True
+
+            def execute(self, *args):
+                result = self.trans.execute(*args)
+                if self.first:
+                    self.first = False
+                    rows = result.fetchall()
+                    with engine.begin() as other_trans:
+                        other_job.append(jobs._claim_job(other_trans))
+                    return FakeResult(rows)
+                return result
+
+        class FakeResult(object):
+            def __init__(self, rows):
+                self.rows = rows
+
+            def fetchall(self):
+                return self.rows
+
+        with self.engine.begin() as trans:
+            job = jobs._claim_job(Interleaved(trans))
+
+        # Each job was taken once
+        self.assertEqual(other_job[0][2], 1)
+        self.assertEqual(job[2], 2)
+        self.assertEqual(
+            self.get_jobs(),
+            [(1, 'running', 1), (2, 'running', 1)],
+        )
+
+    def test_abandoned(self):
+        with self.engine.begin() as trans:
+            trans.execute(
+                database.jobs.update()
+                .values(
+                    status='running',
+                    attempts=jobs.MAX_ATTEMPTS,
+                    started=datetime.utcnow() - timedelta(days=1),
+                )
+                .where(database.jobs.c.list_id == 1)
+            )
+        with self.engine.begin() as trans:
+            job = jobs._claim_job(trans)
+
+        # The first job was given up on
+        self.assertEqual(job[2], 2)
+        self.assertEqual(
+            self.get_jobs(),
+            [
+                (1, 'failed', jobs.MAX_ATTEMPTS + 1),
+                (2, 'running', 1),
+            ],
+        )
+
+    def test_heartbeat(self):
+        # Claimed a while ago, but still making progress
+        with self.engine.begin() as trans:
+            jobs._claim_job(trans)
+            trans.execute(
+                database.jobs.update()
+                .values(
+                    started=datetime.utcnow() - timedelta(hours=1),
+                    heartbeat=datetime.utcnow() - timedelta(minutes=1),
+                )
+                .where(database.jobs.c.list_id == 1)
+            )
+        with self.engine.begin() as trans:
+            self.assertEqual(jobs._claim_job(trans)[2], 2)
+        with self.engine.begin() as trans:
+            self.assertIsNone(jobs._claim_job(trans))
+
+        # Stopped making progress
+        with self.engine.begin() as trans:
+            trans.execute(
+                database.jobs.update()
+                .values(heartbeat=datetime.utcnow() - timedelta(hours=1))
+                .where(database.jobs.c.list_id == 1)
+            )
+        with self.engine.begin() as trans:
+            self.assertEqual(jobs._claim_job(trans)[2], 1)
+        self.assertEqual(
+            self.get_jobs(),
+            [(1, 'running', 2), (2, 'running', 1)],
+        )
+
+
+class TestRunJob(JobsTestCase):
+    def get_heartbeat(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sqlalchemy.select([database.jobs.c.heartbeat])
+                .where(database.jobs.c.list_id == 1)
+            ).scalar()
+
+    def test_progress(self):
+        db = database.AsyncEngine(self.engine, max_workers=1)
+        heartbeats = []
+
+        async def handler(list_id, set_progress):
+            await set_progress(0, total=2)
+            heartbeats.append(self.get_heartbeat())
+            await asyncio.sleep(0.01)
+            await set_progress(1)
+            heartbeats.append(self.get_heartbeat())
+
+        with mock.patch.dict(jobs._handlers, {'analyze_list': handler}):
+            with self.engine.begin() as trans:
+                job = jobs._claim_job(trans)
+            asyncio.run(jobs.run_job(db, *job))
+
+        self.assertLess(heartbeats[0], heartbeats[1])
+        with self.engine.connect() as conn:
+            self.assertEqual(
+                tuple(conn.execute(
+                    sqlalchemy.select([
+                        database.jobs.c.status,
+                        database.jobs.c.progress,
+                        database.jobs.c.total,
+                    ])
+                    .where(database.jobs.c.list_id == 1)
+                ).first()),
+                ('done', 1, 2),
+            )
@@ -0,0 +1,86 @@
+import json
+import unittest
+
+from depreview.jsonstream import ObjectStreamParser
+
+
+DOCUMENT = json.dumps({
+    'info': {'name': 'pkg', 'description': 'café ' * 50},
+    'last_serial': 123456,
+    'releases': {
+        '1.0': [{'yanked': False}],
+        '2.0': [],
+    },
+    'urls': [],
+}).encode('utf-8')
+
+
+class TestObjectStream(unittest.TestCase):
+    def parse(self, chunk_size):
+        parser = ObjectStreamParser(expand=('releases',))
+        result = []
+        for i in range(0, len(DOCUMENT), chunk_size):
+            result.extend(parser.feed(DOCUMENT[i:i + chunk_size]))
+        result.extend(parser.close())
+        return result
+
+    def test_chunks(self):
+        expected = [
+            (('info',), {'name': 'pkg', 'description': 'café ' * 50}),
+            (('last_serial',), 123456),
+            (('releases', '1.0'), [{'yanked': False}]),
+            (('releases', '2.0'), []),
+            (('urls',), []),
+        ]
+        # Includes splitting multi-byte characters and numbers
+        for chunk_size in (1, 3, 7, 64, len(DOCUMENT)):
+            self.assertEqual(self.parse(chunk_size), expected)
+
+    def test_numbers(self):
+        document = b'{"a": 12.5, "b": 12e3, "c": -0.25E-2, "d": 7, "e": 3}'
+        expected = [
+            (('a',), 12.5),
+            (('b',), 12e3),
+            (('c',), -0.25E-2),
+            (('d',), 7),
+            (('e',), 3),
+        ]
+        # Split at every position
+        for i in range(len(document)):
+            parser = ObjectStreamParser()
+            result = parser.feed(document[:i])
+            result.extend(parser.feed(document[i:]))
+            result.extend(parser.close())
+            self.assertEqual(result, expected)
+
+        # One byte at a time
+        parser = ObjectStreamParser()
+        result = []
+        for i in range(len(document)):
+            result.extend(parser.feed(document[i:i + 1]))
+        result.extend(parser.close())
+        self.assertEqual(result, expected)
+
+        parser = ObjectStreamParser()
+        self.assertEqual(parser.feed(b'{"a": 12.'), [])
+        self.assertEqual(
+            parser.feed(b'5, "b": 1}'),
+            [(('a',), 12.5), (('b',), 1)],
+        )
+        self.assertEqual(parser.close(), [])
+
+        parser = ObjectStreamParser()
+        self.assertEqual(parser.feed(b'{"a": 12e'), [])
+        self.assertEqual(parser.feed(b'3}'), [(('a',), 12e3)])
+        self.assertEqual(parser.close(), [])
+
+    def test_truncated(self):
+        parser = ObjectStreamParser()
+        parser.feed(DOCUMENT[:-10])
+        with self.assertRaises(ValueError):
+            parser.close()
+
+    def test_not_object(self):
+        parser = ObjectStreamParser()
+        with self.assertRaises(ValueError):
+            parser.feed(b'[1, 2]')
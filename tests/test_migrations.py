@@ -0,0 +1,157 @@
+from datetime import datetime
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+import unittest
+from unittest import mock
+
+from depreview import database
+from depreview import migrations
+
+
+class TestMigrations(unittest.TestCase):
+    def test_empty(self):
+        engine = database.connect('sqlite://')
+        self.assertIsNone(migrations.get_version(engine))
+        self.assertEqual(migrations.upgrade(engine), ['initial'])
+        self.assertEqual(
+            migrations.get_version(engine),
+            len(migrations.MIGRATIONS),
+        )
+        self.assertEqual(migrations.check(engine), [])
+        self.assertEqual(migrations.upgrade(engine), [])
+
+    def test_upgrade(self):
+        engine = database.connect('sqlite://')
+
+        # Tables from before migrations were introduced
+        database.metadata.create_all(engine, tables=[
+            database.users,
+            database.reviews,
+            database.dependency_list_items,
+        ])
+        with engine.begin() as conn:
+            conn.execute(
+                'CREATE TABLE packages ('
+                ' registry VARCHAR NOT NULL, norm_name VARCHAR NOT NULL,'
+                ' last_refresh DATETIME NOT NULL, orig_name VARCHAR NOT NULL,'
+                ' author VARCHAR, description VARCHAR,'
+                ' description_type VARCHAR, repository VARCHAR,'
+                ' PRIMARY KEY (registry, norm_name))'
+            )
+            conn.execute(
+                'CREATE TABLE package_versions ('
+                ' registry VARCHAR NOT NULL, norm_name VARCHAR NOT NULL,'
+                ' version VARCHAR NOT NULL, release_date DATETIME NOT NULL,'
+                ' yanked BOOLEAN NOT NULL,'
+                ' PRIMARY KEY (registry, norm_name, version))'
+            )
+            conn.execute(
+                'CREATE TABLE statements ('
+                ' id INTEGER NOT NULL PRIMARY KEY, registry VARCHAR,'
+                ' norm_name VARCHAR, user_id INTEGER NOT NULL,'
+                ' type VARCHAR NOT NULL, proof VARCHAR NOT NULL,'
+                ' created DATETIME NOT NULL, trust INTEGER NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE dependency_lists ('
+                ' id INTEGER NOT NULL PRIMARY KEY, created DATETIME NOT NULL,'
+                ' registry VARCHAR NOT NULL, format VARCHAR NOT NULL)'
+            )
+            conn.execute(
+                database.packages.insert().values(
+                    registry='pypi',
+                    norm_name='reprozip',
+                    last_refresh=datetime(2022, 10, 1),
+                    orig_name='reprozip',
+                ),
+            )
+
+        self.assertEqual(migrations.get_version(engine), 0)
+        self.assertIn(
+            'Missing column packages.etag',
+            migrations.check(engine),
+        )
+
+        self.assertEqual(
+            migrations.upgrade(engine, 2),
+            ['add_description_cache', 'add_conditional_request_validators'],
+        )
+        self.assertEqual(migrations.get_version(engine), 2)
+        self.assertEqual(
+            migrations.upgrade(engine),
+            [
+                'add_precomputed_annotations',
+                'add_query_indexes',
+                'add_list_content_hash',
+                'add_jobs',
+                'add_refresh_retry',
+                'add_job_heartbeat',
+            ],
+        )
+        self.assertEqual(migrations.check(engine), [])
+
+        # Data is still there
+        with engine.connect() as conn:
+            self.assertEqual(
+                conn.execute(
+                    sqlalchemy.select([database.packages.c.orig_name]),
+                ).fetchall(),
+                [('reprozip',)],
+            )
+
+        with self.assertRaises(migrations.MigrationError):
+            migrations.upgrade(engine, 1)
+
+    def test_check_invalid_index(self):
+        engine = database.connect('sqlite://')
+        migrations.upgrade(engine)
+        with mock.patch.object(
+            migrations, '_invalid_indexes',
+            return_value={'ix_jobs_status'},
+        ):
+            self.assertEqual(
+                migrations.check(engine),
+                ['Invalid index ix_jobs_status'],
+            )
+
+
+class TestCreateIndex(unittest.TestCase):
+    def test_postgresql(self):
+        index, = [
+            idx for idx in database.packages.indexes
+            if idx.name == 'ix_packages_last_refresh'
+        ]
+
+        class Connection(object):
+            dialect = postgresql.dialect()
+
+            def __init__(self, invalid):
+                self.invalid = invalid
+                self.executed = []
+
+            def execute(self, sql):
+                self.executed.append(sql)
+                if sql.startswith('SELECT'):
+                    return [(name,) for name in self.invalid]
+
+        conn = Connection([])
+        migrations.create_index(conn, index)
+        self.assertEqual(
+            conn.executed[1:],
+            [
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                'ix_packages_last_refresh ON packages (last_refresh)',
+            ],
+        )
+
+        # Left invalid by an interrupted attempt
+        conn = Connection(['ix_packages_last_refresh'])
+        migrations.create_index(conn, index)
+        self.assertEqual(
+            conn.executed[1:],
+            [
+                'DROP INDEX CONCURRENTLY IF EXISTS ix_packages_last_refresh',
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                'ix_packages_last_refresh ON packages (last_refresh)',
+            ],
+        )
@@ -0,0 +1,114 @@
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import asyncio
+from datetime import datetime
+import json
+import unittest
+
+from depreview.registries.base import PackageNotFound, PackageNotModified, \
+    PackageVersion
+from depreview.registries.node_npm import NodeNPM
+
+
+DOCUMENT = {
+    '_id': '@scope/pkg',
+    'name': '@scope/pkg',
+    'dist-tags': {'latest': '1.1.0'},
+    'versions': {
+        '1.0.0': {'name': '@scope/pkg', 'version': '1.0.0'},
+        '1.1.0-beta.1': {'name': '@scope/pkg', 'version': '1.1.0-beta.1'},
+        '1.1.0': {
+            'name': '@scope/pkg',
+            'version': '1.1.0',
+            'deprecated': 'Use 1.2.0',
+        },
+        'bad': {'name': '@scope/pkg', 'version': 'bad'},
+    },
+    'time': {
+        'created': '2022-01-01T00:00:00.000Z',
+        'modified': '2022-05-01T00:00:00.000Z',
+        '1.0.0': '2022-01-01T00:00:00.000Z',
+        '1.1.0-beta.1': '2022-03-01T00:00:00.000Z',
+        '1.1.0': '2022-05-01T00:00:00.000Z',
+        'bad': '2022-05-01T00:00:00.000Z',
+    },
+    'author': {'name': 'Someone', 'email': 'someone@example.org'},
+    'repository': {'type': 'git', 'url': 'git+https://github.com/a/pkg.git'},
+    'description': 'A package',
+    'readme': '# pkg',
+}
+
+
+class TestVersions(unittest.TestCase):
+    def test_find_version(self):
+        npm = NodeNPM()
+        versions = [
+            PackageVersion(num, release_date=datetime(2022, 1, 1), yanked=False)
+            for num in ['2.0.0', '1.10.0', '1.2.0-rc.1', '1.2.0', 'bad']
+        ]
+        self.assertEqual(npm.find_version(versions, '1.2.0').version, '1.2.0')
+        self.assertEqual(npm.find_version(versions, '^1.2').version, '1.10.0')
+        self.assertEqual(npm.find_version(versions, '<1.10').version, '1.2.0')
+        self.assertEqual(
+            npm.find_version(versions, '>=1.2.0-rc.0 <1.10').version,
+            '1.2.0-rc.1',
+        )
+        self.assertIsNone(npm.find_version(versions, '3.0.0'))
+        self.assertIsNone(npm.find_version(versions, 'latest'))
+        self.assertTrue(npm.is_prerelease('1.2.0-rc.1'))
+        self.assertFalse(npm.is_prerelease('1.2.0'))
+
+
+class TestGetPackage(unittest.TestCase):
+    def test_get_package(self):
+        paths = []
+
+        async def handler(request):
+            paths.append(request.raw_path)
+            if request.raw_path != '/@scope%2Fpkg':
+                return web.Response(status=404)
+            elif request.headers.get('If-None-Match') == '"v1"':
+                return web.Response(status=304)
+            return web.Response(
+                body=json.dumps(DOCUMENT).encode('utf-8'),
+                content_type='application/json',
+                headers={'ETag': '"v1"'},
+            )
+
+        registry = NodeNPM()
+
+        async def test():
+            app = web.Application()
+            app.router.add_get('/{name:.*}', handler)
+            async with TestServer(app) as server, \
+                    aiohttp.ClientSession() as http:
+                registry.REGISTRY_URL = str(server.make_url(''))
+                package = await registry.get_package('@scope/pkg', http)
+                with self.assertRaises(PackageNotModified):
+                    await registry.get_package(
+                        '@scope/pkg', http, etag=package.etag,
+                    )
+                with self.assertRaises(PackageNotFound):
+                    await registry.get_package('missing', http)
+                return package
+
+        package = asyncio.run(test())
+        self.assertEqual(paths, ['/@scope%2Fpkg', '/@scope%2Fpkg', '/missing'])
+        self.assertEqual(package.orig_name, '@scope/pkg')
+        self.assertEqual(package.etag, '"v1"')
+        self.assertEqual(package.author, 'Someone')
+        self.assertEqual(package.repository, 'https://github.com/a/pkg.git')
+        self.assertEqual(package.description, '# pkg')
+        self.assertEqual(package.description_type, 'text/markdown')
+        self.assertEqual(
+            sorted(
+                (v.version, v.release_date, v.yanked)
+                for v in package.versions.values()
+            ),
+            [
+                ('1.0.0', datetime(2022, 1, 1), False),
+                ('1.1.0', datetime(2022, 5, 1), True),
+                ('1.1.0-beta.1', datetime(2022, 3, 1), False),
+            ],
+        )
@@ -6,14 +6,14 @@ from depreview import parse
 
 class TestParse(unittest.TestCase):
     def test_pyproject(self):
-        result = parse.pyproject_toml(BytesIO(
+        result = list(parse.pyproject_toml(BytesIO(
             b'[tool.poetry]\nname = "depreview"\nversion = "0.1.0"\n\n'
             + b'[tool.poetry.dependencies]\n'
             + b'aiofiles = "^22.1.2"\naiohttp = "*"\n'
             + b'aiosignal = "=1.2.0"\nattrs = "~22.1.2"\n'
             + b'\n[build-system]\nrequires = ["poetry-core"]\n'
             + b'build-backend = "poetry.core.masonry.api"\n'
-        ))
+        )))
         self.assertEqual(
             result,
             [
@@ -25,13 +25,13 @@ class TestParse(unittest.TestCase):
         )
 
     def test_poetry_lock(self):
-        result = parse.poetry_lock(BytesIO(
+        result = list(parse.poetry_lock(BytesIO(
             b'[[package]]\nname = "aiofiles"\nversion = "22.1.0"\n\n'
             + b'[[package]]\nname = "aiohttp"\nversion = "3.8.3"\n\n'
             + b'[package.dependencies]\naiosignal = ">=1.1.2"\n'
             + b'[metadata]\nlock-version = "1.1"\n\n'
             + b'[metadata.files]\naiofiles = []\naiohttp = []\n'
-        ))
+        )))
         self.assertEqual(
             result,
             [
@@ -41,14 +41,14 @@ class TestParse(unittest.TestCase):
         )
 
     def test_requirements_txt(self):
-        result = parse.requirements_txt(BytesIO(
+        result = list(parse.requirements_txt(BytesIO(
             b'# Comment here\n'
             + b'aiofiles==22.1.0 ; python_version >= "3.8 \\\n'
             + b'    --hash=secure\n'
             + b'\n'
             + b'aiohttp==3.8.3 --hash=secure\n'
             + b'aiosignal==1.2.0\n'
-        ))
+        )))
         self.assertEqual(
             result,
             [
@@ -57,3 +57,160 @@ class TestParse(unittest.TestCase):
                 ('aiosignal', '==1.2.0', None),
             ],
         )
+
+    def test_poetry_lock_blocks(self):
+        result = list(parse.poetry_lock(BytesIO(
+            b'# Comment\n'
+            + b'[[package]]\nname = "aiohttp"\nversion = "3.8.3"\n'
+            + b'files = [\n    {file = "a.whl", hash = "sha256:00"},\n'
+            + b'    {file = "b.whl", hash = "sha256:11"},\n]\n\n'
+            + b'[package.dependencies]\nAio_Signal = ">=1.1.2"\n'
+            + b'attrs = {version = ">=17.3.0", markers = "x"}\n\n'
+            + b'[package.extras]\nspeedups = [\n    "aiodns",\n]\n\n'
+            + b'[[package]]\nname = "attrs"\nversion = "22.1.0"\n\n'
+            + b'[metadata]\nlock-version = "2.0"\n'
+        )))
+        self.assertEqual(
+            result,
+            [
+                ('aiohttp', '==3.8.3', ['aio-signal', 'attrs']),
+                ('attrs', '==22.1.0', []),
+            ],
+        )
+
+        with self.assertRaises(parse.UnknownFormat):
+            list(parse.poetry_lock(BytesIO(b'[metadata]\nfoo = "bar"\n')))
+        with self.assertRaises(parse.UnknownFormat):
+            list(parse.poetry_lock(BytesIO(b'[[package]]\nname = \n')))
+
+    def test_requirements_options(self):
+        result = list(parse.requirements_txt(BytesIO(
+            b'--index-url https://example.org/simple\n'
+            + b'-r other.txt\n'
+            + b'aiohttp==3.8.3\n'
+        )))
+        self.assertEqual(result, [('aiohttp', '==3.8.3', None)])
+
+        with self.assertRaises(parse.UnknownFormat):
+            list(parse.requirements_txt(BytesIO(b'aiohttp>=3.8\n')))
+
+    def test_limits(self):
+        data = b''.join(b'pkg%d==1.0\n' % i for i in range(10))
+        self.assertEqual(
+            len(list(parse.requirements_txt(BytesIO(data), max_entries=10))),
+            10,
+        )
+        with self.assertRaises(parse.LimitExceeded):
+            list(parse.requirements_txt(BytesIO(data), max_entries=9))
+        with self.assertRaises(parse.LimitExceeded):
+            list(parse.requirements_txt(BytesIO(data), max_size=50))
+        with self.assertRaises(parse.LimitExceeded):
+            list(parse.pyproject_toml(BytesIO(data), max_size=50))
+
+    def test_package_json(self):
+        result = list(parse.package_json(BytesIO(
+            b'{"name": "app", "version": "1.0.0",\n'
+            + b' "dependencies": {"react": "^18.2.0",\n'
+            + b'  "@babel/core": "~7.20"},\n'
+            + b' "devDependencies": {"jest": "29.x"}}\n'
+        )))
+        self.assertEqual(
+            result,
+            [
+                ('react', '^18.2.0', None),
+                ('@babel/core', '~7.20', None),
+                ('jest', '29.x', None),
+            ],
+        )
+
+    def test_package_lock_json(self):
+        result = list(parse.package_lock_json(BytesIO(
+            b'{"name": "app", "lockfileVersion": 3, "packages": {\n'
+            + b' "": {"name": "app",\n'
+            + b'  "dependencies": {"loose-envify": "^1"}},\n'
+            + b' "node_modules/@babel/highlight": {"version": "7.18.6"},\n'
+            + b' "node_modules/loose-envify": {"version": "1.4.0",\n'
+            + b'  "dependencies": {"js-tokens": "^3.0.0 || ^4.0.0"}},\n'
+            + b' "node_modules/loose-envify/node_modules/js-tokens":\n'
+            + b'  {"version": "3.0.2"},\n'
+            + b' "node_modules/js-tokens": {"version": "4.0.0"},\n'
+            + b' "node_modules/lib": {"resolved": "packages/lib",\n'
+            + b'  "link": true},\n'
+            + b' "packages/lib": {"version": "0.1.0"}\n'
+            + b'}}\n'
+        )))
+        self.assertEqual(
+            result,
+            [
+                ('@babel/highlight', '7.18.6', []),
+                ('loose-envify', '1.4.0', ['js-tokens']),
+                ('js-tokens', '4.0.0', []),
+            ],
+        )
+
+        # lockfileVersion 1
+        result = list(parse.package_lock_json(BytesIO(
+            b'{"name": "app", "lockfileVersion": 1, "dependencies": {\n'
+            + b' "loose-envify": {"version": "1.4.0",\n'
+            + b'  "requires": {"js-tokens": "^3.0.0 || ^4.0.0"}},\n'
+            + b' "js-tokens": {"version": "4.0.0"}\n'
+            + b'}}\n'
+        )))
+        self.assertEqual(
+            result,
+            [
+                ('loose-envify', '1.4.0', ['js-tokens']),
+                ('js-tokens', '4.0.0', []),
+            ],
+        )
+
+        with self.assertRaises(parse.UnknownFormat):
+            list(parse.package_lock_json(BytesIO(b'{"name": "app"}')))
+        with self.assertRaises(parse.UnknownFormat):
+            list(parse.package_lock_json(BytesIO(b'{"lockfileVersion": ')))
+
+    def test_yarn_lock(self):
+        result = list(parse.yarn_lock(BytesIO(
+            b'# yarn lockfile v1\n\n\n'
+            + b'"@babel/highlight@^7.18.6":\n'
+            + b'  version "7.18.6"\n'
+            + b'  resolved "https://registry.yarnpkg.com/@babel/highlight"\n\n'
+            + b'js-tokens@^4.0.0, "js-tokens@^3.0.0 || ^4.0.0":\n'
+            + b'  version "4.0.0"\n\n'
+            + b'loose-envify@^1.1.0:\n'
+            + b'  version "1.4.0"\n'
+            + b'  dependencies:\n'
+            + b'    js-tokens "^3.0.0 || ^4.0.0"\n'
+        )))
+        self.assertEqual(
+            result,
+            [
+                ('@babel/highlight', '7.18.6', []),
+                ('js-tokens', '4.0.0', []),
+                ('loose-envify', '1.4.0', ['js-tokens']),
+            ],
+        )
+
+        # Yarn 2 and later
+        result = list(parse.yarn_lock(BytesIO(
+            b'__metadata:\n  version: 6\n  cacheKey: 8\n\n'
+            + b'"@babel/highlight@npm:^7.18.6, @babel/highlight@npm:^7.0.0":\n'
+            + b'  version: 7.18.6\n'
+            + b'  dependencies:\n'
+            + b'    js-tokens: ^4.0.0\n'
+            + b'  languageName: node\n\n'
+            + b'"app@workspace:.":\n'
+            + b'  version: 0.0.0-use.local\n\n'
+            + b'"underscore@npm:lodash@^4":\n'
+            + b'  version: 4.17.21\n'
+        )))
+        self.assertEqual(
+            result,
+            [
+                ('@babel/highlight', '7.18.6', ['js-tokens']),
+                ('lodash', '4.17.21', []),
+            ],
+        )
+
+        with self.assertRaises(parse.UnknownFormat):
+            list(parse.yarn_lock(BytesIO(b'{"lockfileVersion": 3}\n')))
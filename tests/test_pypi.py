@@ -0,0 +1,28 @@
+from datetime import datetime
+import unittest
+
+from depreview.registries.base import PackageVersion
+from depreview.registries.python_pypi import PythonPyPI
+
+
+class TestVersions(unittest.TestCase):
+    def test_match_specifier(self):
+        pypi = PythonPyPI()
+        self.assertTrue(pypi.version_match_specifier('1.2.0', '==1.2.0'))
+        self.assertTrue(pypi.version_match_specifier('1.2', '==1.2.0'))
+        self.assertFalse(pypi.version_match_specifier('1.2.1', '==1.2.0'))
+        self.assertTrue(pypi.version_match_specifier('1.2.1', '>=1.2,<2'))
+        self.assertFalse(pypi.version_match_specifier('2.0', '>=1.2,<2'))
+        self.assertTrue(pypi.version_match_specifier('2.0', ''))
+
+    def test_find_version(self):
+        pypi = PythonPyPI()
+        versions = [
+            PackageVersion(num, release_date=datetime(2022, 1, 1), yanked=False)
+            for num in ['2.0', '1.10', '1.2', '1.0']
+        ]
+        self.assertEqual(pypi.find_version(versions, '==1.2').version, '1.2')
+        self.assertEqual(pypi.find_version(versions, '==1.0.0').version, '1.0')
+        self.assertEqual(pypi.find_version(versions, '<2').version, '1.10')
+        self.assertEqual(pypi.find_version(versions, '').version, '2.0')
+        self.assertIsNone(pypi.find_version(versions, '==3.0'))
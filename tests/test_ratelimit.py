@@ -0,0 +1,31 @@
+import asyncio
+import time
+import unittest
+
+from depreview.ratelimit import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        bucket = TokenBucket(50, 2)
+
+        async def test():
+            start = time.monotonic()
+            # 2 go through immediately, then 1 every 20ms
+            await asyncio.gather(*[bucket.acquire() for _ in range(6)])
+            return time.monotonic() - start
+
+        elapsed = asyncio.run(test())
+        self.assertGreaterEqual(elapsed, 0.075)
+        self.assertLess(elapsed, 0.2)
+
+    def test_block(self):
+        bucket = TokenBucket(1000, 10)
+        bucket.block(0.05)
+
+        async def test():
+            start = time.monotonic()
+            await bucket.acquire()
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(test()), 0.045)
@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime, timedelta
+import sqlalchemy
+import unittest
+from unittest import mock
+
+from depreview import database
+from depreview import migrations
+from depreview import refresh
+from depreview.registries.base import PackageNotFound
+
+
+class TestRefreshStalePackages(unittest.TestCase):
+    def setUp(self):
+        engine = database.connect('sqlite://')
+        migrations.upgrade(engine)
+        self.db = database.AsyncEngine(engine, max_workers=1)
+
+        # The oldest packages always fail
+        old = datetime.utcnow() - timedelta(days=2)
+        with engine.begin() as conn:
+            for i, norm_name in enumerate([
+                'deleted', 'broken', 'alpha', 'beta',
+            ]):
+                conn.execute(
+                    database.packages.insert().values(
+                        registry='pypi',
+                        norm_name=norm_name,
+                        orig_name=norm_name,
+                        last_refresh=old + timedelta(hours=i),
+                    )
+                )
+        self.engine = engine
+
+        self.refreshed = []
+
+    async def refresh_packages(self, registry, norm_names):
+        for norm_name in norm_names:
+            self.refreshed.append(norm_name)
+            if norm_name == 'deleted':
+                yield norm_name, PackageNotFound()
+            elif norm_name == 'broken':
+                yield norm_name, ValueError("Invalid response")
+            else:
+                await self.db.execute(
+                    database.packages.update()
+                    .values(last_refresh=datetime.utcnow(), next_refresh=None)
+                    .where(database.packages.c.norm_name == norm_name)
+                )
+                yield norm_name, object()
+
+    def run_refresh(self):
+        self.refreshed = []
+        asyncio.run(
+            refresh.refresh_stale_packages(self.db, self.refresh_packages),
+        )
+        return sorted(self.refreshed)
+
+    @mock.patch.object(refresh, 'BATCH_SIZE', 2)
+    def test_failing(self):
+        with self.assertLogs(refresh.logger, 'WARNING'):
+            self.assertEqual(self.run_refresh(), ['broken', 'deleted'])
+
+        # The failed packages don't get picked again
+        self.assertEqual(self.run_refresh(), ['alpha', 'beta'])
+        self.assertEqual(self.run_refresh(), [])
+
+        # Until the retry delay is over
+        with self.engine.begin() as conn:
+            conn.execute(
+                database.packages.update()
+                .values(next_refresh=datetime.utcnow() - timedelta(seconds=1))
+                .where(database.packages.c.norm_name == 'deleted')
+            )
+        with self.assertLogs(refresh.logger, 'WARNING'):
+            self.assertEqual(self.run_refresh(), ['deleted'])
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                sqlalchemy.select([
+                    database.packages.c.norm_name,
+                    database.packages.c.next_refresh,
+                ])
+                .order_by(database.packages.c.norm_name)
+            ).fetchall()
+        self.assertEqual(
+            [(name, next_refresh is not None) for name, next_refresh in rows],
+            [
+                ('alpha', False),
+                ('beta', False),
+                ('broken', True),
+                ('deleted', True),
+            ],
+        )
@@ -0,0 +1,143 @@
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import asyncio
+from datetime import datetime
+import time
+import unittest
+
+from depreview.registries import get_all_registry_names, get_registry
+from depreview.registries.base import BaseRegistry, Package, \
+    PackageNotFound, PackageNotModified, parse_retry_after
+from depreview.registries.python_pypi import PythonPyPI
+
+
+class FakeRegistry(BaseRegistry):
+    NAME = 'fake'
+    BATCH_CONCURRENCY = 2
+    DELAYS = {'pkg1': 0.08, 'pkg2': 0.02, 'pkg3': 0.08, 'pkg4': 0.01}
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def get_package(self, name, http, *, etag=None, last_modified=None):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.DELAYS[name])
+        finally:
+            self.running -= 1
+        if name == 'pkg3':
+            raise ValueError("broken")
+        if etag == name:
+            raise PackageNotModified
+        return Package(
+            self.NAME, name, {},
+            author=None,
+            description=None,
+            description_type=None,
+            repository=None,
+            last_refresh=datetime(2022, 10, 1),
+        )
+
+
+class TestEntryPoints(unittest.TestCase):
+    def test_get_registry(self):
+        self.assertEqual(get_all_registry_names(), ['npm', 'pypi'])
+        pypi = get_registry('pypi')
+        self.assertIsInstance(pypi, PythonPyPI)
+        self.assertIs(get_registry('pypi'), pypi)
+        self.assertIsNone(get_registry('missing'))
+
+
+class TestGetPackages(unittest.TestCase):
+    def test_get_packages(self):
+        registry = FakeRegistry()
+
+        async def get():
+            return [
+                result
+                async for result in registry.get_packages(
+                    ['pkg1', 'pkg2', 'pkg3', 'pkg4'], None,
+                    validators={'pkg2': ('pkg2', None)},
+                )
+            ]
+
+        results = asyncio.run(get())
+        self.assertEqual(registry.max_running, 2)
+        self.assertEqual(
+            [name for name, package in results],
+            ['pkg2', 'pkg1', 'pkg4', 'pkg3'],
+        )
+        results = dict(results)
+        self.assertEqual(results['pkg1'].orig_name, 'pkg1')
+        self.assertIsInstance(results['pkg2'], PackageNotModified)
+        self.assertIsInstance(results['pkg3'], ValueError)
+        self.assertEqual(results['pkg4'].orig_name, 'pkg4')
+
+
+class TestFetch(unittest.TestCase):
+    def test_fetch(self):
+        requests = []
+
+        async def handler(request):
+            name = request.match_info['name']
+            requests.append(name)
+            if name == 'missing':
+                return web.Response(status=404)
+            elif name == 'throttled' and requests.count(name) <= 2:
+                return web.Response(status=429, headers={'Retry-After': '0'})
+            elif name == 'down':
+                return web.Response(status=503)
+            elif name == 'invalid':
+                return web.Response(status=400)
+            return web.Response(text=name)
+
+        class Registry(BaseRegistry):
+            MAX_RETRIES = 2
+            RETRY_BACKOFF = 0.01
+
+        registry = Registry()
+
+        async def test():
+            app = web.Application()
+            app.router.add_get('/{name}', handler)
+            async with TestServer(app) as server, \
+                    aiohttp.ClientSession() as http:
+                async def fetch(name):
+                    async def read(resp):
+                        return await resp.text()
+
+                    return await registry.fetch(
+                        http, str(server.make_url('/' + name)), read,
+                    )
+
+                self.assertEqual(await fetch('pkg'), 'pkg')
+                self.assertEqual(await fetch('throttled'), 'throttled')
+                self.assertEqual(requests.count('throttled'), 3)
+                with self.assertRaises(PackageNotFound):
+                    await fetch('missing')
+                self.assertEqual(requests.count('missing'), 1)
+                with self.assertRaises(aiohttp.ClientResponseError):
+                    await fetch('down')
+                self.assertEqual(requests.count('down'), 3)
+                with self.assertRaises(aiohttp.ClientResponseError):
+                    await fetch('invalid')
+                self.assertEqual(requests.count('invalid'), 1)
+
+        asyncio.run(test())
+
+    def test_retry_after(self):
+        self.assertEqual(parse_retry_after(None), None)
+        self.assertEqual(parse_retry_after('12'), 12.0)
+        self.assertEqual(parse_retry_after('soon'), None)
+        self.assertEqual(
+            parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'),
+            0.0,
+        )
+        date = time.strftime(
+            '%a, %d %b %Y %H:%M:%S GMT',
+            time.gmtime(time.time() + 60),
+        )
+        self.assertAlmostEqual(parse_retry_after(date), 60, delta=2)
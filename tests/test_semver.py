@@ -0,0 +1,69 @@
+import unittest
+
+from depreview import semver
+
+
+class TestSemver(unittest.TestCase):
+    def test_order(self):
+        versions = [
+            '0.9.0', '1.0.0-alpha', '1.0.0-alpha.1', '1.0.0-alpha.beta',
+            '1.0.0-beta', '1.0.0-beta.2', '1.0.0-beta.11', '1.0.0-rc.1',
+            '1.0.0', '1.2.0', '1.10.0',
+        ]
+        self.assertEqual(
+            sorted(reversed(versions), key=semver.parse_version),
+            versions,
+        )
+        self.assertEqual(
+            semver.parse_version('v1.2.3+build.5'),
+            semver.parse_version('1.2.3'),
+        )
+        with self.assertRaises(semver.InvalidVersion):
+            semver.parse_version('1.2')
+
+    def test_ranges(self):
+        for version, range_, expected in [
+            ('1.2.3', '1.2.3', True),
+            ('1.2.4', '1.2.3', False),
+            ('1.9.0', '^1.2.3', True),
+            ('2.0.0-rc.1', '^1.2.3', False),
+            ('0.2.9', '^0.2.3', True),
+            ('0.3.0', '^0.2.3', False),
+            ('0.0.4', '^0.0.3', False),
+            ('0.0.9', '^0.0.x', True),
+            ('1.2.9', '~1.2.3', True),
+            ('1.3.0', '~1.2.3', False),
+            ('1.9.0', '~1', True),
+            ('1.5.0', '1.x', True),
+            ('2.0.0', '1.x', False),
+            ('1.2.5', '1.2', True),
+            ('3.0.0', '*', True),
+            ('3.0.0', '', True),
+            ('3.0.0-beta', '*', False),
+            ('2.3.4', '1.2.3 - 2.3.4', True),
+            ('2.3.9', '1.2.3 - 2.3', True),
+            ('2.4.0', '1.2.3 - 2.3', False),
+            ('1.2.0', '>1.1', True),
+            ('1.1.9', '>1.1', False),
+            ('1.2.9', '<=1.2', True),
+            ('1.3.0', '<=1.2', False),
+            ('1.5.0', '>= 1.2.0 < 2', True),
+            ('2.5.0', '>=1 <2 || >=3', False),
+            ('3.1.0', '>=1 <2 || >=3', True),
+            ('1.2.3-beta.4', '>=1.2.3-beta.2', True),
+            ('1.2.3-alpha', '>=1.2.3-beta.2', False),
+            ('1.2.4-beta', '>=1.2.3-beta.2', False),
+            ('1.0.0', 'latest', False),
+            ('1.0.0', 'git+https://github.com/a/b.git', False),
+        ]:
+            self.assertEqual(
+                semver.satisfies(version, range_),
+                expected,
+                (version, range_),
+            )
+
+    def test_compile_range(self):
+        self.assertEqual(semver.compile_range('=v1.2.3')[1], '1.2.3')
+        self.assertIsNone(semver.compile_range('^1.2.3')[1])
+        with self.assertRaises(semver.InvalidRange):
+            semver.compile_range('1.2.3 - 2 - 3')
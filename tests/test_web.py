@@ -0,0 +1,905 @@
+import asyncio
+from datetime import datetime, timedelta
+import io
+import json
+import os
+import sqlalchemy
+import unittest
+from unittest import mock
+from werkzeug.datastructures import FileStorage
+
+from depreview import crypto
+from depreview import database
+from depreview import migrations
+from depreview.registries.base import Package, PackageNotFound, \
+    PackageVersion
+from depreview.registries.python_pypi import PythonPyPI
+from depreview import web
+
+
+def make_package(name, versions=(), **kwargs):
+    for key in ('author', 'description', 'description_type', 'repository'):
+        kwargs.setdefault(key, None)
+    kwargs.setdefault('last_refresh', datetime.utcnow())
+    return Package(
+        'pypi', name,
+        {
+            version: PackageVersion(
+                version,
+                release_date=datetime(2020, 1, 1 + i),
+                yanked=False,
+            )
+            for i, version in enumerate(versions)
+        },
+        **kwargs
+    )
+
+
+class FakeRegistry(PythonPyPI):
+    def __init__(self):
+        self.requests = []
+
+    async def get_package(self, name, http, *, etag=None, last_modified=None):
+        self.requests.append(name)
+        await asyncio.sleep(0.01)
+        if name.startswith('missing'):
+            raise PackageNotFound
+        if name.startswith('broken'):
+            raise ValueError("broken")
+        return Package(
+            self.NAME, name, {},
+            author=None,
+            description=None,
+            description_type=None,
+            repository=None,
+            last_refresh=datetime.utcnow(),
+        )
+
+
+class WebTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = database.connect('sqlite://')
+        migrations.upgrade(self.engine)
+        for name, value in [
+            ('db', database.AsyncEngine(self.engine, max_workers=1)),
+            ('_inflight', {}),
+            ('_not_found', {}),
+            ('_background_tasks', set()),
+            ('_fetch_semaphore', None),
+            ('_registry_semaphores', {}),
+            ('get_registry', lambda name: self.registry),
+        ]:
+            patcher = mock.patch.object(web, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(os.environ, {'SECRET_KEY': 'test'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.registry = FakeRegistry()
+
+    async def upload(self, client, requirements):
+        """Upload a requirements.txt file, returns the path of the list.
+        """
+        response = await client.post('/upload-list', files={
+            'requirements-txt': FileStorage(
+                io.BytesIO(requirements),
+                filename='requirements.txt',
+            ),
+        })
+        self.assertEqual(response.status_code, 303)
+        return response.headers['Location']
+
+    def list_id(self, path):
+        return crypto.decode_id(path.rsplit('/', 1)[1])
+
+    def finish_jobs(self):
+        with self.engine.begin() as conn:
+            conn.execute(database.jobs.update().values(status='done'))
+
+
+class TestNotFound(WebTestCase):
+    def test_not_found(self):
+        async def fetch(names):
+            return dict([
+                (name, type(package))
+                async for name, package in web.fetch_packages(
+                    self.registry, names,
+                )
+            ])
+
+        async def test():
+            self.assertEqual(
+                await fetch(['missing1', 'pkg']),
+                {'missing1': PackageNotFound, 'pkg': Package},
+            )
+            with self.assertRaises(PackageNotFound):
+                await web.load_package(self.registry, 'missing2')
+            self.assertEqual(
+                sorted(self.registry.requests),
+                ['missing1', 'missing2', 'pkg'],
+            )
+
+            # Not fetched again
+            self.assertEqual(
+                await fetch(['missing1', 'missing2']),
+                {'missing1': PackageNotFound, 'missing2': PackageNotFound},
+            )
+            with self.assertRaises(PackageNotFound):
+                await web.load_package(self.registry, 'missing1')
+            self.assertEqual(len(self.registry.requests), 3)
+
+        asyncio.run(test())
+
+        # Fetched again once expired
+        web._not_found[('pypi', 'missing1')] -= (
+            web.NOT_FOUND_TTL + timedelta(seconds=1)
+        )
+
+        async def test_expired():
+            with self.assertRaises(PackageNotFound):
+                await web.load_package(self.registry, 'missing1')
+            self.assertEqual(len(self.registry.requests), 4)
+
+        asyncio.run(test_expired())
+
+
+class TestStoreRefresh(WebTestCase):
+    def make_package(self, **kwargs):
+        return Package(
+            'pypi', 'pkg', {},
+            author=None,
+            description=None,
+            description_type=None,
+            repository=None,
+            last_refresh=datetime.utcnow() - timedelta(days=1),
+            **kwargs
+        )
+
+    def test_same_serial(self):
+        async def test():
+            await web.db.transaction(
+                web._insert_package, self.registry, 'pkg',
+                self.make_package(etag='"old"', serial=5),
+            )
+            old_package = await web.get_package_from_db(self.registry, 'pkg')
+
+            # Same serial, but the response has new validators
+            package = await web._store_refresh(
+                self.registry, 'pkg', old_package,
+                self.make_package(
+                    etag='"new"', last_modified='Mon, 02 Jan 2023', serial=5,
+                ),
+            )
+            self.assertIs(package, old_package)
+
+            package = await web.get_package_from_db(self.registry, 'pkg')
+            self.assertEqual(package.etag, '"new"')
+            self.assertEqual(package.last_modified, 'Mon, 02 Jan 2023')
+            self.assertEqual(package.serial, 5)
+            self.assertGreater(
+                package.last_refresh,
+                datetime.utcnow() - timedelta(minutes=1),
+            )
+
+        asyncio.run(test())
+
+
+    def get_versions(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sqlalchemy.select([
+                    database.package_versions.c.version,
+                    database.package_versions.c.rank,
+                    database.package_versions.c.status,
+                ])
+                .order_by(database.package_versions.c.rank)
+            ).fetchall()
+
+    def test_annotations(self):
+        async def test():
+            await web.db.transaction(
+                web._insert_package, self.registry, 'pkg',
+                make_package('pkg', ['1.0', '2.0']),
+            )
+            self.assertEqual(
+                self.get_versions(),
+                [('2.0', 0, 'ok'), ('1.0', 1, 'very-outdated')],
+            )
+
+            # A new version changes the rank and status of the others
+            old_package = await web.get_package_from_db(self.registry, 'pkg')
+            new_package = make_package('pkg', ['1.0', '2.0'])
+            new_package.versions['2.1'] = PackageVersion(
+                '2.1',
+                release_date=datetime.utcnow() - timedelta(days=1),
+                yanked=False,
+            )
+            await web._store_refresh(
+                self.registry, 'pkg', old_package, new_package,
+            )
+            self.assertEqual(
+                self.get_versions(),
+                [
+                    ('2.1', 0, 'ok'),
+                    ('2.0', 1, 'ok'),
+                    ('1.0', 2, 'very-outdated'),
+                ],
+            )
+            with self.engine.connect() as conn:
+                expires = conn.execute(
+                    sqlalchemy.select([database.packages.c.annotations_expire])
+                ).scalar()
+            self.assertIsNotNone(expires)
+
+        asyncio.run(test())
+
+
+class TestDescriptionCache(WebTestCase):
+    def setUp(self):
+        super(TestDescriptionCache, self).setUp()
+        patcher = mock.patch.object(
+            web, 'render_description', wraps=web.render_description,
+        )
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def insert(self, **kwargs):
+        package = make_package('pkg', ['1.0'], **kwargs)
+        await web.db.transaction(
+            web._insert_package, self.registry, 'pkg', package,
+        )
+        return await web.get_package_from_db(self.registry, 'pkg')
+
+    async def refresh(self, old_package, versions, **kwargs):
+        await web._store_refresh(
+            self.registry, 'pkg', old_package,
+            make_package('pkg', versions, **kwargs),
+        )
+        return await web.get_package_from_db(self.registry, 'pkg')
+
+    async def get_html(self, package):
+        return await web.get_rendered_description(
+            self.registry, 'pkg', package,
+        )
+
+    def get_cached(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sqlalchemy.select([database.packages.c.description_html])
+            ).scalar()
+
+    def test_hit(self):
+        async def test():
+            package = await self.insert(
+                description='*Hello*', description_type='text/markdown',
+            )
+            self.assertEqual(
+                await self.get_html(package),
+                '<p><em>Hello</em></p>',
+            )
+            self.assertEqual(self.render.call_count, 1)
+            self.assertEqual(self.get_cached(), '<p><em>Hello</em></p>')
+
+            # Cached
+            self.assertEqual(
+                await self.get_html(package),
+                '<p><em>Hello</em></p>',
+            )
+            self.assertEqual(self.render.call_count, 1)
+
+        asyncio.run(test())
+
+    def test_changed(self):
+        async def test():
+            package = await self.insert(
+                description='*Hello*', description_type='text/markdown',
+            )
+            await self.get_html(package)
+
+            # Description changed
+            package = await self.refresh(
+                package, ['1.0'],
+                description='*Bye*', description_type='text/markdown',
+            )
+            self.assertIsNone(self.get_cached())
+            self.assertEqual(
+                await self.get_html(package),
+                '<p><em>Bye</em></p>',
+            )
+            self.assertEqual(self.render.call_count, 2)
+
+            # Type changed
+            package = await self.refresh(
+                package, ['1.0'],
+                description='*Bye*', description_type='text/plain',
+            )
+            self.assertIsNone(self.get_cached())
+            self.assertEqual(await self.get_html(package), '<pre>*Bye*</pre>')
+            self.assertEqual(self.render.call_count, 3)
+
+        asyncio.run(test())
+
+    def test_unchanged(self):
+        async def test():
+            package = await self.insert(
+                description='*Hello*', description_type='text/markdown',
+            )
+            await self.get_html(package)
+
+            # New version, same description
+            package = await self.refresh(
+                package, ['1.0', '2.0'],
+                description='*Hello*', description_type='text/markdown',
+            )
+            self.assertEqual(sorted(package.versions), ['1.0', '2.0'])
+            self.assertEqual(self.get_cached(), '<p><em>Hello</em></p>')
+            self.assertEqual(
+                await self.get_html(package),
+                '<p><em>Hello</em></p>',
+            )
+            self.assertEqual(self.render.call_count, 1)
+
+        asyncio.run(test())
+
+
+class TestGetListVersions(WebTestCase):
+    def test_inserted_meanwhile(self):
+        async def test():
+            client = web.app.test_client()
+            list_id = self.list_id(
+                await self.upload(client, b'pkg==1.0\nnew==1.0\n'),
+            )
+            await web.db.transaction(
+                web._insert_package, self.registry, 'pkg',
+                make_package('pkg', ['1.0', '2.0']),
+            )
+
+            registry, list_format, deps = await web.get_list(list_id)
+            self.assertIsNone(deps['new'][0])
+
+            # Another request inserts the package
+            await web.db.transaction(
+                web._insert_package, self.registry, 'new',
+                make_package('new', ['1.0']),
+            )
+
+            annotations = await web.get_list_versions(
+                list_id, self.registry, deps,
+            )
+            self.assertEqual(sorted(annotations), ['pkg'])
+            self.assertEqual(sorted(deps['pkg'][0].versions), ['1.0', '2.0'])
+            self.assertIsNone(deps['new'][0])
+
+        asyncio.run(test())
+
+
+class TestScheduleRefresh(WebTestCase):
+    def test_failing(self):
+        async def view(name):
+            package = await web.get_package(self.registry, name)
+            await asyncio.gather(*web._background_tasks)
+            return package
+
+        async def test():
+            for name in ('missing-old', 'broken-old'):
+                await web.db.transaction(
+                    web._insert_package, self.registry, name,
+                    make_package(
+                        name, ['1.0'],
+                        last_refresh=datetime.utcnow() - timedelta(days=1),
+                    ),
+                )
+
+            with self.assertLogs(web.logger, 'WARNING') as logs:
+                await view('missing-old')
+                await view('broken-old')
+            self.assertEqual(len(logs.records), 2)
+            self.assertEqual(
+                self.registry.requests,
+                ['missing-old', 'broken-old'],
+            )
+
+            # Still served, but not fetched again on every view
+            for name in ('missing-old', 'broken-old'):
+                package = await view(name)
+                self.assertEqual(package.orig_name, name)
+                self.assertGreater(package.next_refresh, datetime.utcnow())
+            self.assertEqual(len(self.registry.requests), 2)
+
+            # Until the retry delay is over
+            with self.engine.begin() as conn:
+                conn.execute(
+                    database.packages.update()
+                    .values(
+                        next_refresh=datetime.utcnow() - timedelta(seconds=1),
+                    )
+                )
+            with self.assertLogs(web.logger, 'WARNING'):
+                await view('missing-old')
+            self.assertEqual(len(self.registry.requests), 3)
+
+        asyncio.run(test())
+
+
+class TestViewList(WebTestCase):
+    def test_unavailable(self):
+        async def test():
+            client = web.app.test_client()
+            path = await self.upload(
+                client,
+                b'pkg==1.0\nbroken==1.0\nmissing==1.0\n',
+            )
+            self.finish_jobs()
+
+            with self.assertLogs(web.logger, 'WARNING'):
+                response = await client.get(path)
+            self.assertEqual(response.status_code, 200)
+            html = await response.get_data(as_text=True)
+            self.assertEqual(html.count('not found in the registry'), 1)
+            self.assertEqual(
+                html.count('could not be fetched from the registry'),
+                1,
+            )
+
+        asyncio.run(test())
+
+
+class TestApiList(WebTestCase):
+    def insert_tree(self):
+        """Insert a list a -> b -> c, a -> d, returns its encoded ID.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(
+                database.dependency_lists.insert().values(
+                    id=1,
+                    created=datetime.utcnow(),
+                    registry='pypi',
+                    format='poetry',
+                    content_hash='hash',
+                )
+            )
+            for norm_name, direct, depends_on in [
+                ('a', True, 'b#d'),
+                ('b', False, 'c'),
+                ('c', False, None),
+                ('d', False, None),
+            ]:
+                conn.execute(
+                    database.dependency_list_items.insert().values(
+                        list_id=1,
+                        norm_name=norm_name,
+                        version='==1.0',
+                        direct=direct,
+                        depends_on=depends_on,
+                    )
+                )
+        return crypto.encode_id(1)
+
+    def test_tree(self):
+        async def test():
+            client = web.app.test_client()
+            list_id = self.insert_tree()
+
+            # Only the top level is returned
+            response = await client.get('/api/list/%s' % list_id)
+            self.assertEqual(response.status_code, 200)
+            data = await response.get_json()
+            self.assertTrue(data['tree'])
+            self.assertEqual(data['size'], 4)
+            self.assertEqual(
+                [
+                    (dep['name'], dep.get('dependencies'))
+                    for dep in data['dependencies']
+                ],
+                [('a', ['b', 'd'])],
+            )
+            self.assertEqual(self.registry.requests, [])
+
+            # Children are obtained one level at a time from the node URLs
+            names = []
+            url = data['dependencies'][0]['url']
+            while url is not None:
+                response = await client.get(url)
+                self.assertEqual(response.status_code, 200)
+                data = await response.get_json()
+                names.append(data['name'])
+                children = data['dependencies']
+                url = children[0]['url'] if children else None
+            self.assertEqual(names, ['a', 'b', 'c'])
+            self.assertEqual(data['package'], 'c')
+            self.assertEqual(self.registry.requests, ['a', 'b', 'c'])
+
+        asyncio.run(test())
+
+    def test_not_loaded(self):
+        async def test():
+            client = web.app.test_client()
+            path = await self.upload(client, b'pkg==1.0\nother==2.0\n')
+
+            # The job didn't run, packages are not in the database
+            response = await client.get('/api' + path)
+            self.assertEqual(response.status_code, 200)
+            data = await response.get_json()
+            self.assertEqual(data['job']['status'], 'queued')
+            self.assertFalse(data['tree'])
+            self.assertEqual(
+                [
+                    (dep['name'], dep['package'], dep['required_version'])
+                    for dep in data['dependencies']
+                ],
+                [('other', None, '==2.0'), ('pkg', None, '==1.0')],
+            )
+            self.assertEqual(self.registry.requests, [])
+
+        asyncio.run(test())
+
+    def test_not_found(self):
+        async def test():
+            client = web.app.test_client()
+            list_id = self.insert_tree()
+
+            response = await client.get('/api/list/%s/deps/e' % list_id)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(
+                await response.get_json(),
+                {'error': 'Dependency not found'},
+            )
+
+            for url in [
+                '/api/list/invalid',
+                '/api/list/invalid/deps/a',
+                '/api/list/%s' % crypto.encode_id(2),
+            ]:
+                response = await client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(
+                    await response.get_json(),
+                    {'error': 'List not found'},
+                )
+            self.assertEqual(self.registry.requests, [])
+
+        asyncio.run(test())
+
+
+class TestApiListAnnotations(WebTestCase):
+    def test_unavailable(self):
+        async def test():
+            client = web.app.test_client()
+            path = await self.upload(
+                client,
+                b'pkg==1.0\nbroken==1.0\nmissing==1.0\n',
+            )
+            self.finish_jobs()
+
+            with self.assertLogs(web.logger, 'WARNING'):
+                response = await client.get(
+                    '/api' + path + '/annotations',
+                )
+            self.assertEqual(response.status_code, 200)
+            data = await response.get_data(as_text=True)
+            lines = [json.loads(line) for line in data.splitlines()]
+            self.assertEqual(
+                sorted((line['name'], line['status']) for line in lines),
+                [
+                    ('broken', 'unavailable'),
+                    ('missing', 'not-found'),
+                    ('pkg', None),
+                ],
+            )
+
+        asyncio.run(test())
+
+
+class TestSingleFlight(WebTestCase):
+    def test_shared(self):
+        calls = []
+
+        async def func(arg):
+            calls.append(arg)
+            await asyncio.sleep(0.01)
+            return arg * 2
+
+        async def test():
+            results = await asyncio.gather(*[
+                web.single_flight('key', func, 21)
+                for _ in range(5)
+            ])
+            self.assertEqual(results, [42] * 5)
+            self.assertEqual(calls, [21])
+            self.assertEqual(web._inflight, {})
+
+            # Not shared once done
+            self.assertEqual(await web.single_flight('key', func, 1), 2)
+            self.assertEqual(calls, [21, 1])
+
+        asyncio.run(test())
+
+    def test_cancelled_waiter(self):
+        done = []
+
+        async def func():
+            await asyncio.sleep(0.02)
+            done.append(True)
+            return 'result'
+
+        async def test():
+            first = asyncio.ensure_future(web.single_flight('key', func))
+            second = asyncio.ensure_future(web.single_flight('key', func))
+            await asyncio.sleep(0.005)
+            first.cancel()
+            self.assertEqual(await second, 'result')
+            self.assertTrue(first.cancelled())
+            self.assertEqual(done, [True])
+
+        asyncio.run(test())
+
+    def test_exception(self):
+        calls = []
+
+        async def func():
+            calls.append(True)
+            await asyncio.sleep(0.01)
+            raise ValueError("broken")
+
+        async def test():
+            results = await asyncio.gather(
+                *[web.single_flight('key', func) for _ in range(3)],
+                return_exceptions=True,
+            )
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(len(results), 3)
+            for result in results:
+                self.assertIsInstance(result, ValueError)
+            self.assertEqual(web._inflight, {})
+
+        asyncio.run(test())
+
+
+class TestFetchPackages(WebTestCase):
+    async def fetch(self, names):
+        return {
+            name: package
+            async for name, package in web.fetch_packages(
+                self.registry, names,
+            )
+        }
+
+    def test_shared(self):
+        async def test():
+            results = await asyncio.gather(
+                self.fetch(['pkg1', 'pkg2']),
+                self.fetch(['pkg2', 'pkg3']),
+                web.load_package(self.registry, 'pkg3'),
+            )
+            self.assertEqual(sorted(results[0]), ['pkg1', 'pkg2'])
+            self.assertEqual(sorted(results[1]), ['pkg2', 'pkg3'])
+            # Each caller got the same object
+            self.assertIs(results[0]['pkg2'], results[1]['pkg2'])
+            self.assertIs(results[1]['pkg3'], results[2])
+            self.assertEqual(
+                sorted(self.registry.requests),
+                ['pkg1', 'pkg2', 'pkg3'],
+            )
+
+        asyncio.run(test())
+
+    def test_cancelled_waiter(self):
+        async def test():
+            first = asyncio.ensure_future(self.fetch(['pkg1', 'pkg2']))
+            second = asyncio.ensure_future(self.fetch(['pkg1']))
+            await asyncio.sleep(0)
+            first.cancel()
+            result = await second
+            self.assertEqual(result['pkg1'].orig_name, 'pkg1')
+            self.assertTrue(first.cancelled())
+
+            # The fetch started by the cancelled caller still completes
+            await asyncio.gather(*web._background_tasks)
+            self.assertEqual(
+                (await web.get_package_from_db(self.registry, 'pkg2'))
+                .orig_name,
+                'pkg2',
+            )
+            self.assertEqual(sorted(self.registry.requests), ['pkg1', 'pkg2'])
+
+        asyncio.run(test())
+
+    def test_exception(self):
+        async def test():
+            results = await asyncio.gather(
+                self.fetch(['broken1', 'pkg1']),
+                self.fetch(['broken1']),
+                web.load_package(self.registry, 'broken1'),
+                return_exceptions=True,
+            )
+            self.assertIsInstance(results[0]['broken1'], ValueError)
+            self.assertIsInstance(results[1]['broken1'], ValueError)
+            self.assertIsInstance(results[2], ValueError)
+            self.assertEqual(self.registry.requests.count('broken1'), 1)
+
+        asyncio.run(test())
+
+
+    def test_batch_exception(self):
+        async def get_packages(names, http, **kwargs):
+            await asyncio.sleep(0.01)
+            yield 'pkg1', await self.registry.get_package('pkg1', http)
+            raise ValueError("connection lost")
+
+        async def test():
+            self.registry.get_packages = get_packages
+            results = await asyncio.gather(
+                self.fetch(['pkg1', 'pkg2', 'pkg3']),
+                self.fetch(['pkg2']),
+            )
+            self.assertEqual(results[0]['pkg1'].orig_name, 'pkg1')
+            for result in (results[0]['pkg2'], results[0]['pkg3'],
+                           results[1]['pkg2']):
+                self.assertIsInstance(result, ValueError)
+
+        asyncio.run(test())
+
+
+class TestBuildTree(unittest.TestCase):
+    @staticmethod
+    def make_deps(graph):
+        # Only the names and the structure matter here
+        return {
+            name: (None, None, '==1.0', None, depends_on)
+            for name, depends_on in graph.items()
+        }
+
+    @classmethod
+    def simplify(cls, tree):
+        return [
+            (name, kind, cls.simplify(children))
+            for name, _, _, _, children, kind in tree
+        ]
+
+    def test_shared(self):
+        deps = self.make_deps({
+            'a': ['b', 'c'],
+            'b': ['d'],
+            'c': ['d', 'e'],
+            'd': ['e'],
+            'e': [],
+            'other': ['unknown'],
+        })
+        self.assertEqual(
+            self.simplify(web.build_tree(deps, ['a', 'other'])),
+            [
+                ('a', 'node', [
+                    ('b', 'node', [
+                        ('d', 'node', [('e', 'node', [])]),
+                    ]),
+                    ('c', 'node', [
+                        # Already expanded under b
+                        ('d', 'ref', []),
+                        # Leaves are repeated
+                        ('e', 'node', []),
+                    ]),
+                ]),
+                # Dependencies missing from the list are ignored
+                ('other', 'node', []),
+            ],
+        )
+
+    def test_cycle(self):
+        deps = self.make_deps({
+            'a': ['b'],
+            'b': ['c'],
+            'c': ['a', 'c'],
+        })
+        self.assertEqual(
+            self.simplify(web.build_tree(deps, ['a'])),
+            [
+                ('a', 'node', [
+                    ('b', 'node', [
+                        ('c', 'node', [
+                            ('a', 'ref', []),
+                            ('c', 'ref', []),
+                        ]),
+                    ]),
+                ]),
+            ],
+        )
+
+    def test_max_depth(self):
+        deps = self.make_deps({
+            'a': ['b', 'e'],
+            'b': ['c'],
+            'c': ['d'],
+            'd': [],
+            'e': [],
+        })
+        self.assertEqual(
+            self.simplify(web.build_tree(deps, ['a'], max_depth=2)),
+            [
+                ('a', 'node', [
+                    ('b', 'node', [
+                        ('c', 'truncated', []),
+                    ]),
+                    ('e', 'node', []),
+                ]),
+            ],
+        )
+        self.assertEqual(
+            self.simplify(web.build_tree(deps, ['a'], max_depth=0)),
+            [('a', 'truncated', [])],
+        )
+
+
+class TestListContentHash(unittest.TestCase):
+    def hash_requirements(self, requirements):
+        registry_obj = PythonPyPI()
+        items = web.read_list_files(
+            registry_obj, 'requirements.txt',
+            {'requirements-txt': FileStorage(io.BytesIO(requirements))},
+        )
+        return web.list_content_hash('pypi', 'requirements.txt', items)
+
+    def test_hash(self):
+        content_hash = self.hash_requirements(b'a==1.0\nB==2.0\n')
+        for requirements in [
+            # Reordered
+            b'b==2.0\na==1.0\n',
+            # Duplicates
+            b'a==1.0\nb==2.0\na==1.0\nb==2.0\n',
+            # Names normalized
+            b'A==1.0\nb==2.0\n',
+        ]:
+            self.assertEqual(
+                self.hash_requirements(requirements),
+                content_hash,
+            )
+
+        self.assertNotEqual(
+            self.hash_requirements(b'a==1.0\nb==2.1\n'),
+            content_hash,
+        )
+        self.assertNotEqual(
+            self.hash_requirements(b'a==1.0\n'),
+            content_hash,
+        )
+
+    def test_format(self):
+        items = [dict(
+            norm_name='a', version='1.0', direct=None, depends_on=None,
+        )]
+        self.assertNotEqual(
+            web.list_content_hash('pypi', 'requirements.txt', items),
+            web.list_content_hash('pypi', 'poetry', items),
+        )
+
+
+class TestUploadList(WebTestCase):
+    def count(self, table):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sqlalchemy.select([sqlalchemy.func.count()])
+                .select_from(table)
+            ).scalar()
+
+    def test_same_content(self):
+        async def test():
+            client = web.app.test_client()
+            path = await self.upload(client, b'a==1.0\nb==2.0\n')
+            self.assertEqual(
+                await self.upload(client, b'b==2.0\na==1.0\na==1.0\n'),
+                path,
+            )
+
+            # At the same time
+            paths = await asyncio.gather(*[
+                self.upload(client, b'c==1.0\n')
+                for _ in range(3)
+            ])
+            self.assertEqual(len(set(paths)), 1)
+            self.assertNotEqual(paths[0], path)
+
+        asyncio.run(test())
+
+        self.assertEqual(self.count(database.dependency_lists), 2)
+        self.assertEqual(self.count(database.dependency_list_items), 3)
+        self.assertEqual(self.count(database.jobs), 2)